@@ -0,0 +1,248 @@
+import json
+from collections import defaultdict
+from datetime import datetime
+
+from flask import Blueprint, Response, abort, current_app, request
+from sqlalchemy import select
+from werkzeug.exceptions import HTTPException
+
+from models import db, Venue, Venue_Genre, Artist, Artist_Genre, Show
+from pagination import keyset_page, page_args
+import counters
+import queries
+
+#----------------------------------------------------------------------------#
+# JSON API, version 1.
+#
+#   fields=id,name      only return these fields
+#   embed=genres,...    attach related rows, loaded with one joined query
+#                       per relation for the whole page
+#   after=/before=      opaque cursors, as on the HTML listings
+#   limit=              page size, up to API_MAX_PAGE_SIZE
+#
+# /shows also takes from=, to=, city= and genre= (and venue_id=/artist_id=),
+# as on the HTML listing; /venues and /artists take genre=, repeated to
+# require several.
+#----------------------------------------------------------------------------#
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+
+class Resource:
+    # `fields` maps public field names to columns. A field mapped to None is
+    # taken from the base statement's own select list, so joined and
+    # aggregated columns stay tied to the query that produces them.
+    def __init__(self, model, fields, default_fields, order, base, embeds, genre_model=None,
+                 filters=None):
+        self.model = model
+        self.fields = fields
+        self.default_fields = default_fields
+        self.order = order
+        self.base = base
+        self.embeds = embeds
+        self.genre_model = genre_model
+        # Narrows the listing statement by query string arguments.
+        self.filters = filters
+
+
+def _columns(model, names):
+    return {name: getattr(model, name) for name in names}
+
+
+def _show_filters(stmt, args):
+    try:
+        return queries.filter_shows(stmt, queries.parse_show_filters(args))
+    except ValueError as e:
+        abort(400, str(e))
+
+
+def _genre_filter(model, genre_model):
+    # genre= (repeatable): only those with every genre given.
+    def apply(stmt, args):
+        return queries.with_genres(stmt, model, genre_model, args.getlist('genre'))
+    return apply
+
+
+_show_fields = [column.key for column in queries.show_listing().selected_columns]
+
+VENUES = Resource(
+    Venue,
+    fields={
+        **_columns(Venue, ['id', 'name', 'address', 'city', 'state', 'phone', 'website',
+                           'facebook_link', 'seeking_talent', 'seeking_description', 'image_link']),
+        'num_upcoming_shows': Venue.upcoming_shows_count,
+        'num_past_shows': Venue.past_shows_count,
+    },
+    default_fields=['id', 'name', 'city', 'state'],
+    order=queries.VENUE_LISTING_ORDER,
+    base=lambda names: select(Venue.id),
+    embeds={'genres', 'upcoming_shows', 'past_shows'},
+    genre_model=Venue_Genre,
+    filters=_genre_filter(Venue, Venue_Genre),
+)
+
+ARTISTS = Resource(
+    Artist,
+    fields={
+        **_columns(Artist, ['id', 'name', 'city', 'state', 'phone', 'website', 'facebook_link',
+                            'seeking_venue', 'seeking_description', 'image_link']),
+        'num_upcoming_shows': Artist.upcoming_shows_count,
+        'num_past_shows': Artist.past_shows_count,
+    },
+    default_fields=['id', 'name'],
+    order=queries.ARTIST_LISTING_ORDER,
+    base=lambda names: select(Artist.id),
+    embeds={'genres', 'upcoming_shows', 'past_shows'},
+    genre_model=Artist_Genre,
+    filters=_genre_filter(Artist, Artist_Genre),
+)
+
+SHOWS = Resource(
+    Show,
+    fields=dict.fromkeys(_show_fields),
+    default_fields=_show_fields,
+    order=queries.SHOW_LISTING_ORDER,
+    base=lambda names: queries.show_listing(),
+    embeds=set(),
+    filters=_show_filters,
+)
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def _json(payload, status=200):
+    body = json.dumps(payload, default=_default, separators=(',', ':'))
+    return Response(body, status=status, mimetype='application/json')
+
+
+def _list_arg(name, available, default):
+    requested = request.args.get(name)
+    if requested is None:
+        return list(default)
+    names = list(dict.fromkeys(n.strip() for n in requested.split(',') if n.strip()))
+    unknown = [n for n in names if n not in available]
+    if unknown:
+        abort(400, f'Unknown {name}: {", ".join(unknown)}')
+    return names
+
+
+def statement(resource, names):
+    # The requested fields come first, labelled with their public names, so
+    # a row zips straight into a dict. The id and sort key ride along at the
+    # end for cursors and embedding but are not returned unless asked for.
+    base = resource.base(names)
+    columns = []
+    for name in names:
+        column = resource.fields[name]
+        if column is None:
+            column = base.selected_columns[name]
+        columns.append(column.label(name))
+    extra = [c for c in (resource.model.id,) + tuple(resource.order) if c.key not in names]
+    return base.with_only_columns(*columns, *dict.fromkeys(extra))
+
+
+def _embed(resource, items, ids, embeds, now):
+    if not items or not embeds:
+        return
+    owner_key = resource.genre_model.owner_key
+
+    if 'genres' in embeds:
+        genres = defaultdict(list)
+        for owner_id, genre in db.session.execute(queries.owners_genres(resource.genre_model, ids)):
+            genres[owner_id].append(genre)
+        for item, item_id in zip(items, ids):
+            item['genres'] = genres[item_id]
+
+    batched = queries.venues_shows if resource is VENUES else queries.artists_shows
+    for embed, upcoming in (('upcoming_shows', True), ('past_shows', False)):
+        if embed not in embeds:
+            continue
+        shows = defaultdict(list)
+        for show in db.session.execute(batched(ids, upcoming, now)):
+            show = show._asdict()
+            shows[show.pop(owner_key)].append(show)
+        for item, item_id in zip(items, ids):
+            item[embed] = shows[item_id]
+
+
+def _listing(resource):
+    names = _list_arg('fields', resource.fields, resource.default_fields)
+    embeds = _list_arg('embed', resource.embeds, [])
+    after, before, limit = page_args(resource.order, current_app.config['API_MAX_PAGE_SIZE'])
+    stmt = statement(resource, names)
+    if resource.filters is not None:
+        stmt = resource.filters(stmt, request.args)
+    now = counters.current()
+    try:
+        page = keyset_page(stmt, resource.order, after, before, limit)
+        items = [dict(zip(names, row)) for row in page.items]
+        ids = [row.id for row in page.items]
+        _embed(resource, items, ids, embeds, now)
+    finally:
+        db.session.close()
+
+    return _json({
+        "data": items,
+        "next_cursor": page.next_cursor,
+        "prev_cursor": page.prev_cursor,
+    })
+
+
+def _detail(resource, item_id):
+    names = _list_arg('fields', resource.fields, resource.fields)
+    embeds = _list_arg('embed', resource.embeds, [])
+    now = counters.current()
+    try:
+        row = db.session.execute(
+            statement(resource, names).where(resource.model.id == item_id)).first()
+        if row is None:
+            abort(404)
+        item = dict(zip(names, row))
+        _embed(resource, [item], [row.id], embeds, now)
+    finally:
+        db.session.close()
+
+    return _json({"data": item})
+
+
+@api.route('/venues')
+def venues():
+    return _listing(VENUES)
+
+
+@api.route('/venues/<int:venue_id>')
+def venue(venue_id):
+    return _detail(VENUES, venue_id)
+
+
+@api.route('/artists')
+def artists():
+    return _listing(ARTISTS)
+
+
+@api.route('/artists/<int:artist_id>')
+def artist(artist_id):
+    return _detail(ARTISTS, artist_id)
+
+
+@api.route('/shows')
+def shows():
+    return _listing(SHOWS)
+
+
+@api.route('/shows/<int:show_id>')
+def show(show_id):
+    return _detail(SHOWS, show_id)
+
+
+# The app-wide 404 and 500 handlers render HTML and would otherwise win over
+# a handler registered by exception class.
+@api.errorhandler(HTTPException)
+@api.errorhandler(404)
+@api.errorhandler(500)
+def http_error(error):
+    return _json({"error": error.name, "message": error.description}, error.code)
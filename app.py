@@ -2,26 +2,43 @@
 # Imports
 #----------------------------------------------------------------------------#
 
-from dataclasses import field
-from datetime import datetime
-import json
+from itertools import groupby
 import os
-import sys
-from urllib import response
 import dateutil.parser
-import babel
-from flask import Flask, jsonify, render_template, request, Response, flash, redirect, url_for, abort
-from sqlalchemy import distinct, null
+from flask import Flask, jsonify, render_template, request, Response, flash, redirect, url_for
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
 from flask_migrate import Migrate
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 import logging
 from logging import Formatter, FileHandler
-from flask_wtf import Form
 from forms import *
 
 # Import models
-from models import Venue, Venue_Genre, Artist, Artist_Genre, Show
+from models import (db, Venue, Venue_Genre, Artist, Artist_Genre, Show, add_genres, update_genres,
+                    touch_partners, utcnow)
+from api import api
+import assets
+import compression
+import conditional
+import exporter
+import facets
+import cache
+import counters
+import dates
+from cache import page_cache
+import importer
+import indexes
+import instrumentation
+import metrics
+import pages
+import pool
+import queries
+import replicas
+import search
+import seeder
+import thumbnails
+from pagination import capped_count, keyset_page, keyset_query, page_args, Page
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -29,9 +46,27 @@ from models import Venue, Venue_Genre, Artist, Artist_Genre, Show
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-db = SQLAlchemy(app)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = pool.engine_options(app.config)
+db.init_app(app)
+compression.init_app(app)
+pool.init_app(app)
+replicas.init_app(app)
+instrumentation.init_app(app)
+metrics.init_app(app)
+page_cache.init_app(app)
+conditional.init_app(app)
+facets.init_app(app)
 
 migrate = Migrate(app, db)
+app.register_blueprint(api)
+app.register_blueprint(exporter.export)
+app.cli.add_command(search.search_cli)
+app.cli.add_command(indexes.indexes_cli)
+app.cli.add_command(importer.import_command)
+app.cli.add_command(exporter.export_command)
+app.cli.add_command(seeder.seed_command)
+app.cli.add_command(counters.counters_cli)
+app.cli.add_command(assets.assets_cli)
 
 
 
@@ -39,23 +74,18 @@ migrate = Migrate(app, db)
 # Filters.
 #----------------------------------------------------------------------------#
 
-
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format, locale='en')
-
-
-app.jinja_env.filters['datetime'] = format_datetime
+dates.init_app(app)
+assets.init_app(app)
+thumbnails.init_app(app)
 
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
 
+GENRE_NAMES = [value for value, _ in GENRE_CHOICES]
+
+
 @app.route('/')
 def index():
     return render_template('pages/home.html')
@@ -66,120 +96,104 @@ def index():
 
 @app.route('/venues')
 def venues():
+    after, before, limit = page_args(queries.VENUE_LISTING_ORDER)
+    # ?genre=Jazz&genre=Blues: venues with both.
+    genres = request.args.getlist('genre')
+    counters.current()
+    version = conditional.page_version(keyset_query(
+        queries.with_genres(queries.venue_listing_version(), Venue, Venue_Genre, genres),
+        queries.VENUE_LISTING_ORDER, after, before, limit))
+    response = conditional.not_modified(version)
+    if response is not None:
+        return response
+    data = []
+    page = Page([])
     try:
-        data = []
-        locations = db.session.query(distinct(Venue.city), Venue.state).all()
+        page = keyset_page(queries.with_genres(queries.venue_listing(), Venue, Venue_Genre, genres),
+                           queries.VENUE_LISTING_ORDER, after, before, limit)
 
-        for location in locations:
-            city = location[0]
-            state = location[1]
+        # Rows arrive ordered by (state, city, id), so each location is one
+        # contiguous run and can be grouped in a single pass.
+        for (state, city), venues in groupby(page.items, key=lambda v: (v.state, v.city)):
             venue_per_location = {"city": city, "state": state, "venues": []}
-            venues = Venue.query.filter_by(city=city, state=state).all()
 
             for venue in venues:
-                venue_id = venue.id
-                venue_name = venue.name
-
-                venue_details = {"id": venue_id, "name": venue_name}
-
+                venue_details = {
+                    "id": venue.id,
+                    "name": venue.name,
+                    "num_upcoming_shows": venue.num_upcoming_shows,
+                }
                 venue_per_location["venues"].append(venue_details)
 
-            print(venue_per_location)
-
             data.append(venue_per_location)
     except:
         db.session.rollback()
-        print(sys.exc_info())
+        app.logger.exception('%s failed', request.endpoint)
         flash('An error occurred. Venues could not be listed.')
     finally:
         db.session.close()
 
-    return render_template('pages/venues.html', areas=data)
+    return render_template('pages/venues.html', areas=data, page=page,
+                           genres=GENRE_NAMES, selected_genres=genres)
 
 
-@app.route('/venues/search', methods=['POST'])
+@app.route('/venues/search', methods=['GET', 'POST'])
+@replicas.read_only
 def search_venues():
+    search_term = request.values.get('search_term', '').strip()
+    results = search.venues(search_term)
+    after, before, limit = page_args(search.order(results))
+    counters.current()
+    response = {"count": 0, "data": []}
+    page = Page([])
     try:
-        search_term = request.form.get('search_term', '').strip()
-        response = {"count": 0, "data": []}
-        search_results = Venue.query.filter(
-            Venue.name.ilike('%' + search_term + '%')).all()
-        response["count"] = len(search_results)
-
-        for result in search_results:
-            data = {"id": result.id, "name": result.name}
+        search_query = select(results)
+        response["count"] = capped_count(search_query, app.config['SEARCH_COUNT_CAP'])
+        page = keyset_page(
+            search_query.add_columns(Venue.upcoming_shows_count).join(Venue, Venue.id == results.c.id),
+            search.order(results), after, before, limit)
+
+        for result in page.items:
+            data = {"id": result.id, "name": result.name,
+                    "num_upcoming_shows": result.upcoming_shows_count}
             response["data"].append(data)
     except:
         db.session.rollback()
-        print(sys.exc_info())
+        app.logger.exception('%s failed', request.endpoint)
         flash('An error occurred. Venues could not be listed.')
     finally:
         db.session.close()
 
-    return render_template('pages/search_venues.html', results=response, search_term=search_term)
+    return render_template('pages/search_venues.html', results=response, search_term=search_term,
+                           count_cap=app.config['SEARCH_COUNT_CAP'], page=page)
 
 
 @app.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
     # shows the venue page with the given venue_id
+    cache_key = cache.venue_key(venue_id)
+    now = counters.current()
+    version = conditional.current_version(queries.venue_version(venue_id))
+    data = page_cache.get(cache_key, version)
+    response = conditional.not_modified(version)
+    if response is not None:
+        return response
+    if data is not None:
+        return render_template('pages/show_venue.html', venue=data)
+
     try:
         data = {}
-        genres = []
-        upcoming_shows = []
-        past_shows = []
-        venue = Venue.query.get(venue_id)
-        venue_genres = Venue_Genre.query.filter_by(venue_id=venue_id).all()
-        for genre in venue_genres:
-            genres.append(genre.genre)
-
-        upcoming_shows_query = db.session.query(Show).join(Venue).filter(Show.venue_id == venue_id).filter(
-            Show.start_time >= datetime.now()).all()
-
-        for show in upcoming_shows_query:
-            artist = Artist.query.get(show.artist_id)
-            show_details = {
-                "artist_id": artist.id,
-                "artist_name": artist.name,
-                "artist_image_link": artist.image_link,
-                "start_time": str(show.start_time),
-            }
-            upcoming_shows.append(show_details)
-
-        past_shows_query = db.session.query(Show).join(Venue).filter(
-            Show.venue_id == venue_id).filter(Show.start_time < datetime.now()).all()
-        for show in past_shows_query:
-            artist = Artist.query.get(show.artist_id)
-            show_details = {
-                "artist_id": artist.id,
-                "artist_name": artist.name,
-                "artist_image_link": artist.image_link,
-                "start_time": str(show.start_time),
-            }
-            past_shows.append(show_details)
-
-        data = {
-            "id": venue.id,
-            "name": venue.name,
-            "genres": genres,
-            "address": venue.address,
-            "city": venue.city,
-            "state": venue.state,
-            "phone": venue.phone,
-            "website": venue.website,
-            "facebook_link": venue.facebook_link,
-            "seeking_talent": venue.seeking_talent,
-            "seeking_description": venue.seeking_description,
-            "image_link": venue.image_link,
-            "past_shows": past_shows,
-            "upcoming_shows": upcoming_shows,
-            "past_shows_count": len(past_shows),
-            "upcoming_shows_count": len(upcoming_shows),
-        }
-    except:
+        venue = db.get_or_404(Venue, venue_id)
+        genres = db.session.execute(queries.venue_genres(venue_id)).scalars().all()
+        upcoming = db.session.execute(queries.venue_shows(venue_id, True, now)).all()
+        past = db.session.execute(queries.venue_shows(venue_id, False, now)).all()
+        data = pages.venue_page(venue, genres, upcoming, past, version)
+        page_cache.set(cache_key, data, expires_at=pages.expires_at(upcoming))
+    except SQLAlchemyError:
         db.session.rollback()
-        print(sys.exc_info())
+        app.logger.exception('%s failed', request.endpoint)
         flash('An error occurred. Venue ' +
-              venue_id + ' could not be listed.')
+              str(venue_id) + ' could not be listed.')
     finally:
         db.session.close()
 
@@ -228,22 +242,20 @@ def create_venue_submission():
                 seeking_description=seeking_description,
                 image_link=image_link,
             )
-            print(new_venue)
+            # The venue, its genres and its search entry commit together.
             db.session.add(new_venue)
             db.session.flush()
+            venue_id = new_venue.id
+            add_genres(Venue_Genre, venue_id, genres)
+            search.index_venue(venue_id)
             db.session.commit()
+            page_cache.delete([cache.venue_key(venue_id)])
 
-            for genre in genres:
-                venue_genre = Venue_Genre(genre=genre, venue_id=new_venue.id)
-                db.session.add(venue_genre)
-                db.session.commit()
-
-            db.session.refresh(new_venue)
             # on successful db insert, flash success
             flash('Venue ' + request.form['name'] + ' was successfully listed!')
-        except:
+        except (SQLAlchemyError, ValueError):
             db.session.rollback()
-            print(sys.exc_info())
+            app.logger.exception('%s failed', request.endpoint)
             flash('An error occurred. Venue ' +
                 request.form['name'] + ' could not be listed.')
         finally:
@@ -263,12 +275,17 @@ def create_venue_submission():
 def delete_venue(venue_id):
     venue = Venue.query.get(venue_id).name
     try:
+        stale_pages = cache.venue_keys(venue_id)
+        counters.venue_removed(venue_id)
+        touch_partners(Venue, venue_id)
         Venue.query.filter_by(id=venue_id).delete()
+        search.remove_venue(venue_id)
         db.session.commit()
+        page_cache.delete(stale_pages)
         flash("Venue " + venue + " was successfully deleted!")
     except:
         db.session.rollback()
-        print(sys.exc_info())
+        app.logger.exception('%s failed', request.endpoint)
         flash('An error occurred. Venue ' +
               venue + ' could not be deleted.')
     finally:
@@ -281,11 +298,21 @@ def delete_venue(venue_id):
 
 @app.route('/artists')
 def artists():
+    after, before, limit = page_args(queries.ARTIST_LISTING_ORDER)
+    genres = request.args.getlist('genre')
+    version = conditional.page_version(keyset_query(
+        queries.with_genres(queries.artist_listing_version(), Artist, Artist_Genre, genres),
+        queries.ARTIST_LISTING_ORDER, after, before, limit))
+    response = conditional.not_modified(version)
+    if response is not None:
+        return response
+    data = []
+    page = Page([])
     try:
-        data = []
-        artist_list = Artist.query.all()
+        page = keyset_page(queries.with_genres(queries.artist_listing(), Artist, Artist_Genre, genres),
+                           queries.ARTIST_LISTING_ORDER, after, before, limit)
 
-        for artist in artist_list:
+        for artist in page.items:
             artist_details = {
                 "id": artist.id,
                 "name": artist.name
@@ -293,97 +320,69 @@ def artists():
 
             data.append(artist_details)
     except:
-        print(sys.exc_info())
+        app.logger.exception('%s failed', request.endpoint)
         db.session.rollback()
         flash('An error occurred. Artists could not be listed.')
     finally:
         db.session.close()
-    return render_template('pages/artists.html', artists=data)
+    return render_template('pages/artists.html', artists=data, page=page,
+                           genres=GENRE_NAMES, selected_genres=genres)
 
 
-@app.route('/artists/search', methods=['POST'])
+@app.route('/artists/search', methods=['GET', 'POST'])
+@replicas.read_only
 def search_artists():
+    search_term = request.values.get('search_term', '').strip()
+    results = search.artists(search_term)
+    after, before, limit = page_args(search.order(results))
+    counters.current()
+    response = {"count": 0, "data": []}
+    page = Page([])
     try:
-        search_term = request.form.get('search_term', '').strip()
-        response = {"count": 0, "data": []}
-        search_results = Artist.query.filter(
-            Artist.name.ilike('%' + search_term + '%')).all()
-        response["count"] = len(search_results)
-
-        num_upcoming_shows = 0
+        search_query = select(results)
+        response["count"] = capped_count(search_query, app.config['SEARCH_COUNT_CAP'])
+        page = keyset_page(
+            search_query.add_columns(Artist.upcoming_shows_count).join(Artist, Artist.id == results.c.id),
+            search.order(results), after, before, limit)
 
-        for result in search_results:
-            num_upcoming_shows = db.session.query(
-                Show).filter_by(artist_id=result.id).count()
+        for result in page.items:
             data = {"id": result.id, "name": result.name,
-                    "num_upcoming_shows": num_upcoming_shows}
+                    "num_upcoming_shows": result.upcoming_shows_count}
             response["data"].append(data)
     except:
-        print(sys.exc_info())
+        app.logger.exception('%s failed', request.endpoint)
         db.session.rollback()
         flash('An error occurred. Not able to search for artist.')
     finally:
         db.session.close()
 
-    return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+    return render_template('pages/search_artists.html', results=response, search_term=search_term,
+                           count_cap=app.config['SEARCH_COUNT_CAP'], page=page)
 
 
 @app.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
     # shows the artist page with the given artist_id
+    cache_key = cache.artist_key(artist_id)
+    now = counters.current()
+    version = conditional.current_version(queries.artist_version(artist_id))
+    data = page_cache.get(cache_key, version)
+    response = conditional.not_modified(version)
+    if response is not None:
+        return response
+    if data is not None:
+        return render_template('pages/show_artist.html', artist=data)
+
     try:
         data = {}
-        genres = []
-        upcoming_shows = []
-        past_shows = []
-        artist = Artist.query.get(artist_id)
-        artist_genres = Artist_Genre.query.filter_by(artist_id=artist_id).all()
-        for genre in artist_genres:
-            genres.append(genre.genre)
-
-        upcoming_shows_query = db.session.query(Show).join(Venue).filter(Show.artist_id == artist_id).filter(
-            Show.start_time >= datetime.now()).all()
-
-        for show in upcoming_shows_query:
-            venue = Venue.query.get(show.venue_id)
-            show_details = {
-                "venue_id": venue.id,
-                "venue_name": venue.name,
-                "venue_image_link": venue.image_link,
-                "start_time": str(show.start_time),
-            }
-            upcoming_shows.append(show_details)
-
-        past_shows_query = db.session.query(Show).join(Artist).filter(
-            Show.artist_id == artist_id).filter(Show.start_time < datetime.now()).all()
-        for show in past_shows_query:
-            venue = Venue.query.get(show.venue_id)
-            show_details = {
-                "venue_id": venue.id,
-                "venue_name": venue.name,
-                "venue_image_link": venue.image_link,
-                "start_time": str(show.start_time),
-            }
-            print(venue)
-            past_shows.append(show_details)
-
-        data = {
-            "id": artist.id,
-            "name": artist.name,
-            "genres": genres,
-            "city": artist.city,
-            "state": artist.state,
-            "phone": artist.phone,
-            "facebook_link": artist.facebook_link,
-            "seeking_venue": artist.seeking_venue,
-            "image_link": artist.image_link,
-            "past_shows": past_shows,
-            "upcoming_shows": upcoming_shows,
-            "past_shows_count": len(past_shows),
-            "upcoming_shows_count": len(upcoming_shows),
-        }
-    except:
-        print(sys.exc_info())
+        artist = db.get_or_404(Artist, artist_id)
+        genres = db.session.execute(queries.artist_genres(artist_id)).scalars().all()
+        upcoming = db.session.execute(queries.artist_shows(artist_id, True, now)).all()
+        past = db.session.execute(queries.artist_shows(artist_id, False, now)).all()
+        data = pages.artist_page(artist, genres, upcoming, past, version)
+        page_cache.set(cache_key, data, expires_at=pages.expires_at(upcoming))
+    except SQLAlchemyError:
+        app.logger.exception('%s failed', request.endpoint)
         db.session.rollback()
         flash('An error occurred. Artist could not be listed.')
     finally:
@@ -407,6 +406,13 @@ def edit_artist(artist_id):
 @app.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
     # Update artist record with ID <artist_id> using the new attributes
+    artist = db.get_or_404(Artist, artist_id)
+    form = ArtistForm()
+    if not form.validate_on_submit():
+        for field, message in form.errors.items():
+            flash(field + ' - ' + str(message))
+        return render_template('forms/edit_artist.html', form=form, artist=artist)
+
     try:
         sv = False
         name = request.form.get("name")
@@ -423,28 +429,26 @@ def edit_artist_submission(artist_id):
         if seeking_venue == 'y':
             sv = True
 
-        artist = Artist.query.get(artist_id)
         artist.name = name
         artist.city = city
         artist.state = state
-        artist.phone = phone,
-        artist.image_link = image_link,
+        artist.phone = phone
+        artist.image_link = image_link
         artist.facebook_link = facebook_link
         artist.seeking_venue = sv
         artist.seeking_description = seeking_description
         artist.website = website
+        # Genres live in their own table; touch the row for the validators.
+        artist.updated_at = utcnow()
 
-        db.session.flush()
+        update_genres(Artist_Genre, artist_id, genres)
+        touch_partners(Artist, artist_id)
+        search.index_artist(artist_id)
+        stale_pages = cache.artist_keys(artist_id)
         db.session.commit()
-
-        Artist_Genre.query.filter_by(artist_id=artist_id).delete()
-
-        for genre in genres:
-            artist_genre = Artist_Genre(genre=genre, artist_id=artist_id)
-            db.session.add(artist_genre)
-            db.session.commit()
-    except:
-        print(sys.exc_info())
+        page_cache.delete(stale_pages)
+    except (SQLAlchemyError, ValueError):
+        app.logger.exception('%s failed', request.endpoint)
         db.session.rollback()
         flash('An error occurred. Artist could not be updated.')
     finally:
@@ -464,7 +468,13 @@ def edit_venue(venue_id):
 
 @app.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
+    venue = db.get_or_404(Venue, venue_id)
     form = VenueForm()
+    if not form.validate_on_submit():
+        for field, message in form.errors.items():
+            flash(field + ' - ' + str(message))
+        return render_template('forms/edit_venue.html', form=form, venue=venue)
+
     try:
         st = False
         name = request.form.get("name")
@@ -481,30 +491,27 @@ def edit_venue_submission(venue_id):
         if seeking_talent == 'y':
             st = True
 
-        venue = Venue.query.get(venue_id)
         venue.name = name
         venue.address = address
         venue.city = city
         venue.state = state
-        venue.phone = phone,
-        venue.image_link = image_link,
+        venue.phone = phone
+        venue.image_link = image_link
         venue.facebook_link = facebook_link
         venue.seeking_talent = st
         venue.seeking_description = seeking_description
         venue.website = website
+        # Genres live in their own table; touch the row for the validators.
+        venue.updated_at = utcnow()
 
-        db.session.flush()
+        update_genres(Venue_Genre, venue_id, genres)
+        touch_partners(Venue, venue_id)
+        search.index_venue(venue_id)
+        stale_pages = cache.venue_keys(venue_id)
         db.session.commit()
-
-        Venue_Genre.query.filter_by(venue_id=venue_id).delete()
-
-        for genre in genres:
-            venue_genre = Venue_Genre(genre=genre, venue_id=venue_id)
-
-            db.session.add(venue_genre)
-            db.session.commit()
-    except:
-        print(sys.exc_info())
+        page_cache.delete(stale_pages)
+    except (SQLAlchemyError, ValueError):
+        app.logger.exception('%s failed', request.endpoint)
         db.session.rollback()
         flash('An error occurred. Venue ' +
               request.form['name'] + ' could not be updated.')
@@ -554,63 +561,109 @@ def create_artist_submission():
                 seeking_description=seeking_description,
                 image_link=image_link,
             )
-            print(new_artist)
+            # The artist, its genres and its search entry commit together.
             db.session.add(new_artist)
             db.session.flush()
+            artist_id = new_artist.id
+            add_genres(Artist_Genre, artist_id, genres)
+            search.index_artist(artist_id)
             db.session.commit()
-
-            # Save the artist's genres in the Artist_Genre Table
-            for genre in genres:
-                artist_genre = Artist_Genre(genre=genre, artist_id=new_artist.id)
-                db.session.add(artist_genre)
-                db.session.commit()
+            page_cache.delete([cache.artist_key(artist_id)])
             flash('Artist ' + request.form['name'] + ' was successfully listed!')
-        except:
-            print(sys.exc_info())
+        except (SQLAlchemyError, ValueError):
+            app.logger.exception('%s failed', request.endpoint)
             db.session.rollback()
             flash('An error occurred. Artist ' +
                 request.form['name'] + ' could not be listed.')
         finally:
             db.session.close()
-            # In all case return to home page
-            return render_template('pages/home.html')
+        # In all case return to home page
+        return render_template('pages/home.html')
     else:
         for field, message in form.errors.items():
             flash(field + ' - ' + str(message))
     return render_template('forms/new_artist.html', form=form)
 
 
+#  Browse
+#  ----------------------------------------------------------------
+
+@app.route('/venues/browse', defaults={'kind': 'venues'})
+@app.route('/artists/browse', defaults={'kind': 'artists'})
+def browse(kind):
+    source = facets.SOURCES[kind]
+    after, before, limit = facets.page_args(source)
+    selected = facets.selection(request.args)
+    counters.current()
+    sidebar = []
+    matched = 0
+    page = Page([])
+    try:
+        snapshot = facets.index(kind).current()
+        bits = facets.matching(snapshot, selected)
+        matched = bits.bit_count()
+        sidebar = facets.sidebar(request.endpoint, source, selected,
+                                 facets.counts(snapshot, selected))
+        page = facets.id_page(bits, after, before, limit)
+        if page.items:
+            page.items = db.session.execute(facets.entities(source, page.items)).all()
+    except:
+        db.session.rollback()
+        app.logger.exception('%s failed', request.endpoint)
+        flash(f'An error occurred. {kind.capitalize()} could not be listed.')
+    finally:
+        db.session.close()
+
+    return render_template('pages/browse.html', kind=kind, entities=page.items, page=page,
+                           matched=matched, facets=sidebar, selected=facets.selection_args(selected))
+
+
 #  Shows
 #  ----------------------------------------------------------------
+
 @app.route('/shows')
 def shows():
+    after, before, limit = page_args(queries.SHOW_LISTING_ORDER)
+    # The filters as given, so the form and pager links carry them along.
+    filter_args = {name: request.args[name] for name in queries.SHOW_FILTERS
+                   if request.args.get(name)}
     try:
-        data = []
-
-        # Get all shows
-        shows = Show.query.all()
-
-        # Get show's venue name and artist performing at that venue
-        for show in shows:
-            venue_id = show.venue_id
-            artist_id = show.artist_id
+        filters = queries.parse_show_filters(filter_args)
+    except ValueError as e:
+        flash(str(e))
+        filters = {}
+    version = conditional.page_version(keyset_query(
+        queries.filter_shows(queries.show_listing_version(), filters),
+        queries.SHOW_LISTING_ORDER, after, before, limit))
+    response = conditional.not_modified(version)
+    if response is not None:
+        return response
+    data = []
+    page = Page([])
+    try:
+        page = keyset_page(queries.filter_shows(queries.show_listing(), filters),
+                           queries.SHOW_LISTING_ORDER, after, before, limit)
 
+        for show in page.items:
             show_details = {
                 "show_id": show.id,
-                "venue_name": Venue.query.get(venue_id).name,
-                "venue_id": Venue.query.get(venue_id).id,
-                "artist_name": Artist.query.get(artist_id).name,
-                "artist_id": Artist.query.get(artist_id).id,
-                "artist_image_link": Artist.query.get(artist_id).image_link,
-                "start_time": str(show.start_time),
+                "venue_name": show.venue_name,
+                "venue_id": show.venue_id,
+                "artist_name": show.artist_name,
+                "artist_id": show.artist_id,
+                "artist_image_link": show.artist_image_link,
+                "start_time": show.start_time,
             }
             data.append(show_details)
     except:
-        print(sys.exc_info())
+        app.logger.exception('%s failed', request.endpoint)
         db.session.rollback()
         flash("An error occurred. Shows could not be listed.")
+    finally:
+        db.session.close()
 
-    return render_template('pages/shows.html', shows=data)
+    return render_template('pages/shows.html', shows=data, page=page,
+                           filters=filter_args, genres=GENRE_NAMES)
 
 
 @app.route('/shows/create')
@@ -625,7 +678,8 @@ def create_show_submission():
     try:
         artist_id = request.form.get("artist_id")
         venue_id = request.form.get("venue_id")
-        start_time = request.form.get("start_time")
+        # A string start_time is only coerced by Postgres.
+        start_time = dateutil.parser.parse(request.form.get("start_time"))
 
         # Checking artist id and venue id in the database
         validate_artist = Artist.query.get(artist_id)
@@ -645,16 +699,61 @@ def create_show_submission():
             )
 
             db.session.add(new_show)
+            # Both pages list the show; see models.touch_partners.
+            validate_venue.updated_at = validate_artist.updated_at = utcnow()
+            counters.show_added(validate_venue.id, validate_artist.id, start_time)
             db.session.commit()
+            page_cache.delete([cache.venue_key(validate_venue.id),
+                               cache.artist_key(validate_artist.id)])
     except:
         db.session.rollback()
-        print(sys.exc_info())
+        app.logger.exception('%s failed', request.endpoint)
         flash('An error occurred. Show could not be listed.')
     finally:
         db.session.close()
     return render_template('pages/home.html')
 
 
+#  Preferences
+#  ----------------------------------------------------------------
+
+@app.route('/preferences')
+def set_preferences():
+    # ?locale=de&tz=Europe/Berlin, remembered for a year.
+    response = redirect(request.referrer or url_for('index'))
+    locale = request.args.get('locale')
+    if locale in app.config['SUPPORTED_LOCALES']:
+        response.set_cookie('locale', locale, max_age=365 * 24 * 3600, samesite='Lax')
+    zone = request.args.get('tz')
+    if zone and dates.timezone(zone) is not None:
+        response.set_cookie('tz', zone, max_age=365 * 24 * 3600, samesite='Lax')
+    return response
+
+
+#  Admin
+#  ----------------------------------------------------------------
+
+@app.route('/admin/cache')
+def cache_stats():
+    return jsonify(page_cache.stats())
+
+
+@app.route('/admin/facets')
+def facet_stats():
+    return jsonify(facets.stats())
+
+
+@app.route('/admin/pool')
+def pool_stats():
+    return jsonify(pool.stats())
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    body, content_type = metrics.exposition()
+    return Response(body, content_type=content_type)
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -0,0 +1,223 @@
+import asyncio
+import io
+
+from asgiref.sync import ThreadSensitiveContext
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from flask import abort, flash, render_template, request, request_started
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from werkzeug.exceptions import HTTPException
+
+from app import app
+from cache import page_cache
+from models import Venue, Artist
+import cache
+import conditional
+import counters
+import pages
+import pool
+import queries
+import replicas
+
+#----------------------------------------------------------------------------#
+# Async serving mode.
+#
+#   uvicorn asgi:application --workers 4
+#
+# The venue and artist pages, which spend most of their time waiting on the
+# database, run as coroutines on SQLAlchemy's asyncio engines, so a worker
+# keeps many of their queries in flight at once instead of one per thread.
+# Every other route, including all writes, goes to the Flask app unchanged
+# through asgiref's WSGI adapter, each request on a thread of its own.
+#
+# The async views still run the app's request hooks, error handlers and
+# templates (replica choice, metrics, Server-Timing, the page cache), so
+# both modes send the same pages. gunicorn with app:app stays the default;
+# benchmarks/serving.py compares the two.
+#----------------------------------------------------------------------------#
+
+
+class AsyncDatabase:
+    # An async engine per database, keyed like db.engines.
+    def __init__(self, config):
+        options = pool.async_engine_options(config)
+        urls = {None: config['SQLALCHEMY_DATABASE_URI'], **config['SQLALCHEMY_BINDS']}
+        self.engines = {}
+        for key, url in urls.items():
+            engine = create_async_engine(pool.async_url(url), **options)
+            pool.configure_engine(engine.sync_engine, config)
+            self.engines[key] = engine
+
+    def session(self):
+        # On the replica the request hooks picked, as RoutingSession does.
+        return AsyncSession(self.engines[replicas.reading_replica()])
+
+    async def dispose(self):
+        for engine in self.engines.values():
+            await engine.dispose()
+
+
+database = AsyncDatabase(app.config)
+
+
+#  Views
+#  ----------------------------------------------------------------
+
+async def _as_of():
+    # A counter rollover writes through the sync engine, so it runs on a
+    # thread; it is due once every COUNTER_ROLLOVER_SECONDS.
+    return counters.fresh() or await asyncio.to_thread(counters.current)
+
+
+async def _current_version(stmt):
+    # conditional.current_version() on the async engine.
+    try:
+        async with database.session() as session:
+            return conditional.version((await session.execute(stmt)).all())
+    except SQLAlchemyError:
+        app.logger.warning('Validator query failed for %s', request.endpoint, exc_info=True)
+        return None
+
+
+async def show_venue(venue_id):
+    cache_key = cache.venue_key(venue_id)
+    now = await _as_of()
+    version = await _current_version(queries.venue_version(venue_id))
+    data = page_cache.get(cache_key, version)
+    response = conditional.not_modified(version)
+    if response is not None:
+        return response
+    if data is not None:
+        return render_template('pages/show_venue.html', venue=data)
+
+    try:
+        data = {}
+        async with database.session() as session:
+            venue = await session.get(Venue, venue_id)
+            if venue is None:
+                abort(404)
+            genres = (await session.execute(queries.venue_genres(venue_id))).scalars().all()
+            upcoming = (await session.execute(queries.venue_shows(venue_id, True, now))).all()
+            past = (await session.execute(queries.venue_shows(venue_id, False, now))).all()
+        data = pages.venue_page(venue, genres, upcoming, past, version)
+        page_cache.set(cache_key, data, expires_at=pages.expires_at(upcoming))
+    except SQLAlchemyError:
+        app.logger.exception('%s failed', request.endpoint)
+        flash('An error occurred. Venue ' +
+              str(venue_id) + ' could not be listed.')
+
+    return render_template('pages/show_venue.html', venue=data)
+
+
+async def show_artist(artist_id):
+    cache_key = cache.artist_key(artist_id)
+    now = await _as_of()
+    version = await _current_version(queries.artist_version(artist_id))
+    data = page_cache.get(cache_key, version)
+    response = conditional.not_modified(version)
+    if response is not None:
+        return response
+    if data is not None:
+        return render_template('pages/show_artist.html', artist=data)
+
+    try:
+        data = {}
+        async with database.session() as session:
+            artist = await session.get(Artist, artist_id)
+            if artist is None:
+                abort(404)
+            genres = (await session.execute(queries.artist_genres(artist_id))).scalars().all()
+            upcoming = (await session.execute(queries.artist_shows(artist_id, True, now))).all()
+            past = (await session.execute(queries.artist_shows(artist_id, False, now))).all()
+        data = pages.artist_page(artist, genres, upcoming, past, version)
+        page_cache.set(cache_key, data, expires_at=pages.expires_at(upcoming))
+    except SQLAlchemyError:
+        app.logger.exception('%s failed', request.endpoint)
+        flash('An error occurred. Artist could not be listed.')
+
+    return render_template('pages/show_artist.html', artist=data)
+
+
+# Flask endpoint -> async view serving its GET requests.
+VIEWS = {
+    'show_venue': show_venue,
+    'show_artist': show_artist,
+}
+
+
+#  ASGI application
+#  ----------------------------------------------------------------
+
+class Application:
+    def __init__(self, flask_app, views):
+        self.app = flask_app
+        self.views = views
+        self.wsgi = WsgiToAsgi(flask_app)
+        self.urls = flask_app.url_map.bind('localhost')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        view = self.match(scope)
+        if view is not None:
+            await self.dispatch(view, scope, receive, send)
+            return
+        # Without a context of its own, asgiref runs every sync request on
+        # one shared thread.
+        async with ThreadSensitiveContext():
+            await self.wsgi(scope, receive, send)
+
+    def match(self, scope):
+        if scope['type'] != 'http' or scope['method'] != 'GET':
+            return None
+        try:
+            endpoint, _ = self.urls.match(scope['path'], 'GET')
+        except HTTPException:
+            return None
+        return self.views.get(endpoint)
+
+    async def dispatch(self, view, scope, receive, send):
+        while (await receive()).get('more_body'):
+            pass
+        adapter = WsgiToAsgiInstance(self.app)
+        adapter.scope = scope
+        environ = adapter.build_environ(scope, io.BytesIO())
+
+        # Flask.wsgi_app and full_dispatch_request, with the view awaited.
+        app = self.app
+        with app.request_context(environ):
+            try:
+                try:
+                    request_started.send(app, _async_wrapper=app.ensure_sync)
+                    rv = app.preprocess_request()
+                    if rv is None:
+                        rv = await view(**request.view_args)
+                except Exception as e:
+                    rv = app.handle_user_exception(e)
+                response = app.finalize_request(rv)
+            except Exception as e:
+                response = app.handle_exception(e)
+
+        body = response.get_data()
+        response.close()
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': [(name.lower().encode('latin1'), value.encode('latin1'))
+                        for name, value in response.headers.items()],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await database.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+application = Application(app, VIEWS)
@@ -0,0 +1,184 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+import click
+from flask import Blueprint, abort, current_app, request, send_from_directory, url_for
+from flask.cli import AppGroup
+
+#----------------------------------------------------------------------------#
+# Static asset bundles.
+#
+#   flask assets build
+#
+# concatenates and minifies each bundle below into static/dist/ under a
+# content-hashed name (main.3f2a9c01d4e5.css), with .gz and .br copies next
+# to it, and records the names in static/dist/manifest.json. Templates ask
+# for a bundle with asset_urls('main.css'): one hashed /assets/ URL once the
+# manifest exists, else the source files one by one, as before the build.
+#
+# /assets/ serves the precompressed copy the client accepts, and since a
+# hashed name never changes content it is cached for a year as immutable.
+# Rebuild (or set STATIC_BUNDLES=0) after editing a source file; the
+# manifest is read when the app starts.
+#----------------------------------------------------------------------------#
+
+BUNDLES = {
+    'main.css': [
+        'css/bootstrap.min.css',
+        'css/layout.main.css',
+        'css/main.css',
+        'css/main.responsive.css',
+        'css/main.quickfix.css',
+    ],
+    'main.js': [
+        'js/libs/jquery-1.11.1.min.js',
+        'js/libs/bootstrap-3.1.1.min.js',
+        'js/libs/modernizr-2.8.2.min.js',
+        'js/libs/moment.min.js',
+        'js/plugins.js',
+        'js/script.js',
+    ],
+    'venue.js': ['js/venue.js'],
+}
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+MAX_AGE = 365 * 24 * 60 * 60
+# (Accept-Encoding token, file suffix), in order of preference.
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+assets = Blueprint('assets', __name__)
+
+
+def _dist(app):
+    return os.path.join(app.static_folder, DIST)
+
+
+def load_manifest(app):
+    try:
+        with open(os.path.join(_dist(app), MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def asset_urls(name):
+    manifest = current_app.extensions.get('assets_manifest')
+    if manifest and name in manifest:
+        return [url_for('assets.bundle', filename=manifest[name])]
+    return [url_for('static', filename=source) for source in BUNDLES[name]]
+
+
+@assets.route('/assets/<path:filename>')
+def bundle(filename):
+    directory = _dist(current_app)
+    mimetype = mimetypes.guess_type(filename)[0]
+    if filename == MANIFEST or mimetype is None:
+        abort(404)
+    encoding = suffix = None
+    for token, extension in ENCODINGS:
+        if token in request.accept_encodings and os.path.exists(os.path.join(directory, filename + extension)):
+            encoding, suffix = token, extension
+            break
+
+    response = send_from_directory(directory, filename + (suffix or ''), mimetype=mimetype,
+                                   max_age=MAX_AGE)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def init_app(app):
+    app.register_blueprint(assets)
+    if app.config['STATIC_BUNDLES']:
+        app.extensions['assets_manifest'] = load_manifest(app)
+    app.jinja_env.globals['asset_urls'] = asset_urls
+
+
+#  Building
+#  ----------------------------------------------------------------
+
+def _minify(name, text):
+    try:
+        import rcssmin
+        import rjsmin
+    except ImportError:
+        raise RuntimeError('flask assets build needs the rcssmin and rjsmin packages installed')
+    if name.endswith('.css'):
+        return rcssmin.cssmin(text)
+    return rjsmin.jsmin(text)
+
+
+def _rebase_urls(source, text):
+    # The bundle is served from /assets/, so relative url()s in a stylesheet
+    # are made absolute against the directory it came from.
+    base = os.path.dirname(source)
+
+    def rebase(match):
+        quote, target = match.group(1), match.group(2)
+        if target.startswith(('/', 'data:', 'http:', 'https:', '#')):
+            return match.group(0)
+        path = os.path.normpath(os.path.join(base, target)).replace(os.sep, '/')
+        return f'url({quote}/static/{path}{quote})'
+
+    return re.sub(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''', rebase, text)
+
+
+def build(app, echo=click.echo):
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+        echo('brotli is not installed; writing .gz copies only.', err=True)
+
+    directory = _dist(app)
+    os.makedirs(directory, exist_ok=True)
+    manifest = {}
+    for name, sources in BUNDLES.items():
+        parts = []
+        for source in sources:
+            with open(os.path.join(app.static_folder, source), encoding='utf-8') as f:
+                text = f.read()
+            if name.endswith('.css'):
+                text = _rebase_urls(source, text)
+            parts.append(text)
+        # A script that omits its final semicolon must not run into the next.
+        joined = '\n'.join(parts) if name.endswith('.css') else ';\n'.join(parts)
+        data = _minify(name, joined).encode('utf-8')
+
+        stem, extension = os.path.splitext(name)
+        hashed = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{extension}'
+        path = os.path.join(directory, hashed)
+        with open(path, 'wb') as f:
+            f.write(data)
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(path + '.br', 'wb') as f:
+                f.write(brotli.compress(data, quality=11))
+        manifest[name] = hashed
+        echo(f'{name} -> {DIST}/{hashed} ({len(data):,} bytes from {len(sources)} files)')
+
+    with open(os.path.join(directory, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+assets_cli = AppGroup('assets', help='Build the static asset bundles.')
+
+
+@assets_cli.command('build')
+def build_command():
+    """Bundle, minify, fingerprint and precompress the static assets."""
+    build(current_app)
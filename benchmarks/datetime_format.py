@@ -0,0 +1,72 @@
+import argparse
+import os
+import random
+import timeit
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+#----------------------------------------------------------------------------#
+# Micro-benchmark for the `datetime` template filter.
+#
+#   python -m benchmarks.datetime_format [--shows 5000] [--distinct 500]
+#
+# Formats one listing's worth of start times (`--shows`, spread over
+# `--distinct` hourly slots) with the previous filter, which parsed the
+# string the view had just made with str() and resolved the babel pattern
+# and locale on every call, and with dates.format_datetime, cold and warm.
+#----------------------------------------------------------------------------#
+
+
+def legacy_format_datetime(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format, locale='en')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.datetime_format')
+    parser.add_argument('--shows', type=int, default=5000)
+    parser.add_argument('--distinct', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    # No queries are run; any database URL will do.
+    os.environ.setdefault('DATABASE_URL', 'sqlite://')
+    from flask import render_template_string
+    from app import app
+    import dates
+
+    rng = random.Random(1)
+    base = datetime(2026, 1, 1, 20)
+    times = [base + timedelta(hours=rng.randrange(args.distinct)) for _ in range(args.shows)]
+    strings = [str(t) for t in times]
+    app.jinja_env.filters['legacy_datetime'] = legacy_format_datetime
+    # The tile loop of pages/shows.html, reduced to the date.
+    legacy_template = "{% for t in shows %}<h4>{{ t|legacy_datetime('full') }}</h4>{% endfor %}"
+    template = "{% for t in shows %}<h4>{{ t|datetime('full') }}</h4>{% endfor %}"
+
+    def legacy():
+        return render_template_string(legacy_template, shows=strings)
+
+    def cold():
+        dates._format.cache_clear()
+        return warm()
+
+    def warm():
+        return render_template_string(template, shows=times)
+
+    with app.test_request_context(headers={'Accept-Language': 'en-US,en;q=0.8'}):
+        assert legacy() == warm()
+        for name, run in (('legacy', legacy), ('cached, cold', cold), ('cached, warm', warm)):
+            best = min(timeit.repeat(run, number=1, repeat=args.repeat))
+            print(f'{name:<14} {best * 1000:8.1f} ms per listing  '
+                  f'{best / args.shows * 1e6:7.2f} us per show')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,387 @@
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlencode, urlsplit
+
+#----------------------------------------------------------------------------#
+# Load benchmark.
+#
+#   python -m benchmarks.load run --database sqlite:////tmp/bench.db \
+#       --scale 1 --concurrency 8 --requests 300 --out results/HEAD.json
+#   python -m benchmarks.load compare results/base.json results/HEAD.json
+#
+# `run` seeds a fresh database with seeder.py at the given scale (1 = 1,000
+# venues, 1,000 artists and 10,000 shows), serves the app from a threaded local server
+# and drives every route in turn with `--concurrency` keep-alive clients.
+# Each route reports p50/p95/p99 latency, throughput, errors and the mean
+# SQL statement count taken from the Server-Timing header. The seed is
+# fixed, so two runs at the same scale load the same data and request the
+# same ids; `compare` prints the change between two result files.
+#
+# Pass --url to drive an already running server instead (seeded the same
+# way with --seed-only, and with WTF_CSRF_ENABLED off).
+#----------------------------------------------------------------------------#
+
+QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+#  Database
+#  ----------------------------------------------------------------
+
+def load_app(database):
+    # config.py reads DATABASE_URL when it is imported.
+    os.environ['DATABASE_URL'] = database
+    from app import app
+    app.config['WTF_CSRF_ENABLED'] = False
+    # Debug mode reloads templates on every render.
+    app.debug = False
+    return app
+
+
+def seed(app, scale, seed_value, disposable):
+    # The last `disposable` venues are kept for the delete route to remove.
+    from sqlalchemy import text
+    from models import db
+    import search
+    import seeder
+
+    with app.app_context():
+        if db.engine.dialect.name == 'postgresql':
+            with db.engine.begin() as connection:
+                connection.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        db.drop_all()
+        db.create_all()
+        dataset = seeder.Dataset(scale, seed_value)
+        seeder.load(dataset, echo=lambda message: print(message, file=sys.stderr))
+        for entity in (search.VENUES, search.ARTISTS):
+            for _ in search.backend().backfill(entity, 5000):
+                pass
+        images = _image_keys(dataset.venue_count - disposable, dataset.artist_count)
+        db.session.close()
+
+    venue_ids = list(range(1, dataset.venue_count + 1))
+    artist_ids = list(range(1, dataset.artist_count + 1))
+    return venue_ids[:-disposable], artist_ids, venue_ids[-disposable:], images
+
+
+def _image_keys(venue_count, artist_count, limit=1000):
+    # (kind, id, key) for the /images route, from the first `limit` venues
+    # and artists that are not deleted during the run.
+    from sqlalchemy import select
+    from models import db, Venue, Artist
+    import thumbnails
+
+    images = []
+    for kind, model, count in (('venues', Venue, venue_count), ('artists', Artist, artist_count)):
+        rows = db.session.execute(select(model.id, model.image_link)
+                                  .where(model.id <= min(count, limit)).order_by(model.id))
+        images += [(kind, id, thumbnails.source_key(link)) for id, link in rows if link]
+    return images
+
+
+def serve(app):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    # HTTP/1.1 so the clients' connections are kept alive between requests.
+    WSGIRequestHandler.protocol_version = 'HTTP/1.1'
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+#  Routes
+#  ----------------------------------------------------------------
+
+VENUE_FORM = {
+    'name': 'Bench Venue', 'city': 'Austin', 'state': 'TX', 'address': '1 Main St',
+    'phone': '512-555-0100', 'genres': ['Jazz', 'Blues'],
+    'image_link': 'https://example.com/v.jpg', 'facebook_link': 'https://facebook.com/bench',
+    'website_link': 'https://example.com', 'seeking_description': '',
+}
+
+ARTIST_FORM = {
+    'name': 'Bench Artist', 'city': 'Austin', 'state': 'TX', 'phone': '512-555-0100',
+    'genres': ['Jazz'], 'image_link': 'https://example.com/a.jpg',
+    'facebook_link': 'https://facebook.com/bench', 'website_link': 'https://example.com',
+    'seeking_description': '',
+}
+
+
+def routes(venue_ids, artist_ids, disposable_ids, images):
+    # (name, callable(rng) -> (method, path, form data or None, ok statuses))
+    import seeder
+
+    deletable = deque(disposable_ids)
+    start = (datetime.now() + timedelta(days=30)).strftime('%Y-%m-%d %H:%M:%S')
+    terms = ['blue', 'hall', 'jazz', 'echo room', 'san francisco', 'moon star']
+    genres = ['Jazz', 'Rock n Roll', 'Blues', 'Folk']
+    states = sorted({state for _, state in seeder.CITIES})
+    week = {'from': seeder.DEFAULT_START.date().isoformat(),
+            'to': (seeder.DEFAULT_START + timedelta(days=7)).date().isoformat()}
+
+    def query(path, rng, **args):
+        return path + '?' + urlencode({k: v(rng) if callable(v) else v for k, v in args.items()})
+
+    def thumbnail(rng):
+        kind, id, key = rng.choice(images)
+        return f'/images/{kind}/{id}/{rng.choice(["tile", "cover"])}/{key}'
+
+    def get(path):
+        return lambda rng: ('GET', path(rng) if callable(path) else path, None, (200,))
+
+    return [
+        ('home', get('/')),
+        ('venues', get('/venues')),
+        ('artists', get('/artists')),
+        ('shows', get('/shows')),
+        ('show_venue', get(lambda rng: f'/venues/{rng.choice(venue_ids)}')),
+        ('show_artist', get(lambda rng: f'/artists/{rng.choice(artist_ids)}')),
+        ('search_venues', get(lambda rng: '/venues/search?' + urlencode({'search_term': rng.choice(terms)}))),
+        ('search_artists', lambda rng: ('POST', '/artists/search', {'search_term': rng.choice(terms)}, (200,))),
+        ('browse_venues', get('/venues/browse')),
+        ('browse_artists', get(lambda rng: query(
+            '/artists/browse', rng, genre=lambda rng: rng.choice(genres), upcoming='yes'))),
+        ('browse_venues_state', get(lambda rng: query(
+            '/venues/browse', rng, state=lambda rng: rng.choice(states), seeking='yes'))),
+        ('api_venues', get('/api/v1/venues')),
+        ('api_artists', get(lambda rng: query(
+            '/api/v1/artists', rng, genre=lambda rng: rng.choice(genres), embed='genres'))),
+        ('api_shows', get('/api/v1/shows')),
+        ('api_venue', get(lambda rng: f'/api/v1/venues/{rng.choice(venue_ids)}')),
+        ('api_artist', get(lambda rng: f'/api/v1/artists/{rng.choice(artist_ids)}')),
+        ('export_venue_shows', get(lambda rng: query(
+            '/export/shows', rng, venue_id=lambda rng: rng.choice(venue_ids)))),
+        ('export_week', get(lambda rng: query(
+            '/export/shows', rng, format='ndjson', gzip='1', **week))),
+        # Thumbnails are fetched from images.example.com in the background;
+        # until one is stored its URL redirects to the source. Runs before
+        # the edits, which change the image links it was given.
+        ('images', lambda rng: ('GET', thumbnail(rng), None, (200, 302))),
+        ('metrics', get('/metrics')),
+        ('create_venue_form', get('/venues/create')),
+        ('create_venue', lambda rng: ('POST', '/venues/create', VENUE_FORM, (200,))),
+        ('create_artist_form', get('/artists/create')),
+        ('create_artist', lambda rng: ('POST', '/artists/create', ARTIST_FORM, (200,))),
+        ('create_show_form', get('/shows/create')),
+        ('create_show', lambda rng: ('POST', '/shows/create', {
+            'venue_id': rng.choice(venue_ids), 'artist_id': rng.choice(artist_ids),
+            'start_time': start}, (200,))),
+        ('edit_venue_form', get(lambda rng: f'/venues/{rng.choice(venue_ids)}/edit')),
+        ('edit_venue', lambda rng: ('POST', f'/venues/{rng.choice(venue_ids)}/edit',
+                                    VENUE_FORM, (200, 302))),
+        ('edit_artist_form', get(lambda rng: f'/artists/{rng.choice(artist_ids)}/edit')),
+        ('edit_artist', lambda rng: ('POST', f'/artists/{rng.choice(artist_ids)}/edit',
+                                     ARTIST_FORM, (200, 302))),
+        ('delete_venue', lambda rng: ('DELETE', f'/venues/{deletable.popleft()}', None, (302,))),
+    ]
+
+
+#  Load generation
+#  ----------------------------------------------------------------
+
+class Client:
+    # One keep-alive connection per worker thread.
+    def __init__(self, base_url):
+        self.netloc = urlsplit(base_url).netloc
+        self.connection = None
+
+    def request(self, method, path, form):
+        body = urlencode(form, doseq=True) if form is not None else None
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'} if body else {}
+        for attempt in (1, 2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.netloc, timeout=60)
+            try:
+                started = time.perf_counter()
+                self.connection.request(method, path, body=body, headers=headers)
+                response = self.connection.getresponse()
+                response.read()
+                elapsed = time.perf_counter() - started
+            except (http.client.HTTPException, ConnectionError):
+                self.connection.close()
+                self.connection = None
+                if attempt == 2:
+                    raise
+                continue
+            if response.getheader('Connection', '').lower() == 'close':
+                self.connection.close()
+                self.connection = None
+            return response.status, elapsed, response.getheader('Server-Timing', '')
+
+
+def percentile(values, p):
+    # Nearest-rank percentile of a sorted list.
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * p // 100))
+    return values[int(rank) - 1]
+
+
+def drive(base_url, route, count, concurrency, seed):
+    local = threading.local()
+    lock = threading.Lock()
+    results = []
+
+    def one(i):
+        if not hasattr(local, 'client'):
+            local.client = Client(base_url)
+        # Per-request generator, so the ids asked for do not depend on
+        # how the requests happen to be spread over the threads.
+        method, path, form, ok = route(random.Random(f'{seed}:{i}'))
+        try:
+            status, elapsed, timing = local.client.request(method, path, form)
+        except Exception:
+            status, elapsed, timing = None, None, ''
+        match = QUERIES.search(timing)
+        with lock:
+            results.append((status in ok, elapsed, int(match.group(1)) if match else None))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(one, range(count)))
+    wall = time.perf_counter() - started
+
+    latencies = sorted(elapsed for ok, elapsed, _ in results if ok)
+    queries = [q for ok, _, q in results if ok and q is not None]
+    return {
+        'requests': count,
+        'errors': sum(1 for ok, _, _ in results if not ok),
+        'throughput_rps': round(len(latencies) / wall, 1),
+        'p50_ms': _ms(percentile(latencies, 50)),
+        'p95_ms': _ms(percentile(latencies, 95)),
+        'p99_ms': _ms(percentile(latencies, 99)),
+        'mean_queries': round(sum(queries) / len(queries), 2) if queries else None,
+    }
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+def run(args):
+    app = load_app(args.database)
+    print(f'Seeding scale {args.scale} into {args.database} ...', file=sys.stderr)
+    ids = seed(app, args.scale, args.seed, disposable=args.requests + args.warmup)
+    if args.seed_only:
+        return
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        server, base_url = serve(app)
+
+    selected = set(args.routes.split(',')) if args.routes else None
+    results = {}
+    try:
+        for name, route in routes(*ids):
+            if selected and name not in selected:
+                continue
+            drive(base_url, route, args.warmup, args.concurrency, f'{args.seed}:warmup:{name}')
+            results[name] = drive(base_url, route, args.requests, args.concurrency,
+                                  f'{args.seed}:{name}')
+            r = results[name]
+            print(f'{name:<20} {r["throughput_rps"]:>8} req/s  p50 {r["p50_ms"]} ms  '
+                  f'p95 {r["p95_ms"]} ms  p99 {r["p99_ms"]} ms  '
+                  f'queries {r["mean_queries"]}  errors {r["errors"]}', file=sys.stderr)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    output = {
+        'meta': {
+            'commit': _git_commit(),
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'database': app.config['SQLALCHEMY_DATABASE_URI'].split(':', 1)[0],
+            'scale': args.scale,
+            'seed': args.seed,
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'python': platform.python_version(),
+        },
+        'routes': results,
+    }
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, 'w') as f:
+            json.dump(output, f, indent=2)
+    else:
+        json.dump(output, sys.stdout, indent=2)
+
+
+def compare(args):
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+    print(f'{base["meta"]["commit"]} -> {head["meta"]["commit"]}')
+    print(f'{"route":<20} {"p50 ms":>18} {"p95 ms":>18} {"req/s":>18} {"queries":>12}')
+    for name, new in head['routes'].items():
+        old = base['routes'].get(name)
+        if old is None:
+            continue
+        print(f'{name:<20} {_delta(old["p50_ms"], new["p50_ms"]):>18} '
+              f'{_delta(old["p95_ms"], new["p95_ms"]):>18} '
+              f'{_delta(old["throughput_rps"], new["throughput_rps"]):>18} '
+              f'{old["mean_queries"]}->{new["mean_queries"]:<6}')
+
+
+def _delta(old, new):
+    if not old or new is None:
+        return f'{old}->{new}'
+    return f'{new} ({(new - old) / old:+.0%})'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.load')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('run', help='Seed a database and benchmark every route.')
+    p.add_argument('--database', default='sqlite:////tmp/fyyur-bench.db',
+                   help='Database to seed and serve from; it is dropped and recreated.')
+    p.add_argument('--scale', type=float, default=1)
+    p.add_argument('--seed', type=int, default=1)
+    p.add_argument('--concurrency', type=int, default=8)
+    p.add_argument('--requests', type=int, default=300, help='Measured requests per route.')
+    p.add_argument('--warmup', type=int, default=20, help='Unmeasured requests per route.')
+    p.add_argument('--routes', help='Comma-separated route names to run; default all.')
+    p.add_argument('--url', help='Benchmark this server instead of starting one.')
+    p.add_argument('--seed-only', action='store_true', help='Seed the database and exit.')
+    p.add_argument('--out', help='Write the JSON results here instead of stdout.')
+    p.set_defaults(func=run)
+
+    p = commands.add_parser('compare', help='Compare two result files.')
+    p.add_argument('base')
+    p.add_argument('head')
+    p.set_defaults(func=compare)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from benchmarks import load
+
+#----------------------------------------------------------------------------#
+# Sync vs async serving benchmark.
+#
+#   python -m benchmarks.serving --database postgresql://localhost/fyyur_bench \
+#       --scale 10 --workers 2 --concurrency 64 --requests 2000
+#
+# Seeds the database as benchmarks/load.py does, then serves it twice, each
+# time from `--workers` processes: with gunicorn's threaded workers running
+# app:app (the current sync mode, `--threads` each) and with uvicorn running
+# asgi:application. The same requests are driven at both and every route
+# reports throughput, requests per second per worker, requests per CPU
+# second the server processes used (from /proc, so Linux only) and latency.
+#
+# The async views only win where requests wait on the database, i.e. on a
+# networked Postgres; SQLite answers in-process and leaves nothing to
+# overlap.
+#----------------------------------------------------------------------------#
+
+ROUTES = 'show_venue,show_artist'
+
+
+def _configured_app():
+    from app import app
+    # Debug mode reloads templates on every render.
+    app.debug = False
+    return app
+
+
+def sync_app():
+    # gunicorn 'benchmarks.serving:sync_app()'
+    return _configured_app()
+
+
+def async_app():
+    # uvicorn --factory benchmarks.serving:async_app
+    _configured_app()
+    from asgi import application
+    return application
+
+
+def _command(mode, port, args):
+    if mode == 'sync':
+        return [sys.executable, '-m', 'gunicorn', 'benchmarks.serving:sync_app()',
+                '--bind', f'127.0.0.1:{port}', '--workers', str(args.workers),
+                '--threads', str(args.threads), '--log-level', 'warning']
+    return [sys.executable, '-m', 'uvicorn', 'benchmarks.serving:async_app', '--factory',
+            '--port', str(port), '--workers', str(args.workers), '--log-level', 'warning',
+            '--no-access-log']
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'server exited with {process.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'server did not listen on port {port}')
+
+
+def _cpu_seconds(pid):
+    # User + system time of a process and all its descendants.
+    total, pending = 0, [pid]
+    try:
+        ticks = os.sysconf('SC_CLK_TCK')
+        while pending:
+            current = pending.pop()
+            with open(f'/proc/{current}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            total += (int(fields[11]) + int(fields[12])) / ticks
+            with open(f'/proc/{current}/task/{current}/children') as f:
+                pending.extend(int(child) for child in f.read().split())
+    except (OSError, ValueError):
+        return None
+    return total
+
+
+def measure(mode, args, ids):
+    port = _free_port()
+    env = dict(os.environ, DATABASE_URL=args.database)
+    process = subprocess.Popen(_command(mode, port, args), env=env)
+    results = {}
+    try:
+        _wait_for(port, process)
+        base_url = f'http://127.0.0.1:{port}'
+        selected = set(args.routes.split(','))
+        for name, route in load.routes(*ids):
+            if name not in selected:
+                continue
+            load.drive(base_url, route, args.warmup, args.concurrency, f'{args.seed}:warmup:{name}')
+            cpu_before = _cpu_seconds(process.pid)
+            result = load.drive(base_url, route, args.requests, args.concurrency,
+                                f'{args.seed}:{name}')
+            cpu_after = _cpu_seconds(process.pid)
+
+            served = result['requests'] - result['errors']
+            result['rps_per_worker'] = round(result['throughput_rps'] / args.workers, 1)
+            cpu = cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else None
+            result['rps_per_cpu_second'] = round(served / cpu, 1) if cpu else None
+            results[name] = result
+            print(f'{mode:<6} {name:<14} {result["throughput_rps"]:>8} req/s  '
+                  f'{result["rps_per_worker"]:>8}/worker  {result["rps_per_cpu_second"]}/cpu-s  '
+                  f'p50 {result["p50_ms"]} ms  p95 {result["p95_ms"]} ms  '
+                  f'errors {result["errors"]}', file=sys.stderr)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.serving')
+    parser.add_argument('--database', default='sqlite:////tmp/fyyur-bench.db',
+                        help='Database to seed and serve from; it is dropped and recreated.')
+    parser.add_argument('--scale', type=float, default=1)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=1, help='Server processes per mode.')
+    parser.add_argument('--threads', type=int, default=8, help='Threads per sync worker.')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=1000, help='Measured requests per route.')
+    parser.add_argument('--warmup', type=int, default=50, help='Unmeasured requests per route.')
+    parser.add_argument('--routes', default=ROUTES, help='Comma-separated route names.')
+    parser.add_argument('--modes', default='sync,async')
+    parser.add_argument('--out', help='Write the JSON results here instead of stdout.')
+    args = parser.parse_args(argv)
+
+    app = load.load_app(args.database)
+    print(f'Seeding scale {args.scale} into {args.database} ...', file=sys.stderr)
+    ids = load.seed(app, args.scale, args.seed, disposable=1)
+
+    results = {mode: measure(mode, args, ids) for mode in args.modes.split(',')}
+    if 'sync' in results and 'async' in results:
+        for name, sync in results['sync'].items():
+            new = results['async'].get(name)
+            if new and sync['rps_per_cpu_second'] and new['rps_per_cpu_second']:
+                print(f'{name:<14} async/sync requests per CPU second: '
+                      f'{new["rps_per_cpu_second"] / sync["rps_per_cpu_second"]:.2f}x', file=sys.stderr)
+
+    output = {
+        'meta': {
+            'commit': load._git_commit(),
+            'database': args.database.split(':', 1)[0],
+            'scale': args.scale,
+            'workers': args.workers,
+            'threads': args.threads,
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'cpus': os.cpu_count(),
+        },
+        'modes': results,
+    }
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, 'w') as f:
+            json.dump(output, f, indent=2)
+    else:
+        json.dump(output, sys.stdout, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import select
+
+from models import db, Show
+import dates
+import metrics
+import replicas
+
+logger = logging.getLogger(__name__)
+
+#----------------------------------------------------------------------------#
+# Page payload cache.
+#
+# Venue and artist detail pages are cached as the dict handed to the
+# template, under "venue:<id>" and "artist:<id>". Writes evict exactly the
+# pages they change: a venue's own page plus the pages of artists who have
+# shows there (they render its name and image), and the same the other way
+# round for artists.
+#
+# The default LRU backend is per process, so a write evicts only from the
+# worker that handled it. Every payload therefore keeps the version it was
+# built at (see conditional.py), and a hit counts only while that is still
+# the database's: other workers rebuild the page after one validator query
+# instead of serving it stale for CACHE_TTL, or answering 304 for it.
+#
+# With read replicas, an evicted key is replaced by a tombstone for the
+# replica lag window instead, and a page read from a replica is not cached
+# over it: the replica may not have the write yet, and caching its copy
+# would keep the stale page around for the full TTL.
+#----------------------------------------------------------------------------#
+
+TOMBSTONE = '<evicted>'
+
+
+class LRUCache:
+    # In-process cache, bounded by entry count, with a TTL per entry.
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def size(self):
+        return len(self._entries)
+
+
+class RedisCache:
+    # Shared cache on a Redis server, so every worker sees the same entries
+    # and evictions. Connection errors count as misses rather than failing
+    # the page.
+    def __init__(self, url, prefix='fyyur:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('CACHE_BACKEND=redis needs the redis package installed')
+        self._errors = redis.RedisError
+        self._client = redis.Redis.from_url(url)
+        self._prefix = prefix
+        self.evictions = 0
+
+    def get(self, key):
+        try:
+            raw = self._client.get(self._prefix + key)
+        except self._errors:
+            logger.warning('Redis cache read failed', exc_info=True)
+            return None
+        return pickle.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl):
+        try:
+            self._client.set(self._prefix + key, pickle.dumps(value),
+                             px=max(1, int(ttl * 1000)))
+        except self._errors:
+            logger.warning('Redis cache write failed', exc_info=True)
+
+    def delete(self, keys):
+        if not keys:
+            return
+        try:
+            self._client.delete(*[self._prefix + key for key in keys])
+        except self._errors:
+            logger.warning('Redis cache delete failed', exc_info=True)
+
+    def size(self):
+        return None
+
+
+class NullCache:
+    evictions = 0
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl):
+        pass
+
+    def delete(self, keys):
+        pass
+
+    def size(self):
+        return 0
+
+
+class PageCache:
+    def __init__(self):
+        self.backend = NullCache()
+        self.default_ttl = 0
+        self.tombstone_ttl = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        name = app.config['CACHE_BACKEND']
+        if name == 'redis':
+            self.backend = RedisCache(app.config['CACHE_REDIS_URL'])
+        elif name == 'lru':
+            self.backend = LRUCache(app.config['CACHE_MAX_ENTRIES'])
+        elif name == 'null':
+            self.backend = NullCache()
+        else:
+            raise ValueError(f'Unknown CACHE_BACKEND {name!r}')
+        self.default_ttl = app.config['CACHE_TTL']
+        if app.config['DATABASE_REPLICA_URLS']:
+            self.tombstone_ttl = app.config['REPLICA_LAG_WINDOW']
+
+    def get(self, key, version):
+        # A payload built at any version but the current one is a miss; see
+        # above. `version` is None when the validator query failed.
+        value = self.backend.get(key)
+        if value == TOMBSTONE:
+            value = None
+        elif value is not None and (version is None or value.get('version') != version):
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        metrics.CACHE_LOOKUPS.labels('miss' if value is None else 'hit').inc()
+        return value
+
+    def set(self, key, value, expires_at=None):
+        # `expires_at` is when the payload goes stale on its own, e.g. when
+        # the next upcoming show starts and moves into the past.
+        ttl = self.default_ttl
+        if expires_at is not None:
+            ttl = min(ttl, (expires_at - dates.now()).total_seconds())
+        if ttl <= 0:
+            return
+        if replicas.reading_replica() and self.backend.get(key) == TOMBSTONE:
+            return
+        self.backend.set(key, value, ttl)
+
+    def delete(self, keys):
+        if not self.tombstone_ttl:
+            self.backend.delete(list(keys))
+            return
+        for key in keys:
+            self.backend.set(key, TOMBSTONE, self.tombstone_ttl)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "pid": os.getpid(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else None,
+            "entries": self.backend.size(),
+            "evictions": self.backend.evictions,
+        }
+
+
+page_cache = PageCache()
+
+
+def venue_key(venue_id):
+    return f'venue:{venue_id}'
+
+
+def artist_key(artist_id):
+    return f'artist:{artist_id}'
+
+
+def venue_keys(venue_id):
+    # A venue's page and the pages of every artist with a show there. Call
+    # before the write commits (deleted shows can no longer be looked up)
+    # and evict after it, so a concurrent reader cannot re-cache old data.
+    artist_ids = db.session.execute(
+        select(Show.artist_id).where(Show.venue_id == venue_id).distinct()).scalars()
+    return [venue_key(venue_id)] + [artist_key(a) for a in artist_ids]
+
+
+def artist_keys(artist_id):
+    venue_ids = db.session.execute(
+        select(Show.venue_id).where(Show.artist_id == artist_id).distinct()).scalars()
+    return [artist_key(artist_id)] + [venue_key(v) for v in venue_ids]
@@ -0,0 +1,79 @@
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+#----------------------------------------------------------------------------#
+# Response compression.
+#
+# HTML pages, JSON and other text responses of at least COMPRESS_MIN_SIZE
+# bytes are sent compressed with brotli or gzip, whichever the client's
+# Accept-Encoding rates higher (brotli wins ties and needs the brotli
+# package). Below the threshold the saving does not pay for the CPU.
+#
+# Left alone: responses that already have a Content-Encoding (the
+# precompressed /assets/ bundles), streamed ones (the exports, which gzip
+# themselves when asked to) and anything marked Cache-Control: no-transform.
+#----------------------------------------------------------------------------#
+
+COMPRESSIBLE = {
+    'application/json',
+    'application/javascript',
+    'application/x-ndjson',
+    'application/xml',
+    'image/svg+xml',
+}
+
+
+def _compressible(response):
+    if response.status_code < 200 or response.status_code >= 300 or response.status_code in (204, 206):
+        return False
+    if response.direct_passthrough or response.is_streamed:
+        return False
+    if 'Content-Encoding' in response.headers or response.cache_control.no_transform:
+        return False
+    mimetype = response.mimetype or ''
+    return mimetype.startswith('text/') or mimetype in COMPRESSIBLE
+
+
+def _encodings():
+    # In order of preference.
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def compress(data, encoding, config):
+    if encoding == 'br':
+        return brotli.compress(data, quality=config['COMPRESS_BROTLI_QUALITY'])
+    return gzip.compress(data, compresslevel=config['COMPRESS_GZIP_LEVEL'], mtime=0)
+
+
+def init_app(app):
+    # Call before the other extensions: after_request hooks run in reverse
+    # order of registration, so this one sees every body in its final form.
+    if not app.config['COMPRESS']:
+        return
+
+    @app.after_request
+    def compress_response(response):
+        if not _compressible(response):
+            return response
+        data = response.get_data()
+        if len(data) < app.config['COMPRESS_MIN_SIZE']:
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(_encodings())
+        if encoding is None:
+            return response
+        response.set_data(compress(data, encoding, app.config))
+        response.headers['Content-Encoding'] = encoding
+        # The compressed bytes are a different representation, so a strong
+        # validator no longer applies to them.
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,126 @@
+import hashlib
+import logging
+import os
+from collections import namedtuple
+
+from flask import current_app, g, request, session
+from flask.globals import request_ctx
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db
+import dates
+
+logger = logging.getLogger(__name__)
+
+#----------------------------------------------------------------------------#
+# Conditional GET for the listings and detail pages.
+#
+# Before rendering, a view runs a small validator query: the listings select
+# the keys and updated_at of the rows on the requested page, and the detail
+# pages the updated_at of their own row, which every write to the page
+# moves (see models.touch_partners). Those rows hash into a weak ETag, and
+# the newest updated_at is the Last-Modified. A request
+# whose If-None-Match or If-Modified-Since still matches gets a 304 and the
+# page queries and template never run.
+#
+# updated_at moves on every UPDATE, counter changes included, so a show
+# passing into the past or a venue being deleted changes the ETags of the
+# pages that list it. The tag also covers the visitor's date preferences
+# and the templates and asset bundles the process started with.
+#
+# A page that carries flashed messages is never answered with 304, and
+# never given an ETag.
+#----------------------------------------------------------------------------#
+
+Version = namedtuple('Version', 'etag last_modified')
+
+
+def version(rows):
+    # Validator rows -> Version. Columns named *updated_at feed
+    # Last-Modified; everything else only the tag.
+    rows = [tuple(row._mapping.items()) for row in rows]
+    modified = [value for row in rows for key, value in row
+                if key.endswith('updated_at') and value is not None]
+    etag = hashlib.sha256(repr(rows).encode()).hexdigest()[:32]
+    return Version(etag, max(modified, default=None))
+
+
+def enabled():
+    return (current_app.config['CONDITIONAL_GET'] and request.method in ('GET', 'HEAD')
+            and '_flashes' not in session)
+
+
+def page_version(stmt):
+    # Runs a validator query on the request's session. None when disabled or
+    # when the query fails; the page is then rendered as usual.
+    if not enabled():
+        return None
+    return current_version(stmt)
+
+
+def current_version(stmt):
+    # page_version() whether or not conditional GET is on; the detail views
+    # also check their cached payloads against it.
+    try:
+        return version(db.session.execute(stmt).all())
+    except SQLAlchemyError:
+        logger.warning('Validator query failed for %s', request.endpoint, exc_info=True)
+        db.session.rollback()
+        return None
+
+
+def _build_version(app):
+    # Changes whenever a template or the asset manifest does.
+    digest = hashlib.sha256()
+    for folder in (app.template_folder, os.path.join(app.static_folder, 'dist')):
+        folder = os.path.join(app.root_path, folder)
+        for root, dirs, files in os.walk(folder):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith(('.html', '.json')):
+                    with open(os.path.join(root, name), 'rb') as f:
+                        digest.update(name.encode() + f.read())
+    return digest.hexdigest()[:16]
+
+
+def _etag(page_version):
+    key = (current_app.extensions['conditional_build'], dates.preferences(), page_version.etag)
+    return hashlib.sha256(repr(key).encode()).hexdigest()[:32]
+
+
+def _set_validators(response, page_version):
+    response.set_etag(_etag(page_version), weak=True)
+    if page_version.last_modified is not None:
+        response.last_modified = page_version.last_modified
+    # Revalidate on every use; the dates a page shows depend on cookies.
+    response.cache_control.no_cache = True
+    response.vary.update(('Cookie', 'Accept-Language'))
+
+
+def not_modified(page_version):
+    # A 304 for the view to return if the client's copy is current, else
+    # None, with the validators remembered for the rendered response.
+    if page_version is None or not enabled():
+        return None
+    response = current_app.response_class(status=200)
+    _set_validators(response, page_version)
+    response.make_conditional(request.environ)
+    if response.status_code == 304:
+        return response
+    g.page_version = page_version
+    return None
+
+
+def init_app(app):
+    app.extensions['conditional_build'] = _build_version(app)
+
+    @app.after_request
+    def add_validators(response):
+        page_version = g.pop('page_version', None)
+        if page_version is None or response.status_code != 200:
+            return response
+        # Messages flashed while the page was built are in it now.
+        if request_ctx.flashes or '_flashes' in session:
+            return response
+        _set_validators(response, page_version)
+        return response
@@ -9,5 +9,97 @@ DEBUG = True
 # Connect to the database
 
 
-# TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = 'postgresql://prashidi@localhost:5432/fyyurdb'
+SQLALCHEMY_DATABASE_URI = os.environ.get(
+    'DATABASE_URL', 'postgresql://prashidi@localhost:5432/fyyurdb')
+# Some hosts still hand out the deprecated postgres:// scheme
+if SQLALCHEMY_DATABASE_URI.startswith('postgres://'):
+    SQLALCHEMY_DATABASE_URI = 'postgresql://' + SQLALCHEMY_DATABASE_URI[len('postgres://'):]
+
+# Read replicas, comma separated; GET requests are served from these
+DATABASE_REPLICA_URLS = [url for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url]
+SQLALCHEMY_BINDS = {f'replica_{i}': url for i, url in enumerate(DATABASE_REPLICA_URLS)}
+# Seconds after a write during which the writer reads from the primary
+REPLICA_LAG_WINDOW = int(os.environ.get('REPLICA_LAG_WINDOW', 5))
+
+# Connection pool, per worker process (see pool.py)
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 5))
+# Seconds to wait for a free connection before failing the request
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))
+# Replace connections older than this many seconds
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+# Test each connection on checkout so ones dropped by a failover are replaced
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') == '1'
+# Milliseconds before Postgres cancels a statement; 0 disables
+DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT', 30000))
+# Set when connecting through PgBouncer in transaction pooling mode
+DB_PGBOUNCER = os.environ.get('DB_PGBOUNCER', '0') == '1'
+
+# Number of rows rendered per page on the paginated listings
+PAGE_SIZE = int(os.environ.get('PAGE_SIZE', 50))
+# Upper bound on ?limit= so no request can ask for an unbounded page
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', 200))
+# Search result counts stop at this many matches and render as "N+"
+SEARCH_COUNT_CAP = int(os.environ.get('SEARCH_COUNT_CAP', 1000))
+
+# Detail page cache: 'lru' (per process; hits are checked against the database), 'redis' (shared) or 'null'
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'lru')
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 10000))
+# Seconds a cached page may be served before it is rebuilt
+CACHE_TTL = int(os.environ.get('CACHE_TTL', 300))
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+# The JSON API allows larger pages than the HTML views
+API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', 500))
+
+# Requests slower than this are logged with their SQL stats (see instrumentation.py)
+SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', 500))
+# Append a per-request SQL panel to HTML pages
+SQL_DEBUG_PANEL = os.environ.get('SQL_DEBUG_PANEL', '0') == '1'
+# The panel flags statements run more than this many times in one request
+N_PLUS_ONE_THRESHOLD = int(os.environ.get('N_PLUS_ONE_THRESHOLD', 3))
+
+# Show times are stored without a zone, in this one
+SHOW_TIMEZONE = os.environ.get('SHOW_TIMEZONE', 'UTC')
+# Locales dates can be rendered in, picked per visitor (see dates.py)
+SUPPORTED_LOCALES = os.environ.get('SUPPORTED_LOCALES', 'en,en-GB,de,fr,es').split(',')
+DEFAULT_LOCALE = os.environ.get('DEFAULT_LOCALE', 'en')
+
+# Serve the built asset bundles when static/dist/manifest.json exists (see assets.py)
+STATIC_BUNDLES = os.environ.get('STATIC_BUNDLES', '1') == '1'
+
+# How stale the upcoming/past show counters may get before a request rolls
+# them over (see counters.py)
+COUNTER_ROLLOVER_SECONDS = int(os.environ.get('COUNTER_ROLLOVER_SECONDS', 60))
+
+# Compress text responses of at least COMPRESS_MIN_SIZE bytes (see compression.py)
+COMPRESS = os.environ.get('COMPRESS', '1') == '1'
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 4))
+# ETag/Last-Modified and 304s on the listings and detail pages (see conditional.py)
+CONDITIONAL_GET = os.environ.get('CONDITIONAL_GET', '1') == '1'
+
+# Image thumbnails (see thumbnails.py); needs Pillow
+THUMBNAILS = os.environ.get('THUMBNAILS', '1') == '1'
+THUMBNAIL_DIR = os.environ.get('THUMBNAIL_DIR', os.path.join(basedir, 'thumbnails'))
+THUMBNAIL_CACHE_MAX_BYTES = int(os.environ.get('THUMBNAIL_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+# Larger source images are not fetched
+THUMBNAIL_MAX_SOURCE_BYTES = int(os.environ.get('THUMBNAIL_MAX_SOURCE_BYTES', 10 * 1024 * 1024))
+THUMBNAIL_FETCH_WORKERS = int(os.environ.get('THUMBNAIL_FETCH_WORKERS', 4))
+THUMBNAIL_FETCH_TIMEOUT = int(os.environ.get('THUMBNAIL_FETCH_TIMEOUT', 10))
+# Seconds before a failed source is tried again
+THUMBNAIL_RETRY_SECONDS = int(os.environ.get('THUMBNAIL_RETRY_SECONDS', 3600))
+THUMBNAIL_MAX_AGE = int(os.environ.get('THUMBNAIL_MAX_AGE', 30 * 24 * 3600))
+# Allow fetching from loopback and private networks, e.g. in development
+THUMBNAIL_ALLOW_PRIVATE = os.environ.get('THUMBNAIL_ALLOW_PRIVATE', '0') == '1'
+
+# Faceted browsing at /venues/browse and /artists/browse (see facets.py).
+# Counts lag the database by about FACET_REFRESH_SECONDS
+FACET_REFRESH_SECONDS = int(os.environ.get('FACET_REFRESH_SECONDS', 10))
+# Rebuild the index from scratch this often, or when a refresh finds more changed rows
+FACET_REBUILD_SECONDS = int(os.environ.get('FACET_REBUILD_SECONDS', 3600))
+FACET_DELTA_LIMIT = int(os.environ.get('FACET_DELTA_LIMIT', 10000))
+# A refresh rereads rows updated this long before the newest one it has seen
+FACET_DELTA_OVERLAP_SECONDS = int(os.environ.get('FACET_DELTA_OVERLAP_SECONDS', 60))
+# Cities beyond the most common ones get no facet value
+FACET_CITY_LIMIT = int(os.environ.get('FACET_CITY_LIMIT', 200))
@@ -0,0 +1,178 @@
+import logging
+from datetime import timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import case, func, insert, select, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, Venue, Artist, Show, ShowCounter
+import dates
+
+logger = logging.getLogger(__name__)
+
+#----------------------------------------------------------------------------#
+# Upcoming and past show counters.
+#
+# Venues and artists carry upcoming_shows_count and past_shows_count, so the
+# views read counts straight off the row. They are correct as of the time in
+# show_counters.as_of: shows starting at or after it are upcoming.
+#
+# Adding a show or deleting a venue adjusts the counters in the same
+# transaction. Time passing is handled by rollover(), which moves shows that
+# started between the old and the new as_of from upcoming to past with one
+# grouped UPDATE per table. Views call current(), which rolls over lazily
+# once the counters are COUNTER_ROLLOVER_SECONDS old; `flask counters
+# rollover` can also run from cron so no request pays for it. Bulk loads
+# bypass the write hooks and end with rebuild().
+#----------------------------------------------------------------------------#
+
+OWNERS = ((Venue, Show.venue_id), (Artist, Show.artist_id))
+
+_as_of = None
+
+
+def _counts(owner, as_of):
+    return (
+        select(
+            owner.label('owner_id'),
+            func.sum(case((Show.start_time >= as_of, 1), else_=0)).label('upcoming'),
+            func.count().label('total'),
+        )
+        .group_by(owner)
+    )
+
+
+def rebuild(now=None):
+    """Recount every venue's and artist's shows from scratch."""
+    global _as_of
+    now = now or dates.now()
+    with db.engine.begin() as connection:
+        # Moving as_of first takes the row lock the write hooks wait on.
+        moved = connection.execute(
+            update(ShowCounter).where(ShowCounter.id == 1).values(as_of=now))
+        if moved.rowcount == 0:
+            connection.execute(insert(ShowCounter).values(id=1, as_of=now))
+        for model, owner in OWNERS:
+            counts = _counts(owner, now).subquery()
+            connection.execute(update(model).values(upcoming_shows_count=0, past_shows_count=0))
+            connection.execute(
+                update(model).where(model.id == counts.c.owner_id).values(
+                    upcoming_shows_count=counts.c.upcoming,
+                    past_shows_count=counts.c.total - counts.c.upcoming))
+    _as_of = now
+    return now
+
+
+def rollover(now=None, min_age=timedelta(0)):
+    """Advance the counters to `now` unless they are newer than `min_age`."""
+    global _as_of
+    now = now or dates.now()
+    with db.engine.connect() as connection:
+        as_of = connection.execute(select(ShowCounter.as_of).where(ShowCounter.id == 1)).scalar()
+    if as_of is None:
+        return rebuild(now)
+    with db.engine.begin() as connection:
+        if now - as_of <= min_age:
+            _as_of = as_of
+            return as_of
+        # Compare-and-set, so of several processes rolling over at once
+        # only one applies the shift.
+        claimed = connection.execute(
+            update(ShowCounter)
+            .where(ShowCounter.id == 1, ShowCounter.as_of == as_of)
+            .values(as_of=now))
+        if claimed.rowcount == 0:
+            now = connection.execute(
+                select(ShowCounter.as_of).where(ShowCounter.id == 1)).scalar()
+        else:
+            for model, owner in OWNERS:
+                started = (
+                    select(owner.label('owner_id'), func.count().label('n'))
+                    .where(Show.start_time >= as_of, Show.start_time < now)
+                    .group_by(owner)
+                    .subquery()
+                )
+                connection.execute(
+                    update(model).where(model.id == started.c.owner_id).values(
+                        upcoming_shows_count=model.upcoming_shows_count - started.c.n,
+                        past_shows_count=model.past_shows_count + started.c.n))
+    _as_of = now
+    return now
+
+
+def _interval():
+    return timedelta(seconds=current_app.config['COUNTER_ROLLOVER_SECONDS'])
+
+
+def fresh():
+    # This process's as_of if it needs no rollover yet, else None. Never
+    # touches the database.
+    if _as_of is not None and dates.now() - _as_of < _interval():
+        return _as_of
+    return None
+
+
+def current():
+    # The time the counters are correct as of; views split show lists at it
+    # so lists and counts agree. Call before the request's first query: on
+    # SQLite an open read transaction would block the rollover's write.
+    as_of = fresh()
+    if as_of is not None:
+        return as_of
+    try:
+        return rollover(dates.now(), min_age=_interval())
+    except SQLAlchemyError:
+        logger.warning('Show counter rollover failed', exc_info=True)
+        return _as_of or dates.now()
+
+
+#  Write hooks
+#  ----------------------------------------------------------------
+
+def _locked_as_of():
+    # Row-locked, so a rollover cannot pass a show this transaction adds or
+    # removes before it commits. None until the counters are initialised.
+    return db.session.execute(
+        select(ShowCounter.as_of).where(ShowCounter.id == 1).with_for_update()).scalar()
+
+
+def show_added(venue_id, artist_id, start_time):
+    as_of = _locked_as_of()
+    if as_of is None:
+        return
+    column = 'upcoming_shows_count' if start_time >= as_of else 'past_shows_count'
+    for model, owner_id in ((Venue, venue_id), (Artist, artist_id)):
+        db.session.execute(update(model).where(model.id == owner_id).values(
+            {column: getattr(model, column) + 1}))
+
+
+def venue_removed(venue_id):
+    # Call before deleting the venue; its shows are deleted with it.
+    as_of = _locked_as_of()
+    if as_of is None:
+        return
+    counts = _counts(Show.artist_id, as_of).where(Show.venue_id == venue_id).subquery()
+    db.session.execute(update(Artist).where(Artist.id == counts.c.owner_id).values(
+        upcoming_shows_count=Artist.upcoming_shows_count - counts.c.upcoming,
+        past_shows_count=Artist.past_shows_count - (counts.c.total - counts.c.upcoming)))
+
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+counters_cli = AppGroup('counters', help='Maintain the upcoming/past show counters.')
+
+
+@counters_cli.command('rollover')
+def rollover_command():
+    """Move shows that have started since the last rollover into the past."""
+    click.echo(f'Counters are correct as of {rollover()}.')
+
+
+@counters_cli.command('rebuild')
+def rebuild_command():
+    """Recount all shows, e.g. after a bulk load."""
+    click.echo(f'Counters rebuilt as of {rebuild()}.')
@@ -0,0 +1,96 @@
+from datetime import datetime
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import babel
+import babel.dates
+import dateutil.parser
+from flask import current_app, g, has_request_context, request
+from jinja2 import pass_context
+
+#----------------------------------------------------------------------------#
+# Date formatting for templates.
+#
+# Views hand the templates datetime objects. The `datetime` filter resolves
+# a babel pattern and Locale once per (format, locale) and then formats each
+# distinct (time, format, locale, timezone) once, which on listings where
+# many shows share a start time turns most calls into a cache lookup.
+# benchmarks/datetime_format.py measures it against the old filter.
+#
+# Stored times are naive and in SHOW_TIMEZONE, and now() is the wall time
+# they are compared with. A visitor's locale comes from the "locale" cookie
+# or Accept-Language (limited to SUPPORTED_LOCALES) and their timezone from
+# the "tz" cookie; both are set by /preferences.
+#----------------------------------------------------------------------------#
+
+FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+
+@lru_cache(maxsize=64)
+def _formatter(format, locale):
+    return babel.dates.parse_pattern(FORMATS.get(format, format)), babel.Locale.parse(locale)
+
+
+@lru_cache(maxsize=None)
+def timezone(name):
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+@lru_cache(maxsize=8192)
+def _format(value, format, locale, source_zone, target_zone):
+    pattern, locale = _formatter(format, locale)
+    if target_zone != source_zone:
+        value = value.replace(tzinfo=timezone(source_zone)).astimezone(timezone(target_zone))
+    return pattern.apply(value, locale)
+
+
+def now():
+    # The current time in SHOW_TIMEZONE, naive like the stored start times,
+    # whatever the host's own time zone is.
+    zone = timezone(current_app.config['SHOW_TIMEZONE']) or timezone('UTC')
+    return datetime.now(zone).replace(tzinfo=None)
+
+
+def preferences():
+    # (locale, stored timezone, display timezone) for the current visitor,
+    # resolved once per request.
+    config = current_app.config
+    if not has_request_context():
+        return config['DEFAULT_LOCALE'], config['SHOW_TIMEZONE'], config['SHOW_TIMEZONE']
+    if 'date_preferences' not in g:
+        supported = config['SUPPORTED_LOCALES']
+        locale = request.cookies.get('locale')
+        if locale not in supported:
+            locale = request.accept_languages.best_match(supported) or config['DEFAULT_LOCALE']
+        zone = request.cookies.get('tz')
+        if not zone or timezone(zone) is None:
+            zone = config['SHOW_TIMEZONE']
+        g.date_preferences = (locale.replace('-', '_'), config['SHOW_TIMEZONE'], zone)
+    return g.date_preferences
+
+
+def format_datetime(value, format='medium', prefs=None):
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            value = dateutil.parser.parse(value)
+    return _format(value, format, *(prefs or preferences()))
+
+
+@pass_context
+def datetime_filter(context, value, format='medium'):
+    # The preferences ride in the template context, so a listing with
+    # thousands of dates does not go through Flask's context locals for each.
+    return format_datetime(value, format, context.get('date_preferences'))
+
+
+def init_app(app):
+    app.jinja_env.filters['datetime'] = datetime_filter
+    app.context_processor(lambda: {'date_preferences': preferences()})
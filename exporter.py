@@ -0,0 +1,214 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+
+import click
+from flask import Blueprint, Response, abort, request, stream_with_context
+from flask.cli import with_appcontext
+from sqlalchemy import func, select
+
+from models import db, Genre, Venue, Venue_Genre, Artist, Artist_Genre, Show
+from importer import VENUE_FIELDS, ARTIST_FIELDS
+import queries
+
+#----------------------------------------------------------------------------#
+# Streaming export.
+#
+#   GET /export/<shows|venues|artists>?format=csv|ndjson&gzip=1
+#   flask export <shows|venues|artists> [-o FILE]
+#
+# Rows are read through a server-side cursor (yield_per) and encoded into
+# ~64KB chunks as they arrive, so memory use does not grow with the export.
+# Filters: from/to (show start time, "to" exclusive), venue_id, artist_id,
+# city and genre (see queries.parse_show_filters). For venues and artists the
+# show filters select those with a matching show. Venue and artist exports
+# use the importer's columns, with genres joined by ";" in CSV, so a file can
+# be loaded back with `flask import`.
+#----------------------------------------------------------------------------#
+
+export = Blueprint('export', __name__, url_prefix='/export')
+
+BATCH_SIZE = 1000
+CHUNK_SIZE = 64 * 1024
+
+MIMETYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+
+#  Statements
+#  ----------------------------------------------------------------
+
+def _genres(genre_model, owner_id):
+    # One ";"-joined string per row, from a correlated subquery on the
+    # indexed owner column, so genres do not multiply the exported rows.
+    if db.engine.dialect.name == 'postgresql':
+        joined = func.string_agg(Genre.name, ';')
+    else:
+        joined = func.group_concat(Genre.name, ';')
+    owner = getattr(genre_model, genre_model.owner_key)
+    return (
+        select(joined)
+        .join(genre_model, genre_model.genre_id == Genre.id)
+        .where(owner == owner_id)
+        .scalar_subquery()
+    )
+
+
+def shows_statement(filters):
+    return queries.filter_shows(queries.show_listing(), filters).order_by(*queries.SHOW_LISTING_ORDER)
+
+
+def _owner_statement(model, genre_model, fields, filters):
+    own_key = genre_model.owner_key
+    stmt = select(
+        model.id,
+        *[getattr(model, column) for column in fields],
+        _genres(genre_model, model.id).label('genres'),
+    )
+    if filters.get(own_key) is not None:
+        stmt = stmt.where(model.id == filters[own_key])
+    if filters.get('city'):
+        stmt = stmt.where(model.city == filters['city'])
+    conditions = queries.show_conditions({k: v for k, v in filters.items() if k != own_key})
+    if conditions:
+        stmt = stmt.where(model.id.in_(select(getattr(Show, own_key)).where(*conditions)))
+    return stmt.order_by(model.id)
+
+
+def venues_statement(filters):
+    return _owner_statement(Venue, Venue_Genre, VENUE_FIELDS, filters)
+
+
+def artists_statement(filters):
+    return _owner_statement(Artist, Artist_Genre, ARTIST_FIELDS, filters)
+
+
+KINDS = {
+    'shows': shows_statement,
+    'venues': venues_statement,
+    'artists': artists_statement,
+}
+
+
+#  Encoding
+#  ----------------------------------------------------------------
+
+def _csv_chunks(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def _ndjson_chunks(columns, rows):
+    lines = []
+    size = 0
+    for row in rows:
+        item = dict(zip(columns, row))
+        if 'genres' in item:
+            item['genres'] = item['genres'].split(';') if item['genres'] else []
+        line = json.dumps(item, default=_default, separators=(',', ':'))
+        lines.append(line)
+        size += len(line) + 1
+        if size >= CHUNK_SIZE:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+            size = 0
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+ENCODERS = {'csv': _csv_chunks, 'ndjson': _ndjson_chunks}
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_chunks(kind, fmt, filters, compress=False):
+    # Generator of encoded bytes. The session is closed when it finishes or
+    # is closed early, e.g. by a client disconnecting mid-download.
+    try:
+        result = db.session.execute(KINDS[kind](filters).execution_options(yield_per=BATCH_SIZE))
+        chunks = (chunk.encode('utf-8') for chunk in ENCODERS[fmt](list(result.keys()), result))
+        if compress:
+            chunks = _gzip(chunks)
+        yield from chunks
+    finally:
+        db.session.close()
+
+
+#----------------------------------------------------------------------------#
+# Endpoints.
+#----------------------------------------------------------------------------#
+
+@export.route('/<kind>')
+def download(kind):
+    if kind not in KINDS:
+        abort(404)
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ENCODERS:
+        abort(400, 'format must be csv or ndjson')
+    try:
+        filters = queries.parse_show_filters(request.args)
+    except ValueError as e:
+        abort(400, str(e))
+    compress = request.args.get('gzip') in ('1', 'true', 'yes')
+
+    filename = f'{kind}.{fmt}' + ('.gz' if compress else '')
+    return Response(
+        stream_with_context(export_chunks(kind, fmt, filters, compress)),
+        mimetype='application/gzip' if compress else MIMETYPES[fmt],
+        headers={'Content-Disposition': f'attachment; filename={filename}'},
+    )
+
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+@click.command('export')
+@click.argument('kind', type=click.Choice(sorted(KINDS)))
+@click.option('-o', '--output', default='-', type=click.Path(allow_dash=True, dir_okay=False),
+              help='File to write; "-" for stdout.')
+@click.option('--format', 'fmt', type=click.Choice(sorted(ENCODERS)),
+              help='Output format; defaults to the file extension, else csv.')
+@click.option('--gzip/--no-gzip', 'compress', default=None,
+              help='Compress the output; defaults to on for *.gz files.')
+@click.option('--from', 'start', type=click.DateTime(), help='Shows starting at or after this time.')
+@click.option('--to', 'end', type=click.DateTime(), help='Shows starting before this time.')
+@click.option('--venue-id', type=int)
+@click.option('--artist-id', type=int)
+@click.option('--city')
+@click.option('--genre', help='Shows by artists of this genre.')
+@with_appcontext
+def export_command(kind, output, fmt, compress, start, end, venue_id, artist_id, city, genre):
+    """Stream shows, venues or artists out as CSV or NDJSON."""
+    if fmt is None:
+        fmt = 'ndjson' if '.ndjson' in output or '.jsonl' in output else 'csv'
+    if compress is None:
+        compress = output.endswith('.gz')
+    filters = {'start': start, 'end': end, 'venue_id': venue_id,
+               'artist_id': artist_id, 'city': city, 'genre': genre}
+
+    with click.open_file(output, 'wb') as stream:
+        for chunk in export_chunks(kind, fmt, filters, compress):
+            stream.write(chunk)
@@ -0,0 +1,449 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from flask import abort, current_app, url_for
+from sqlalchemy import func, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, Genre, Venue, Venue_Genre, Artist, Artist_Genre
+import pagination
+
+logger = logging.getLogger(__name__)
+
+#----------------------------------------------------------------------------#
+# Faceted browsing.
+#
+# /venues/browse and /artists/browse narrow the listing by genre, city,
+# state, whether the venue is seeking talent (the artist seeking a venue)
+# and whether it has upcoming shows, and show next to every facet value how
+# many entities the selection would leave.
+#
+# The counts come from an in-memory bitmap index, one per process and kind:
+# for every facet value a Python int whose bit n is set when entity n has
+# that value. A selection is the AND of its values' bitmaps, and a count is
+# int.bit_count() of the selection ANDed with a value's bitmap, so a page
+# costs one AND and one popcount per facet value shown, whatever the mix of
+# facets. With a million entities each bitmap is 125 KB, and a few hundred
+# values fit in a few tens of MB.
+#
+# Genres combine with AND, as on the listings. The other facets hold one
+# value per entity, so choosing one value would leave the others at zero;
+# their counts are taken over the selection without that facet, and picking
+# another value replaces the choice.
+#
+# The index is built by streaming both tables once, on the first request.
+# Afterwards, when it is older than FACET_REFRESH_SECONDS, a request starts
+# a background refresh that reads back only the rows whose updated_at moved
+# (edits, new entities and counter changes all bump it) and rewrites their
+# bits. Deletions do not leave a row to read, so a refresh that finds fewer
+# rows in the table than in the index rebuilds it, as it does after
+# FACET_REBUILD_SECONDS or when more than FACET_DELTA_LIMIT rows changed.
+# Counts can therefore lag the database by about FACET_REFRESH_SECONDS.
+# The index always reads the primary, so replica lag never hides a change
+# from a refresh.
+#
+# Only the FACET_CITY_LIMIT most common cities get a bitmap; once there are
+# that many, a city that first appears between rebuilds is offered after
+# the next one.
+#----------------------------------------------------------------------------#
+
+FACETS = ('genre', 'state', 'city', 'seeking', 'upcoming')
+# One value per entity; see above.
+EXCLUSIVE = ('state', 'city', 'seeking', 'upcoming')
+
+
+class Source:
+    def __init__(self, kind, model, genre_model, seeking, seeking_label):
+        self.kind = kind
+        self.model = model
+        self.genre_model = genre_model
+        self.seeking = seeking
+        self.titles = {
+            'genre': 'Genre',
+            'state': 'State',
+            'city': 'City',
+            'seeking': seeking_label,
+            'upcoming': 'Upcoming shows',
+        }
+
+    def rows(self):
+        model = self.model
+        return select(model.id, model.state, model.city, self.seeking,
+                      model.upcoming_shows_count, model.updated_at)
+
+    def genres(self):
+        owner = getattr(self.genre_model, self.genre_model.owner_key)
+        return (select(owner, Genre.name)
+                .join(Genre, Genre.id == self.genre_model.genre_id))
+
+    def changed_rows(self, since):
+        return self.rows().where(self.model.updated_at >= since)
+
+    def changed_genres(self, since):
+        owner = getattr(self.genre_model, self.genre_model.owner_key)
+        changed = select(self.model.id).where(self.model.updated_at >= since)
+        return self.genres().where(owner.in_(changed))
+
+
+SOURCES = {
+    'venues': Source('venues', Venue, Venue_Genre, Venue.seeking_talent, 'Seeking talent'),
+    'artists': Source('artists', Artist, Artist_Genre, Artist.seeking_venue, 'Seeking a venue'),
+}
+
+
+def city_value(city, state):
+    # City names repeat across states, so a city is faceted with its state.
+    return f'{city}, {state}' if state else city
+
+
+def _yes_no(value):
+    return 'yes' if value else 'no'
+
+
+#  Bitmaps
+#  ----------------------------------------------------------------
+
+def bitmap(ids):
+    if not ids:
+        return 0
+    buffer = bytearray(max(ids) // 8 + 1)
+    for id in ids:
+        buffer[id >> 3] |= 1 << (id & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+class Builder:
+    # Collects entity ids per facet value, then turns each list into a
+    # bitmap in one go; setting bits on an int one at a time would copy it
+    # for every bit.
+    def __init__(self):
+        self.members = []
+        self.values = {facet: defaultdict(list) for facet in FACETS}
+        self.watermark = None
+
+    def add(self, id, state, city, seeking, upcoming_shows_count, updated_at):
+        self.members.append(id)
+        if state:
+            self.values['state'][state].append(id)
+        if city:
+            self.values['city'][city_value(city, state)].append(id)
+        self.values['seeking'][_yes_no(seeking)].append(id)
+        self.values['upcoming'][_yes_no(upcoming_shows_count > 0)].append(id)
+        if self.watermark is None or updated_at > self.watermark:
+            self.watermark = updated_at
+
+    def add_genre(self, id, genre):
+        self.values['genre'][genre].append(id)
+
+    def bitmaps(self, city_limit=None):
+        cities = self.values['city']
+        if city_limit is not None and len(cities) > city_limit:
+            kept = sorted(cities, key=lambda city: len(cities[city]), reverse=True)[:city_limit]
+            cities = {city: cities[city] for city in kept}
+        values = dict(self.values, city=cities)
+        members = bitmap(self.members)
+        bits = {facet: {value: bitmap(ids) for value, ids in values[facet].items()}
+                for facet in FACETS}
+        # Genre rows are read separately and can outlive their owner (an
+        # owner deleted between the two reads, or SQLite without the cascade).
+        bits['genre'] = {value: b & members for value, b in bits['genre'].items()}
+        return members, bits
+
+
+class Snapshot:
+    # Never modified once built; a refresh swaps in a new one, so requests
+    # need no lock to read it.
+    def __init__(self, members, bits, watermark, rebuilt_at=None):
+        now = time.monotonic()
+        self.members = members
+        self.bits = bits
+        # The newest updated_at seen; the next refresh reads from there.
+        self.watermark = watermark
+        self.rebuilt_at = now if rebuilt_at is None else rebuilt_at
+        self.refreshed_at = now
+        self.size = members.bit_count()
+
+    def merge(self, builder, city_limit):
+        # The rows in `builder` replace whatever bits their ids had.
+        changed, changed_bits = builder.bitmaps()
+        keep = ~changed
+        bits = {}
+        for facet in FACETS:
+            values = {value: b & keep for value, b in self.bits[facet].items()}
+            for value, b in changed_bits[facet].items():
+                if facet == 'city' and value not in values and len(values) >= city_limit:
+                    continue
+                values[value] = values.get(value, 0) | b
+            bits[facet] = {value: b for value, b in values.items() if b}
+        watermark = self.watermark
+        if builder.watermark is not None and (watermark is None or builder.watermark > watermark):
+            watermark = builder.watermark
+        return Snapshot(self.members | changed, bits, watermark, self.rebuilt_at)
+
+
+#  Index
+#  ----------------------------------------------------------------
+
+def build(connection, source, city_limit):
+    builder = Builder()
+    streamed = connection.execution_options(yield_per=10000)
+    for row in streamed.execute(source.rows()):
+        builder.add(*row)
+    for id, genre in streamed.execute(source.genres()):
+        builder.add_genre(id, genre)
+    members, bits = builder.bitmaps(city_limit)
+    return Snapshot(members, bits, builder.watermark)
+
+
+def refresh(connection, source, snapshot, config):
+    # The snapshot with the rows changed since it was taken, or None when
+    # it has to be rebuilt instead.
+    if snapshot.watermark is None:
+        return None
+    # Rows committed late, or stamped by a worker whose clock is behind,
+    # can carry an updated_at older than the watermark.
+    since = snapshot.watermark - timedelta(seconds=config['FACET_DELTA_OVERLAP_SECONDS'])
+    limit = config['FACET_DELTA_LIMIT']
+    rows = connection.execute(source.changed_rows(since).limit(limit + 1)).all()
+    if len(rows) > limit:
+        return None
+
+    builder = Builder()
+    for row in rows:
+        builder.add(*row)
+    for id, genre in connection.execute(source.changed_genres(since)):
+        builder.add_genre(id, genre)
+    updated = snapshot.merge(builder, config['FACET_CITY_LIMIT'])
+
+    total = connection.execute(select(func.count()).select_from(source.model)).scalar()
+    if total != updated.size:
+        return None
+    return updated
+
+
+class FacetIndex:
+    def __init__(self, source):
+        self.source = source
+        self.snapshot = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def _build(self, config):
+        with db.engine.connect() as connection:
+            return build(connection, self.source, config['FACET_CITY_LIMIT'])
+
+    def current(self):
+        # The latest snapshot, built on the spot the first time and
+        # refreshed in the background once it is stale.
+        app = current_app._get_current_object()
+        snapshot = self.snapshot
+        if snapshot is None:
+            with self._lock:
+                if self.snapshot is None:
+                    self.snapshot = self._build(app.config)
+                return self.snapshot
+
+        if time.monotonic() - snapshot.refreshed_at > app.config['FACET_REFRESH_SECONDS']:
+            with self._lock:
+                start = not self._refreshing
+                self._refreshing = True
+            if start:
+                threading.Thread(target=self._refresh, args=(app,), daemon=True,
+                                 name=f'facets-{self.source.kind}').start()
+        return snapshot
+
+    def _refresh(self, app):
+        try:
+            with app.app_context():
+                snapshot = self.snapshot
+                updated = None
+                if time.monotonic() - snapshot.rebuilt_at < app.config['FACET_REBUILD_SECONDS']:
+                    with db.engine.connect() as connection:
+                        updated = refresh(connection, self.source, snapshot, app.config)
+                if updated is None:
+                    updated = self._build(app.config)
+                self.snapshot = updated
+        except SQLAlchemyError:
+            logger.warning('Facet refresh failed for %s', self.source.kind, exc_info=True)
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def stats(self):
+        snapshot = self.snapshot
+        if snapshot is None:
+            return {'built': False}
+        return {
+            'built': True,
+            'entities': snapshot.size,
+            'values': {facet: len(snapshot.bits[facet]) for facet in FACETS},
+            'bytes': sum((b.bit_length() + 7) // 8 for values in snapshot.bits.values()
+                         for b in values.values()),
+            'watermark': snapshot.watermark.isoformat() if snapshot.watermark else None,
+            'refreshed_seconds_ago': round(time.monotonic() - snapshot.refreshed_at, 1),
+            'rebuilt_seconds_ago': round(time.monotonic() - snapshot.rebuilt_at, 1),
+        }
+
+
+def index(kind):
+    return current_app.extensions['facets'][kind]
+
+
+def stats():
+    return {kind: facet_index.stats()
+            for kind, facet_index in current_app.extensions['facets'].items()}
+
+
+#  Selections
+#  ----------------------------------------------------------------
+
+def selection(args):
+    # ?genre=Jazz&genre=Blues&state=CA&city=San Francisco, CA&seeking=yes
+    # &upcoming=yes as {facet: [values]}. Unknown values match nothing.
+    selected = {}
+    genres = args.getlist('genre')
+    if genres:
+        selected['genre'] = genres
+    for facet in EXCLUSIVE:
+        value = args.get(facet)
+        if value:
+            selected[facet] = [value]
+    return selected
+
+
+def matching(snapshot, selected, without=None):
+    bits = snapshot.members
+    for facet, values in selected.items():
+        if facet != without:
+            for value in values:
+                bits &= snapshot.bits[facet].get(value, 0)
+    return bits
+
+
+def counts(snapshot, selected):
+    # {facet: [(value, count)]}, most entities first, leaving out values
+    # the selection leaves empty unless they are selected.
+    matched = matching(snapshot, selected)
+    result = {}
+    for facet in FACETS:
+        base = matched
+        if facet in EXCLUSIVE and facet in selected:
+            base = matching(snapshot, selected, without=facet)
+        chosen = selected.get(facet, ())
+        values = [(value, (base & b).bit_count()) for value, b in snapshot.bits[facet].items()]
+        values = [(value, count) for value, count in values if count or value in chosen]
+        values.sort(key=lambda item: (-item[1], item[0]))
+        result[facet] = values
+    return result
+
+
+def selection_args(selected):
+    return {facet: values if facet == 'genre' else values[0]
+            for facet, values in selected.items()}
+
+
+def toggled(selected, facet, value):
+    selected = {f: list(values) for f, values in selected.items()}
+    values = selected.get(facet, [])
+    if value in values:
+        values.remove(value)
+    elif facet == 'genre':
+        values.append(value)
+    else:
+        values = [value]
+    if values:
+        selected[facet] = values
+    else:
+        selected.pop(facet, None)
+    return selected
+
+
+LABELS = {
+    'seeking': {'yes': 'Yes', 'no': 'No'},
+    'upcoming': {'yes': 'Has upcoming shows', 'no': 'No upcoming shows'},
+}
+
+
+def sidebar(endpoint, source, selected, facet_counts):
+    # What the template needs to draw each facet: labels, counts and the
+    # URL that toggles each value.
+    facets = []
+    for facet in FACETS:
+        chosen = selected.get(facet, ())
+        facets.append({
+            'name': facet,
+            'title': source.titles[facet],
+            'values': [{
+                'label': LABELS.get(facet, {}).get(value, value),
+                'count': count,
+                'selected': value in chosen,
+                'url': url_for(endpoint, kind=source.kind,
+                               **selection_args(toggled(selected, facet, value))),
+            } for value, count in facet_counts[facet]],
+        })
+    return facets
+
+
+#  Result pages
+#  ----------------------------------------------------------------
+
+def page_args(source):
+    # pagination.page_args, with the cursors reduced to the entity id.
+    after, before, limit = pagination.page_args((source.model.id,))
+    for cursor in (after, before):
+        if cursor is not None and (type(cursor[0]) is not int or cursor[0] < 0):
+            abort(400)
+    return (after[0] if after else None), (before[0] if before else None), limit
+
+
+def _ascending(bits, start, count):
+    ids = []
+    bits >>= start
+    while bits and len(ids) < count:
+        low = (bits & -bits).bit_length() - 1
+        ids.append(start + low)
+        bits >>= low + 1
+        start += low + 1
+    return ids
+
+
+def _descending(bits, end, count):
+    ids = []
+    bits &= (1 << end) - 1
+    while bits and len(ids) < count:
+        high = bits.bit_length() - 1
+        ids.append(high)
+        bits ^= 1 << high
+    ids.reverse()
+    return ids
+
+
+def id_page(bits, after=None, before=None, limit=20):
+    # One page of the ids in `bits`, in id order, as a Page of ids.
+    if before is not None:
+        ids = _descending(bits, before, limit)
+    else:
+        ids = _ascending(bits, 0 if after is None else after + 1, limit)
+    if not ids:
+        return pagination.Page([])
+    next_cursor = prev_cursor = None
+    if bits >> (ids[-1] + 1):
+        next_cursor = pagination.encode_cursor([ids[-1]])
+    if bits & ((1 << ids[0]) - 1):
+        prev_cursor = pagination.encode_cursor([ids[0]])
+    return pagination.Page(ids, next_cursor, prev_cursor)
+
+
+def entities(source, ids):
+    model = source.model
+    return (select(model.id, model.name, model.city, model.state,
+                   model.upcoming_shows_count.label('num_upcoming_shows'))
+            .where(model.id.in_(ids))
+            .order_by(model.id))
+
+
+def init_app(app):
+    app.extensions['facets'] = {kind: FacetIndex(source) for kind, source in SOURCES.items()}
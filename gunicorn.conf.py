@@ -0,0 +1,20 @@
+import glob
+import os
+
+from prometheus_client import multiprocess
+
+# Worker processes share Prometheus metrics through PROMETHEUS_MULTIPROC_DIR
+# (see metrics.py).
+
+
+def on_starting(server):
+    # Samples left over from a previous run would be added to this one's.
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        for path in glob.glob(os.path.join(directory, '*.db')):
+            os.remove(path)
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,301 @@
+import csv
+import gzip
+import io
+import json
+import sys
+import time
+from itertools import islice
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func, insert, select, text
+from werkzeug.datastructures import MultiDict
+
+from forms import VenueForm, ArtistForm, ShowForm
+from models import db, Venue, Venue_Genre, Artist, Artist_Genre, Show, genre_ids
+import counters
+import search
+
+#----------------------------------------------------------------------------#
+# Bulk import.
+#
+# `flask import <venues|artists|shows> FILE` streams a CSV or NDJSON file
+# (optionally gzipped, or "-" for stdin) in batches, so memory use does not
+# depend on the file size. Every row is validated by the same form class the
+# web handlers use; rows that fail are reported with their line number and
+# skipped. Valid rows are written with COPY on Postgres and with executemany
+# elsewhere, one transaction per batch.
+#
+# CSV files carry genres as one column separated by ";". Rows may carry an
+# explicit "id" (e.g. so shows can reference imported venues); otherwise ids
+# are allocated for the whole batch up front so genre rows can be written in
+# bulk alongside their parents.
+#----------------------------------------------------------------------------#
+
+FALSE_VALUES = {'', '0', 'false', 'f', 'no', 'n', 'off'}
+BOOLEAN_FIELDS = {'seeking_talent', 'seeking_venue'}
+
+
+class ImportKind:
+    def __init__(self, model, form_class, fields, genre_model=None, search_entity=None):
+        self.model = model
+        self.form_class = form_class
+        # Model column -> form field it is validated and read through.
+        self.fields = fields
+        self.genre_model = genre_model
+        self.search_entity = search_entity
+        self.table = model.__table__
+
+
+VENUE_FIELDS = {
+    'name': 'name', 'address': 'address', 'city': 'city', 'state': 'state',
+    'phone': 'phone', 'website': 'website_link', 'facebook_link': 'facebook_link',
+    'seeking_talent': 'seeking_talent', 'seeking_description': 'seeking_description',
+    'image_link': 'image_link',
+}
+ARTIST_FIELDS = {
+    'name': 'name', 'city': 'city', 'state': 'state', 'phone': 'phone',
+    'website': 'website_link', 'facebook_link': 'facebook_link',
+    'seeking_venue': 'seeking_venue', 'seeking_description': 'seeking_description',
+    'image_link': 'image_link',
+}
+SHOW_FIELDS = {'start_time': 'start_time', 'venue_id': 'venue_id', 'artist_id': 'artist_id'}
+
+KINDS = {
+    'venues': ImportKind(Venue, VenueForm, VENUE_FIELDS, Venue_Genre, search.VENUES),
+    'artists': ImportKind(Artist, ArtistForm, ARTIST_FIELDS, Artist_Genre, search.ARTISTS),
+    'shows': ImportKind(Show, ShowForm, SHOW_FIELDS),
+}
+
+
+#  Reading
+#  ----------------------------------------------------------------
+
+def _open(path):
+    if path == '-':
+        return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='')
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def read_rows(stream, fmt):
+    # Yields (line number, row dict) one at a time.
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            if row.get('genres'):
+                row['genres'] = [g.strip() for g in row['genres'].split(';') if g.strip()]
+            yield reader.line_num, row
+    else:
+        for line_num, line in enumerate(stream, 1):
+            if line.strip():
+                yield line_num, json.loads(line)
+
+
+def _formdata(kind, row):
+    data = MultiDict()
+    for column, field in kind.fields.items():
+        value = row.get(field, row.get(column))
+        if value is None:
+            continue
+        if field in BOOLEAN_FIELDS:
+            # BooleanField only treats "false" and "" as false.
+            value = 'y' if str(value).strip().lower() not in FALSE_VALUES else ''
+        elif field == 'start_time':
+            value = str(value).replace('T', ' ', 1)
+        data[field] = str(value)
+    for genre in row.get('genres') or []:
+        data.add('genres', genre)
+    return data
+
+
+#  Writing
+#  ----------------------------------------------------------------
+
+def _copy(table, columns, rows):
+    # COPY ... FROM STDIN through whichever psycopg the engine is using.
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(rows)
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+
+    cursor = db.session.connection().connection.driver_connection.cursor()
+    try:
+        if hasattr(cursor, 'copy_expert'):
+            buffer.seek(0)
+            cursor.copy_expert(sql, buffer)
+        else:
+            with cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+    finally:
+        cursor.close()
+
+
+def write_rows(table, columns, rows):
+    if not rows:
+        return
+    if db.engine.dialect.name == 'postgresql':
+        _copy(table.name, columns, rows)
+    else:
+        db.session.execute(insert(table), [dict(zip(columns, row)) for row in rows])
+
+
+def allocate_ids(table, count):
+    # Reserves `count` primary keys so child rows can be written in the same
+    # batch as their parents.
+    if count == 0:
+        return []
+    if db.engine.dialect.name == 'postgresql':
+        return db.session.execute(
+            text("SELECT nextval(pg_get_serial_sequence(:table, 'id')) "
+                 "FROM generate_series(1, :count)"),
+            {'table': table.name, 'count': count}).scalars().all()
+    # Elsewhere the importer is assumed to be the only writer.
+    start = db.session.execute(select(func.coalesce(func.max(table.c.id), 0))).scalar()
+    return list(range(start + 1, start + count + 1))
+
+
+def sync_sequence(table):
+    # Explicit ids bypass the sequence; move it past them.
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text(
+            "SELECT setval(pg_get_serial_sequence(:table, 'id'), "
+            f"(SELECT coalesce(max(id), 1) FROM {table.name}))"),
+            {'table': table.name})
+        db.session.commit()
+
+
+class Importer:
+    def __init__(self, kind, batch_size, echo=click.echo):
+        self.kind = kind
+        self.batch_size = batch_size
+        self.echo = echo
+        self.form = kind.form_class(formdata=None, meta={'csrf': False})
+        self.columns = ['id'] + list(kind.fields)
+        self.loaded = 0
+        self.rejected = 0
+        self.explicit_ids = False
+
+    def reject(self, line_num, errors):
+        self.rejected += 1
+        if self.rejected <= 20:
+            self.echo(f'  line {line_num}: {errors}', err=True)
+        elif self.rejected == 21:
+            self.echo('  (further rejected rows are counted but not shown)', err=True)
+
+    def validate(self, line_num, row):
+        form = self.form
+        form.process(_formdata(self.kind, row))
+        if not form.validate():
+            self.reject(line_num, form.errors)
+            return None
+        values = {column: form[field].data for column, field in self.kind.fields.items()}
+        if self.kind.model is Show:
+            values['venue_id'] = _int(values['venue_id'])
+            values['artist_id'] = _int(values['artist_id'])
+            if values['venue_id'] is None or values['artist_id'] is None:
+                self.reject(line_num, {'venue_id/artist_id': ['Must be integers.']})
+                return None
+        values['id'] = _int(row.get('id'))
+        values['genres'] = form.genres.data if 'genres' in form else []
+        return values
+
+    def check_references(self, batch):
+        # One lookup per referenced table for the whole batch.
+        venue_ids = {r['venue_id'] for _, r in batch}
+        artist_ids = {r['artist_id'] for _, r in batch}
+        venues = set(db.session.execute(select(Venue.id).where(Venue.id.in_(venue_ids))).scalars())
+        artists = set(db.session.execute(select(Artist.id).where(Artist.id.in_(artist_ids))).scalars())
+        kept = []
+        for line_num, row in batch:
+            if row['venue_id'] not in venues or row['artist_id'] not in artists:
+                self.reject(line_num, {'venue_id/artist_id': ['No such venue or artist.']})
+            else:
+                kept.append((line_num, row))
+        return kept
+
+    def load_batch(self, batch):
+        if self.kind.model is Show:
+            batch = self.check_references(batch)
+        rows = [row for _, row in batch]
+
+        missing = [row for row in rows if row['id'] is None]
+        self.explicit_ids = self.explicit_ids or len(missing) < len(rows)
+        for row, new_id in zip(missing, allocate_ids(self.kind.table, len(missing))):
+            row['id'] = new_id
+
+        write_rows(self.kind.table, self.columns, [[row[c] for c in self.columns] for row in rows])
+        if self.kind.genre_model is not None:
+            owner_key = self.kind.genre_model.owner_key
+            ids = genre_ids(genre for row in rows for genre in row['genres'])
+            write_rows(self.kind.genre_model.__table__, ['genre_id', owner_key],
+                       [[ids[genre], row['id']] for row in rows for genre in dict.fromkeys(row['genres'])])
+        db.session.commit()
+        self.loaded += len(rows)
+
+    def run(self, rows):
+        started = time.perf_counter()
+        while True:
+            chunk = list(islice(rows, self.batch_size))
+            if not chunk:
+                break
+            batch = []
+            for line_num, raw in chunk:
+                values = self.validate(line_num, raw)
+                if values is not None:
+                    batch.append((line_num, values))
+            self.load_batch(batch)
+
+            elapsed = time.perf_counter() - started
+            self.echo(f'{self.kind.table.name}: {self.loaded:,} loaded, {self.rejected:,} rejected, '
+                      f'{self.loaded / elapsed:,.0f} rows/s')
+
+        if self.explicit_ids:
+            sync_sequence(self.kind.table)
+        return time.perf_counter() - started
+
+
+def _int(value):
+    try:
+        return int(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+@click.command('import')
+@click.argument('kind', type=click.Choice(sorted(KINDS)))
+@click.argument('path', type=click.Path(allow_dash=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']),
+              help='Input format; defaults to the file extension.')
+@click.option('--batch-size', default=10000, show_default=True,
+              help='Rows validated and written per transaction.')
+@click.option('--index/--no-index', default=True, show_default=True,
+              help='Rebuild the search index for venues and artists afterwards.')
+@with_appcontext
+def import_command(kind, path, fmt, batch_size, index):
+    """Bulk-load venues, artists or shows from a CSV or NDJSON file."""
+    kind = KINDS[kind]
+    if fmt is None:
+        fmt = 'ndjson' if '.ndjson' in path or '.jsonl' in path else 'csv'
+
+    importer = Importer(kind, batch_size)
+    with _open(path) as stream:
+        elapsed = importer.run(read_rows(stream, fmt))
+
+    rate = importer.loaded / elapsed if elapsed else 0
+    click.echo(f'Imported {importer.loaded:,} {kind.table.name} in {elapsed:.1f}s '
+               f'({rate:,.0f} rows/s); {importer.rejected:,} rows rejected.')
+
+    if index and kind.search_entity is not None and importer.loaded:
+        for done in search.backend().backfill(kind.search_entity, 5000):
+            click.echo(f'search index: up to id {done}')
+        click.echo('Search index rebuilt.')
+
+    # Bulk loads skip the per-show counter updates.
+    if kind.model is Show and importer.loaded:
+        click.echo(f'Show counters rebuilt as of {counters.rebuild()}.')
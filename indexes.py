@@ -0,0 +1,193 @@
+import json
+from datetime import timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from models import db, Venue, Venue_Genre, Artist, Artist_Genre
+from pagination import keyset_query
+import api
+import dates
+import facets
+import queries
+import search
+
+#----------------------------------------------------------------------------#
+# Query plan checks.
+#
+# `flask indexes check` runs EXPLAIN on the queries behind every listing,
+# search, detail and /api/v1 view, and on their page validators, and fails
+# if any of them reads a table with a sequential scan. On Postgres the
+# planner is told to avoid sequential scans first, so that a small
+# development database still reports the plan it would use at production
+# size, and only a missing index shows up.
+#----------------------------------------------------------------------------#
+
+
+class Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+def _explain(prefix, element, compiler, **kw):
+    sql = compiler.process(element.statement, **kw)
+    # The plan rows share nothing with the wrapped statement's columns, so its
+    # result map must not be used to type them.
+    compiler._result_columns = []
+    return prefix + sql
+
+
+@compiles(Explain, 'postgresql')
+def _explain_postgresql(element, compiler, **kw):
+    return _explain('EXPLAIN (FORMAT JSON) ', element, compiler, **kw)
+
+
+@compiles(Explain, 'sqlite')
+def _explain_sqlite(element, compiler, **kw):
+    return _explain('EXPLAIN QUERY PLAN ', element, compiler, **kw)
+
+
+def _postgresql_seq_scans(plan):
+    found = set()
+    if plan.get('Node Type') == 'Seq Scan':
+        found.add(plan['Relation Name'])
+    for child in plan.get('Plans', []):
+        found |= _postgresql_seq_scans(child)
+    return found
+
+
+def sequential_scans(statement):
+    connection = db.session.connection()
+    rows = connection.execute(Explain(statement)).all()
+
+    if connection.dialect.name == 'postgresql':
+        plan = rows[0][0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return _postgresql_seq_scans(plan[0]['Plan'])
+
+    # SQLite reports "SCAN <table>" for a full table scan and adds
+    # "USING ... INDEX" when it walks an index instead. Subqueries and
+    # virtual tables show up under names that are not in the metadata.
+    # A first page in primary key order is a plain SCAN of the rowid, which
+    # LIMIT stops after a page: the outer loop of a limited query that needs
+    # no sort step is such a walk, not a full read.
+    walk = None
+    if statement._limit_clause is not None and not any(
+            row.detail.startswith('USE TEMP B-TREE FOR ORDER BY') for row in rows):
+        walk = next((row.id for row in rows if row.parent == 0), None)
+    found = set()
+    for row in rows:
+        words = row.detail.split()
+        if row.id == walk:
+            continue
+        if words[0] == 'SCAN' and 'USING' not in words and words[1] in db.metadata.tables:
+            found.add(words[1])
+    return found
+
+
+def view_queries():
+    now = dates.now()
+    venue_id = db.session.execute(select(func.min(Venue.id))).scalar() or 1
+    artist_id = db.session.execute(select(func.min(Artist.id))).scalar() or 1
+    limit = current_app.config['PAGE_SIZE']
+
+    # Each listing is checked on its first page and with a cursor in place,
+    # together with the validator query that versions the same page.
+    weekend = {'start': now, 'end': now + timedelta(days=2), 'city': 'San Francisco', 'genre': 'Jazz'}
+    genres = ['Jazz', 'Blues']
+    listings = [
+        ('shows', queries.show_listing(), queries.show_listing_version(),
+         queries.SHOW_LISTING_ORDER, [now, 0]),
+        ('shows: time window', queries.filter_shows(queries.show_listing(), weekend),
+         queries.filter_shows(queries.show_listing_version(), weekend),
+         queries.SHOW_LISTING_ORDER, [now, 0]),
+        ('venues', queries.venue_listing(), queries.venue_listing_version(),
+         queries.VENUE_LISTING_ORDER, ['CA', 'San Francisco', 0]),
+        ('artists', queries.artist_listing(), queries.artist_listing_version(),
+         queries.ARTIST_LISTING_ORDER, [0]),
+        ('venues: genres', queries.with_genres(queries.venue_listing(), Venue, Venue_Genre, genres),
+         queries.with_genres(queries.venue_listing_version(), Venue, Venue_Genre, genres),
+         queries.VENUE_LISTING_ORDER, ['CA', 'San Francisco', 0]),
+        ('artists: genres', queries.with_genres(queries.artist_listing(), Artist, Artist_Genre, genres),
+         queries.with_genres(queries.artist_listing_version(), Artist, Artist_Genre, genres),
+         queries.ARTIST_LISTING_ORDER, [0]),
+    ]
+    for name, statement, version, order, cursor in listings:
+        yield f'{name}: first page', keyset_query(statement, order, limit=limit)
+        yield name, keyset_query(statement, order, after=cursor, limit=limit)
+        yield f'{name}: version, first page', keyset_query(version, order, limit=limit)
+        yield f'{name}: version', keyset_query(version, order, after=cursor, limit=limit)
+    # Facet index refreshes; a full build reads both tables whole by design.
+    for kind, source in facets.SOURCES.items():
+        yield f'browse: {kind} refresh', source.changed_rows(now)
+        yield f'browse: {kind} refresh genres', source.changed_genres(now)
+        yield f'browse: {kind}', facets.entities(source, [1, 2, 3])
+
+    results = search.venues('music')
+    yield 'search_venues', keyset_query(select(results), search.order(results), limit=limit)
+    results = search.artists('music')
+    yield 'search_artists', keyset_query(select(results), search.order(results), limit=limit)
+
+    yield 'show_venue: genres', queries.venue_genres(venue_id)
+    yield 'show_venue: upcoming shows', queries.venue_shows(venue_id, True, now)
+    yield 'show_venue: past shows', queries.venue_shows(venue_id, False, now)
+    yield 'show_artist: genres', queries.artist_genres(artist_id)
+    yield 'show_artist: upcoming shows', queries.artist_shows(artist_id, True, now)
+    yield 'show_artist: past shows', queries.artist_shows(artist_id, False, now)
+    yield 'show_venue: version', queries.venue_version(venue_id)
+    yield 'show_artist: version', queries.artist_version(artist_id)
+
+    # /api/v1 with every field, as the counters and embeds are the costly part.
+    resources = [
+        ('venues', api.VENUES, venue_id, ['CA', 'San Francisco', 0]),
+        ('artists', api.ARTISTS, artist_id, [0]),
+        ('shows', api.SHOWS, 1, [now, 0]),
+    ]
+    limit = current_app.config['API_MAX_PAGE_SIZE']
+    for name, resource, item_id, cursor in resources:
+        statement = api.statement(resource, list(resource.fields))
+        yield f'api {name}: first page', keyset_query(statement, resource.order, limit=limit)
+        yield f'api {name}', keyset_query(statement, resource.order, after=cursor, limit=limit)
+        yield f'api {name}: detail', statement.where(resource.model.id == item_id)
+    yield 'api venues: genres', queries.owners_genres(Venue_Genre, [venue_id])
+    yield 'api venues: upcoming shows', queries.venues_shows([venue_id], True, now)
+    yield 'api venues: past shows', queries.venues_shows([venue_id], False, now)
+    yield 'api artists: genres', queries.owners_genres(Artist_Genre, [artist_id])
+    yield 'api artists: upcoming shows', queries.artists_shows([artist_id], True, now)
+    yield 'api artists: past shows', queries.artists_shows([artist_id], False, now)
+
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+indexes_cli = AppGroup('indexes', help='Check that the view queries are index-backed.')
+
+
+@indexes_cli.command('check')
+def check_command():
+    """EXPLAIN every view query and fail on sequential scans."""
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text('SET LOCAL enable_seqscan = off'))
+
+    failures = 0
+    try:
+        for name, statement in view_queries():
+            tables = sequential_scans(statement)
+            if tables:
+                failures += 1
+                click.echo(f'FAIL  {name}: sequential scan on {", ".join(sorted(tables))}')
+            else:
+                click.echo(f'ok    {name}')
+    finally:
+        db.session.rollback()
+
+    if failures:
+        raise click.ClickException(f'{failures} view queries fall back to a sequential scan.')
@@ -0,0 +1,112 @@
+import json
+import logging
+import re
+import time
+from collections import Counter
+
+from flask import g, has_app_context, render_template, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+slow_log = logging.getLogger('fyyur.slow_requests')
+
+#----------------------------------------------------------------------------#
+# Per-request SQL instrumentation.
+#
+# Cursor events on every engine (primary and replicas) add to a QueryStats
+# kept on `g` for the current request: statement count, total database time
+# and the slowest statement. After the request these go out as a
+# Server-Timing header, e.g.
+#
+#   Server-Timing: db;dur=12.4;desc="7 queries", app;dur=31.0
+#
+# and, past SLOW_REQUEST_MS, as one JSON line on the fyyur.slow_requests
+# logger. With SQL_DEBUG_PANEL on, HTML pages also get a panel listing the
+# statements run more than N_PLUS_ONE_THRESHOLD times, which is what an
+# N+1 pattern (one lookup per row of a listing) looks like from here.
+#----------------------------------------------------------------------------#
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.slowest = (0.0, None)
+        self.statements = Counter()
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.slowest[0]:
+            self.slowest = (seconds, statement)
+        self.statements[statement] += 1
+
+    def repeated(self, threshold):
+        return [(sql, n) for sql, n in self.statements.most_common() if n > threshold]
+
+
+def _stats():
+    return g.get('sql_stats') if has_app_context() else None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    stats = _stats()
+    if stats is not None:
+        stats.record(statement, elapsed)
+
+
+def _shorten(statement, limit=500):
+    statement = re.sub(r'\s+', ' ', statement or '').strip()
+    return statement if len(statement) <= limit else statement[:limit] + '...'
+
+
+def init_app(app):
+    threshold = app.config['N_PLUS_ONE_THRESHOLD']
+
+    @app.before_request
+    def start_stats():
+        g.sql_stats = QueryStats()
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def report_stats(response):
+        stats = g.get('sql_stats')
+        if stats is None:
+            return response
+        elapsed = time.perf_counter() - g.request_started
+
+        response.headers.add('Server-Timing', f'db;dur={stats.total * 1000:.1f};desc="{stats.count} queries"')
+        response.headers.add('Server-Timing', f'app;dur={elapsed * 1000:.1f}')
+
+        if elapsed * 1000 >= app.config['SLOW_REQUEST_MS']:
+            slowest_time, slowest_sql = stats.slowest
+            slow_log.warning(json.dumps({
+                'event': 'slow_request',
+                'method': request.method,
+                'path': request.full_path.rstrip('?'),
+                'endpoint': request.endpoint,
+                'status': response.status_code,
+                'duration_ms': round(elapsed * 1000, 1),
+                'db_ms': round(stats.total * 1000, 1),
+                'queries': stats.count,
+                'slowest_ms': round(slowest_time * 1000, 1),
+                'slowest_sql': _shorten(slowest_sql),
+            }))
+
+        if (app.config['SQL_DEBUG_PANEL'] and response.mimetype == 'text/html'
+                and not response.is_streamed):
+            panel = render_template(
+                'debug/sql_panel.html', stats=stats, elapsed=elapsed,
+                repeated=[(_shorten(sql), n) for sql, n in stats.repeated(threshold)],
+                slowest=(stats.slowest[0], _shorten(stats.slowest[1])))
+            html = response.get_data(as_text=True)
+            if '</body>' in html:
+                response.set_data(html.replace('</body>', panel + '</body>', 1))
+        return response
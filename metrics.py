@@ -0,0 +1,93 @@
+import os
+import time
+
+from flask import g, request, template_rendered, before_render_template
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter,
+                               Gauge, Histogram, generate_latest, multiprocess)
+
+#----------------------------------------------------------------------------#
+# Prometheus metrics.
+#
+# Served at /metrics in the Prometheus text format. Under gunicorn, set
+# PROMETHEUS_MULTIPROC_DIR to an empty directory before the workers start:
+# each worker then writes its samples to files there and /metrics adds
+# them up, so whichever worker answers the scrape reports the whole server.
+# gunicorn.conf.py clears the directory on start and drops the files of
+# workers that exit.
+#----------------------------------------------------------------------------#
+
+REQUEST_LATENCY = Histogram(
+    'fyyur_request_duration_seconds', 'Request latency.', ['endpoint', 'method'])
+REQUESTS = Counter(
+    'fyyur_requests_total', 'Requests handled.', ['endpoint', 'method', 'status'])
+RESPONSE_SIZE = Histogram(
+    'fyyur_response_size_bytes', 'Response body size.', ['endpoint'],
+    buckets=[2 ** n for n in range(8, 23, 2)])
+IN_PROGRESS = Gauge(
+    'fyyur_requests_in_progress', 'Requests being handled.', multiprocess_mode='livesum')
+TEMPLATE_RENDER = Histogram(
+    'fyyur_template_render_seconds', 'Template render time.', ['template'])
+DB_TIME = Histogram(
+    'fyyur_request_db_seconds', 'Database time per request.', ['endpoint'])
+DB_QUERIES = Histogram(
+    'fyyur_request_db_queries', 'SQL statements per request.', ['endpoint'],
+    buckets=[1, 2, 5, 10, 20, 50, 100, 200])
+CACHE_LOOKUPS = Counter(
+    'fyyur_page_cache_lookups_total', 'Page cache lookups.', ['result'])
+
+
+def _endpoint():
+    # Unmatched URLs share one label so 404 scans cannot add series.
+    return request.endpoint or 'unmatched'
+
+
+def _template_started(sender, template, context, **extra):
+    g.setdefault('templates_started', []).append(time.perf_counter())
+
+
+def _template_rendered(sender, template, context, **extra):
+    started = g.get('templates_started')
+    if started:
+        TEMPLATE_RENDER.labels(template.name).observe(time.perf_counter() - started.pop())
+
+
+def init_app(app):
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_rendered, app)
+
+    @app.before_request
+    def start_request():
+        g.metrics_started = time.perf_counter()
+        g.metrics_in_progress = True
+        IN_PROGRESS.inc()
+
+    @app.after_request
+    def record_request(response):
+        started = g.get('metrics_started')
+        if started is None:
+            return response
+        endpoint = _endpoint()
+        REQUEST_LATENCY.labels(endpoint, request.method).observe(time.perf_counter() - started)
+        REQUESTS.labels(endpoint, request.method, str(response.status_code)).inc()
+        size = response.calculate_content_length()
+        if size is not None:
+            RESPONSE_SIZE.labels(endpoint).observe(size)
+        stats = g.get('sql_stats')
+        if stats is not None:
+            DB_TIME.labels(endpoint).observe(stats.total)
+            DB_QUERIES.labels(endpoint).observe(stats.count)
+        return response
+
+    @app.teardown_request
+    def finish_request(error=None):
+        if g.pop('metrics_in_progress', False):
+            IN_PROGRESS.dec()
+
+
+def exposition():
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,43 @@
+"""index foreign keys and show start times
+
+Revision ID: 52b151385a09
+Revises: a2bc6a222c3a
+Create Date: 2026-10-18 11:40:02.771390
+
+The indexes are built with CREATE INDEX CONCURRENTLY so the upgrade can run
+against a live database without blocking writes. Postgres does not allow
+that inside a transaction, hence the autocommit block. If a build is
+interrupted it leaves an INVALID index behind; drop it and rerun.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '52b151385a09'
+down_revision = 'a2bc6a222c3a'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_shows_venue_id_start_time', 'shows', ['venue_id', 'start_time']),
+    ('ix_shows_artist_id_start_time', 'shows', ['artist_id', 'start_time']),
+    ('ix_shows_start_time_id', 'shows', ['start_time', 'id']),
+    ('ix_venue_genres_venue_id', 'venue_genres', ['venue_id']),
+    ('ix_artist_genres_artist_id', 'artist_genres', ['artist_id']),
+    ('ix_venues_state_city_id', 'venues', ['state', 'city', 'id']),
+]
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
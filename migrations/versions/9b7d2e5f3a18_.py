@@ -0,0 +1,82 @@
+"""genres lookup table with integer keys
+
+Revision ID: 9b7d2e5f3a18
+Revises: f4a2c8e1b637
+Create Date: 2026-10-18 20:14:51.602317
+
+Creates genres from the forms.py choices (ids 1-19, in choice order) and
+turns venue_genres and artist_genres into (owner, genre_id) pairs. Stored
+genres that are not one of the choices are kept, as genres numbered after
+them, and duplicate pairs are dropped.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b7d2e5f3a18'
+down_revision = 'f4a2c8e1b637'
+branch_labels = None
+depends_on = None
+
+
+# forms.GENRE_CHOICES as of this revision.
+GENRES = [
+    'Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk', 'Funk', 'Hip-Hop',
+    'Heavy Metal', 'Instrumental', 'Jazz', 'Musical Theatre', 'Pop', 'Punk', 'R&B', 'Reggae',
+    'Rock n Roll', 'Soul', 'Other',
+]
+
+OWNERS = [('venue_genres', 'venue_id'), ('artist_genres', 'artist_id')]
+
+
+def upgrade():
+    genres = op.create_table('genres',
+    sa.Column('id', sa.SmallInteger(), autoincrement=False, nullable=False),
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.bulk_insert(genres, [{'id': i, 'name': name} for i, name in enumerate(GENRES, 1)])
+
+    for table, owner in OWNERS:
+        op.execute(f'''
+            INSERT INTO genres (id, name)
+            SELECT (SELECT max(id) FROM genres) + row_number() OVER (ORDER BY genre), genre
+            FROM (SELECT DISTINCT genre FROM {table}
+                  WHERE genre NOT IN (SELECT name FROM genres)) AS extra
+        ''')
+        op.add_column(table, sa.Column('genre_id', sa.SmallInteger(), nullable=True))
+        op.execute(f'''
+            UPDATE {table} SET genre_id = (SELECT id FROM genres WHERE name = {table}.genre)
+        ''')
+        op.execute(f'''
+            DELETE FROM {table} WHERE id NOT IN (
+                SELECT min(id) FROM {table} GROUP BY {owner}, genre_id)
+        ''')
+
+        op.drop_index(f'ix_{table}_{owner}', table_name=table)
+        op.drop_column(table, 'id')
+        op.drop_column(table, 'genre')
+        op.alter_column(table, 'genre_id', nullable=False)
+        op.create_primary_key(f'{table}_pkey', table, [owner, 'genre_id'])
+        op.create_foreign_key(f'{table}_genre_id_fkey', table, 'genres', ['genre_id'], ['id'])
+        op.create_index(f'ix_{table}_genre_id_{owner}', table, ['genre_id', owner])
+
+
+def downgrade():
+    for table, owner in reversed(OWNERS):
+        op.drop_index(f'ix_{table}_genre_id_{owner}', table_name=table)
+        op.drop_constraint(f'{table}_genre_id_fkey', table, type_='foreignkey')
+        op.drop_constraint(f'{table}_pkey', table, type_='primary')
+        op.add_column(table, sa.Column('genre', sa.String(length=50), nullable=True))
+        op.execute(f'''
+            UPDATE {table} SET genre = (SELECT name FROM genres WHERE id = {table}.genre_id)
+        ''')
+        op.alter_column(table, 'genre', nullable=False)
+        op.drop_column(table, 'genre_id')
+        op.add_column(table, sa.Column('id', sa.Integer(), sa.Identity(), nullable=False))
+        op.create_primary_key(f'{table}_pkey', table, ['id'])
+        op.create_index(f'ix_{table}_{owner}', table, [owner])
+    op.drop_table('genres')
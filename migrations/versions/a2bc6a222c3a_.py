@@ -0,0 +1,39 @@
+"""add search vectors and trigram indexes
+
+Revision ID: a2bc6a222c3a
+Revises: bf5b7a8f18a1
+Create Date: 2026-10-18 09:12:31.402114
+
+Run `flask search backfill` after upgrading to populate search_vector for
+existing rows; new and edited rows are indexed by the app.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'a2bc6a222c3a'
+down_revision = 'bf5b7a8f18a1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.add_column('venues', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    op.add_column('artists', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    op.create_index('ix_venues_search_vector', 'venues', ['search_vector'], unique=False, postgresql_using='gin')
+    op.create_index('ix_venues_name_trgm', 'venues', ['name'], unique=False, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_artists_search_vector', 'artists', ['search_vector'], unique=False, postgresql_using='gin')
+    op.create_index('ix_artists_name_trgm', 'artists', ['name'], unique=False, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_artists_name_trgm', table_name='artists')
+    op.drop_index('ix_artists_search_vector', table_name='artists')
+    op.drop_index('ix_venues_name_trgm', table_name='venues')
+    op.drop_index('ix_venues_search_vector', table_name='venues')
+    op.drop_column('artists', 'search_vector')
+    op.drop_column('venues', 'search_vector')
@@ -0,0 +1,56 @@
+"""upcoming and past show counters
+
+Revision ID: c3e1d7a4b920
+Revises: 52b151385a09
+Create Date: 2026-10-18 16:05:12.408113
+
+Adds the counter columns to venues and artists, fills them in as of the
+upgrade and records that time in show_counters. From then on counters.py
+keeps them current.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+import dates
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e1d7a4b920'
+down_revision = '52b151385a09'
+branch_labels = None
+depends_on = None
+
+
+OWNERS = [('venues', 'venue_id'), ('artists', 'artist_id')]
+
+
+def upgrade():
+    for table, _ in OWNERS:
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), nullable=False, server_default='0'))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), nullable=False, server_default='0'))
+
+    show_counters = op.create_table('show_counters',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('as_of', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+    # Start times are in SHOW_TIMEZONE; counters.py compares them the same way.
+    as_of = dates.now()
+    for table, owner in OWNERS:
+        op.execute(sa.text(f'''
+            UPDATE {table} SET
+                upcoming_shows_count = (SELECT count(*) FROM shows
+                                        WHERE shows.{owner} = {table}.id AND start_time >= :as_of),
+                past_shows_count = (SELECT count(*) FROM shows
+                                    WHERE shows.{owner} = {table}.id AND start_time < :as_of)
+        ''').bindparams(as_of=as_of))
+    op.bulk_insert(show_counters, [{'id': 1, 'as_of': as_of}])
+
+
+def downgrade():
+    op.drop_table('show_counters')
+    for table, _ in reversed(OWNERS):
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
@@ -0,0 +1,37 @@
+"""index venues and artists on updated_at
+
+Revision ID: d8e3b6a1c540
+Revises: 9b7d2e5f3a18
+Create Date: 2026-10-18 21:05:13.418206
+
+For the facet index refreshes, which read the rows updated since the last
+one. Built concurrently, as in 52b151385a09.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8e3b6a1c540'
+down_revision = '9b7d2e5f3a18'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_venues_updated_at', 'venues', ['updated_at']),
+    ('ix_artists_updated_at', 'artists', ['updated_at']),
+]
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
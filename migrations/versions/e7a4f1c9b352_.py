@@ -0,0 +1,33 @@
+"""updated_at defaults to UTC
+
+Revision ID: e7a4f1c9b352
+Revises: d8e3b6a1c540
+Create Date: 2026-10-19 09:12:40.583117
+
+The default was now(), the session's local time, while the app writes UTC.
+Rows stamped by the old default keep their value; the next write to each
+one replaces it.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a4f1c9b352'
+down_revision = 'd8e3b6a1c540'
+branch_labels = None
+depends_on = None
+
+
+TABLES = ['venues', 'artists', 'shows']
+
+
+def upgrade():
+    for table in TABLES:
+        op.alter_column(table, 'updated_at', server_default=sa.text("timezone('utc', now())"))
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        op.alter_column(table, 'updated_at', server_default=sa.func.now())
@@ -0,0 +1,33 @@
+"""updated_at on venues, artists and shows
+
+Revision ID: f4a2c8e1b637
+Revises: c3e1d7a4b920
+Create Date: 2026-10-18 18:42:37.150926
+
+Existing rows are stamped with the time of the upgrade, so pages cached by
+browsers before it are revalidated once.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4a2c8e1b637'
+down_revision = 'c3e1d7a4b920'
+branch_labels = None
+depends_on = None
+
+
+TABLES = ['venues', 'artists', 'shows']
+
+
+def upgrade():
+    for table in TABLES:
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=False,
+                                       server_default=sa.func.now()))
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        op.drop_column(table, 'updated_at')
@@ -1,22 +1,71 @@
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from sqlalchemy import DateTime, delete, event, func, insert, select, update
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import deferred
+from sqlalchemy.sql.functions import FunctionElement
+from datetime import datetime, timezone
+from forms import GENRE_CHOICES
+import dates
+from replicas import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+# updated_at is naive UTC whoever writes it: the app through utcnow(), the
+# database through the utc_now() column default. HTTP dates are UTC, so
+# Last-Modified is sent as stored.
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class utc_now(FunctionElement):
+    type = DateTime()
+    inherit_cache = True
+
+
+@compiles(utc_now)
+def _utc_now(element, compiler, **kw):
+    # SQLite's CURRENT_TIMESTAMP is UTC already.
+    return 'CURRENT_TIMESTAMP'
+
+
+@compiles(utc_now, 'postgresql')
+def _utc_now_postgresql(element, compiler, **kw):
+    # now() is in the session's time zone.
+    return "timezone('utc', now())"
 
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
 
 
+class Genre(db.Model):
+    # The genre choices in forms.py, keyed by small integers that never
+    # change; rows are added by seed_genres().
+    __tablename__ = "genres"
+    id = db.Column(db.SmallInteger, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(50), nullable=False, unique=True)
+
+    def __repr__(self):
+        return f"<Genre {self.id} {self.name}>"
+
+
 class Venue_Genre(db.Model):
+    # The primary key finds a venue's genres; the (genre_id, venue_id) index
+    # lists a genre's venues in id order, for the genre filters.
     __tablename__ = "venue_genres"
-    id = db.Column(db.Integer, primary_key=True)
-    genre = db.Column(db.String(50), nullable=False)
+    owner_key = "venue_id"
     venue_id = db.Column(db.Integer, db.ForeignKey(
-        "venues.id", ondelete="CASCADE"), nullable=False)
+        "venues.id", ondelete="CASCADE"), primary_key=True)
+    genre_id = db.Column(db.SmallInteger, db.ForeignKey("genres.id"), primary_key=True)
+
+    __table_args__ = (
+        db.Index('ix_venue_genres_genre_id_venue_id', 'genre_id', 'venue_id'),
+    )
 
     def __repr__(self):
-        return f"Genre venue_id:{self.venue_id} genre: {self.genre}>"
+        return f"Genre venue_id:{self.venue_id} genre_id: {self.genre_id}>"
 
 
 class Venue(db.Model):
@@ -36,6 +85,24 @@ class Venue(db.Model):
     seeking_description = db.Column(db.String(120), nullable=True)
     image_link = db.Column(db.String(500))
     shows = db.relationship('Show', backref='venue', lazy=True)
+    # Maintained by counters.py.
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Set on insert and on every UPDATE, counters' included; the page
+    # validators in conditional.py are built from it.
+    updated_at = db.Column(db.DateTime, nullable=False, default=utcnow,
+                           onupdate=utcnow, server_default=utc_now())
+    # Maintained by search.py; only populated on Postgres.
+    search_vector = deferred(db.Column(TSVECTOR().with_variant(db.Text, 'sqlite')))
+
+    __table_args__ = (
+        db.Index('ix_venues_state_city_id', 'state', 'city', 'id'),
+        # For the facet index refreshes in facets.py.
+        db.Index('ix_venues_updated_at', 'updated_at'),
+        db.Index('ix_venues_search_vector', 'search_vector', postgresql_using='gin'),
+        db.Index('ix_venues_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
 
     def __repr__(self):
         return f'<Venue {self.id} {self.name} {self.city} {self.image_link}>'
@@ -43,13 +110,17 @@ class Venue(db.Model):
 
 class Artist_Genre(db.Model):
     __tablename__ = "artist_genres"
-    id = db.Column(db.Integer, primary_key=True)
-    genre = db.Column(db.String(50), nullable=False)
+    owner_key = "artist_id"
     artist_id = db.Column(db.Integer, db.ForeignKey(
-        "artists.id", ondelete="CASCADE"), nullable=False)
+        "artists.id", ondelete="CASCADE"), primary_key=True)
+    genre_id = db.Column(db.SmallInteger, db.ForeignKey("genres.id"), primary_key=True)
+
+    __table_args__ = (
+        db.Index('ix_artist_genres_genre_id_artist_id', 'genre_id', 'artist_id'),
+    )
 
     def __repr__(self):
-        return f"Genre venue_id:{self.artist_id} genre: {self.genre}>"
+        return f"Genre artist_id:{self.artist_id} genre_id: {self.genre_id}>"
 
 
 class Artist(db.Model):
@@ -66,6 +137,22 @@ class Artist(db.Model):
     seeking_venue = db.Column(db.Boolean, nullable=True, default=False)
     seeking_description = db.Column(db.String(), nullable=True, default="")
     website = db.Column(db.String(120), nullable=True)
+    # Maintained by counters.py.
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Set on insert and on every UPDATE, counters' included; the page
+    # validators in conditional.py are built from it.
+    updated_at = db.Column(db.DateTime, nullable=False, default=utcnow,
+                           onupdate=utcnow, server_default=utc_now())
+    # Maintained by search.py; only populated on Postgres.
+    search_vector = deferred(db.Column(TSVECTOR().with_variant(db.Text, 'sqlite')))
+
+    __table_args__ = (
+        db.Index('ix_artists_updated_at', 'updated_at'),
+        db.Index('ix_artists_search_vector', 'search_vector', postgresql_using='gin'),
+        db.Index('ix_artists_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
 
     def __repr__(self):
         return f'<Artist {self.id} {self.name} {self.genres}>'
@@ -74,12 +161,126 @@ class Artist(db.Model):
 class Show(db.Model):
     __tablename__ = 'shows'
     id = db.Column(db.Integer, primary_key=True)
+    # Naive, in SHOW_TIMEZONE (see dates.py), unlike updated_at.
     start_time = db.Column(db.DateTime, nullable=False,
-                           default=datetime.utcnow)
+                           default=dates.now)
     venue_id = db.Column(db.Integer, db.ForeignKey(
         'venues.id', ondelete="CASCADE"), nullable=False)
     artist_id = db.Column(db.Integer, db.ForeignKey(
         'artists.id', ondelete="CASCADE"), nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=utcnow,
+                           onupdate=utcnow, server_default=utc_now())
+
+    __table_args__ = (
+        db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_shows_start_time_id', 'start_time', 'id'),
+    )
 
     def __repr__(self):
         return f'<Show {self.id} {self.venue_id} {self.artist_id}>'
+
+
+class ShowCounter(db.Model):
+    # A single row: the time the venue and artist show counters were last
+    # rolled over to. Shows starting at or after it count as upcoming.
+    __tablename__ = 'show_counters'
+    id = db.Column(db.Integer, primary_key=True)
+    as_of = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<ShowCounter {self.as_of}>'
+
+
+#----------------------------------------------------------------------------#
+# Page version writes.
+#
+# A venue's or artist's page is versioned by its own updated_at alone (see
+# queries.venue_version), so every write that changes what the page shows
+# moves it: its own fields and genres, a show added to it, and the name or
+# image of anything on the other side it shares a show with, which its
+# show lists render. Counter rollovers and rebuilds update the row anyway.
+#----------------------------------------------------------------------------#
+
+
+def touch_partners(model, owner_id):
+    # For a venue, every artist with a show there; for an artist, every
+    # venue it plays. Call before the owner's shows are deleted.
+    if model is Venue:
+        partner, partner_key, owner_key = Artist, Show.artist_id, Show.venue_id
+    else:
+        partner, partner_key, owner_key = Venue, Show.venue_id, Show.artist_id
+    db.session.execute(
+        update(partner)
+        .where(partner.id.in_(select(partner_key).where(owner_key == owner_id)))
+        .values(updated_at=utcnow())
+        .execution_options(synchronize_session=False))
+
+
+#----------------------------------------------------------------------------#
+# Genre writes.
+#----------------------------------------------------------------------------#
+
+
+def seed_genres(executor):
+    # Adds the forms.py genres the table lacks, numbered after the highest
+    # id in use, so a new choice gets a new id and existing ids never move.
+    existing = set(executor.execute(select(Genre.name)).scalars())
+    next_id = (executor.execute(select(func.max(Genre.id))).scalar() or 0) + 1
+    rows = []
+    for name, _ in GENRE_CHOICES:
+        if name not in existing:
+            rows.append({"id": next_id, "name": name})
+            next_id += 1
+    if rows:
+        executor.execute(insert(Genre), rows)
+
+
+@event.listens_for(Genre.__table__, 'after_create')
+def _seed_new_table(target, connection, **kw):
+    seed_genres(connection)
+
+
+def genre_ids(names, executor=None):
+    # {name: id} for the distinct `names`, in order. Raises ValueError for a
+    # name that is not one of the genres.
+    executor = executor or db.session
+    names = list(dict.fromkeys(names))
+    if not names:
+        return {}
+    query = select(Genre.name, Genre.id).where(Genre.name.in_(names))
+    found = dict(executor.execute(query).all())
+    if len(found) < len(names):
+        # A choice added to forms.py since the table was last seeded.
+        seed_genres(executor)
+        found = dict(executor.execute(query).all())
+        missing = [name for name in names if name not in found]
+        if missing:
+            raise ValueError('Unknown genres: ' + ', '.join(missing))
+    return {name: found[name] for name in names}
+
+
+def _insert_genres(genre_model, owner_id, ids):
+    rows = [{"genre_id": genre_id, genre_model.owner_key: owner_id} for genre_id in ids]
+    if rows:
+        db.session.execute(insert(genre_model).values(rows))
+
+
+def add_genres(genre_model, owner_id, genres):
+    # One multi-row INSERT for all of the owner's new genres. Runs in the
+    # caller's transaction; nothing is committed here.
+    _insert_genres(genre_model, owner_id, genre_ids(genres).values())
+
+
+def update_genres(genre_model, owner_id, genres):
+    # Applies only the difference between the stored genres and `genres`.
+    owner = getattr(genre_model, genre_model.owner_key)
+    current = set(db.session.execute(
+        select(genre_model.genre_id).where(owner == owner_id)).scalars())
+    wanted = genre_ids(genres).values()
+
+    removed = current.difference(wanted)
+    if removed:
+        db.session.execute(delete(genre_model).where(
+            owner == owner_id, genre_model.genre_id.in_(removed)))
+    _insert_genres(genre_model, owner_id, [g for g in wanted if g not in current])
@@ -0,0 +1,55 @@
+#----------------------------------------------------------------------------#
+# Detail page payloads.
+#
+# The dicts handed to pages/show_venue.html and pages/show_artist.html (and
+# kept in the page cache), built from the rows of queries.venue_shows() and
+# queries.artist_shows(). Shared by the sync views in app.py and the async
+# ones in asgi.py, so both serve the same page. "version" is the page's
+# conditional.Version, kept so a cache hit can answer a conditional GET.
+#----------------------------------------------------------------------------#
+
+
+def expires_at(upcoming):
+    # The page goes stale when its next upcoming show starts.
+    return upcoming[0].start_time if upcoming else None
+
+
+def venue_page(venue, genres, upcoming, past, version=None):
+    return {
+        "id": venue.id,
+        "name": venue.name,
+        "genres": list(genres),
+        "address": venue.address,
+        "city": venue.city,
+        "state": venue.state,
+        "phone": venue.phone,
+        "website": venue.website,
+        "facebook_link": venue.facebook_link,
+        "seeking_talent": venue.seeking_talent,
+        "seeking_description": venue.seeking_description,
+        "image_link": venue.image_link,
+        "past_shows": [show._asdict() for show in past],
+        "upcoming_shows": [show._asdict() for show in upcoming],
+        "past_shows_count": venue.past_shows_count,
+        "upcoming_shows_count": venue.upcoming_shows_count,
+        "version": version,
+    }
+
+
+def artist_page(artist, genres, upcoming, past, version=None):
+    return {
+        "id": artist.id,
+        "name": artist.name,
+        "genres": list(genres),
+        "city": artist.city,
+        "state": artist.state,
+        "phone": artist.phone,
+        "facebook_link": artist.facebook_link,
+        "seeking_venue": artist.seeking_venue,
+        "image_link": artist.image_link,
+        "past_shows": [show._asdict() for show in past],
+        "upcoming_shows": [show._asdict() for show in upcoming],
+        "past_shows_count": artist.past_shows_count,
+        "upcoming_shows_count": artist.upcoming_shows_count,
+        "version": version,
+    }
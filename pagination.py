@@ -0,0 +1,143 @@
+import base64
+import json
+from datetime import datetime
+
+from flask import abort, current_app, request
+from sqlalchemy import func, select, tuple_
+
+from models import db
+
+#----------------------------------------------------------------------------#
+# Keyset pagination.
+#----------------------------------------------------------------------------#
+
+
+class Page:
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+
+def encode_cursor(values):
+    values = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    payload = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_cursor(token, columns):
+    # Cursors are opaque to clients, so anything malformed is rejected
+    # rather than silently restarting from the first page.
+    try:
+        payload = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(payload)
+    except ValueError:
+        raise ValueError('invalid cursor')
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise ValueError('invalid cursor')
+
+    return [_decode_value(column, value) for column, value in zip(columns, values)]
+
+
+def _python_type(column):
+    try:
+        return column.type.python_type
+    except NotImplementedError:
+        return None
+
+
+def _decode_value(column, value):
+    # Each slot has to hold what its column stores: a value of another type
+    # fails the comparison with a DataError on Postgres, or compares by type
+    # affinity on SQLite, instead of resuming the listing.
+    if value is None:
+        return value
+    if isinstance(value, (bool, dict, list)):
+        raise ValueError('invalid cursor')
+    python_type = _python_type(column)
+    if python_type is datetime:
+        if not isinstance(value, str):
+            raise ValueError('invalid cursor')
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            raise ValueError('invalid cursor')
+    if python_type is float and isinstance(value, int):
+        return float(value)
+    if python_type in (int, float, str) and not isinstance(value, python_type):
+        raise ValueError('invalid cursor')
+    return value
+
+
+def cursor_arg(columns, name='after'):
+    token = request.args.get(name)
+    if not token:
+        return None
+    try:
+        return decode_cursor(token, columns)
+    except ValueError:
+        abort(400)
+
+
+def page_args(columns, max_limit=None):
+    # Reads after=/before= cursors and limit= off the query string. The
+    # page size is clamped to MAX_PAGE_SIZE whatever the client asks for.
+    if max_limit is None:
+        max_limit = current_app.config['MAX_PAGE_SIZE']
+    after = cursor_arg(columns, 'after')
+    before = cursor_arg(columns, 'before')
+    if after is not None and before is not None:
+        abort(400)
+
+    limit = request.args.get('limit', type=int) or current_app.config['PAGE_SIZE']
+    limit = max(1, min(limit, max_limit))
+    return after, before, limit
+
+
+def _cursor(row, columns):
+    return encode_cursor([getattr(row, c.key) for c in columns])
+
+
+def keyset_query(stmt, columns, after=None, before=None, limit=None):
+    # `columns` is the unique sort key. One extra row is fetched so the
+    # caller can tell whether another page follows. Paging backwards walks
+    # the index in reverse.
+    if limit is None:
+        limit = current_app.config['PAGE_SIZE']
+
+    if before is not None:
+        stmt = stmt.where(tuple_(*columns) < tuple_(*before))
+        stmt = stmt.order_by(*[c.desc() for c in columns])
+    else:
+        if after is not None:
+            stmt = stmt.where(tuple_(*columns) > tuple_(*after))
+        stmt = stmt.order_by(*columns)
+    return stmt.limit(limit + 1)
+
+
+def keyset_page(stmt, columns, after=None, before=None, limit=None):
+    # Every sort column has to be part of the select list so the cursors can
+    # be read back off the first and last rows.
+    if limit is None:
+        limit = current_app.config['PAGE_SIZE']
+
+    rows = db.session.execute(keyset_query(stmt, columns, after, before, limit)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not rows:
+        return Page(rows)
+
+    if before is not None:
+        rows.reverse()
+        next_cursor = _cursor(rows[-1], columns)
+        prev_cursor = _cursor(rows[0], columns) if has_more else None
+    else:
+        next_cursor = _cursor(rows[-1], columns) if has_more else None
+        prev_cursor = _cursor(rows[0], columns) if after is not None else None
+    return Page(rows, next_cursor, prev_cursor)
+
+
+def capped_count(stmt, cap):
+    # Counts matches up to `cap` without walking the whole result set.
+    limited = stmt.limit(cap).subquery()
+    return db.session.execute(select(func.count()).select_from(limited)).scalar()
@@ -0,0 +1,158 @@
+import threading
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+
+from models import db
+
+#----------------------------------------------------------------------------#
+# Connection pooling.
+#
+# Engine options come from the DB_* settings in config.py. Pool settings only
+# apply to server databases; SQLite keeps SQLAlchemy's defaults.
+#
+# With DB_PGBOUNCER set, PgBouncer (in transaction mode) does the pooling:
+# each worker uses a NullPool, nothing is left on the server session between
+# transactions, and the statement timeout is set per transaction with
+# SET LOCAL instead of as a startup parameter, which PgBouncer rejects.
+#----------------------------------------------------------------------------#
+
+
+class WaitStats:
+    # Time spent in pool.connect(), i.e. waiting for a free connection,
+    # opening a new one and pre-pinging it.
+    def __init__(self):
+        self.checkouts = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.timeouts = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds, timed_out=False):
+        with self._lock:
+            self.checkouts += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+
+class _Timed:
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        self.wait = WaitStats()
+
+    def connect(self):
+        started = time.perf_counter()
+        timed_out = False
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            self.wait.record(time.perf_counter() - started, timed_out)
+
+
+class TimedQueuePool(_Timed, QueuePool):
+    pass
+
+
+class TimedNullPool(_Timed, NullPool):
+    pass
+
+
+def engine_options(config):
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite':
+        return {}
+
+    options = {
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+    }
+    connect_args = {}
+    timeout = config['DB_STATEMENT_TIMEOUT']
+
+    if config['DB_PGBOUNCER']:
+        options['poolclass'] = TimedNullPool
+        if url.get_driver_name() == 'psycopg':
+            # Prepared statements live on one server connection, which
+            # transaction pooling does not pin to this client.
+            connect_args['prepare_threshold'] = None
+    else:
+        options.update(
+            poolclass=TimedQueuePool,
+            pool_size=config['DB_POOL_SIZE'],
+            max_overflow=config['DB_MAX_OVERFLOW'],
+            pool_timeout=config['DB_POOL_TIMEOUT'],
+        )
+        if timeout:
+            connect_args['options'] = f'-c statement_timeout={timeout}'
+
+    if connect_args:
+        options['connect_args'] = connect_args
+    return options
+
+
+# The async engines in asgi.py take the same settings with an asyncio
+# driver and pool.
+ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+psycopg'}
+ASYNC_POOLS = {TimedQueuePool: AsyncAdaptedQueuePool, TimedNullPool: NullPool}
+
+
+def async_url(url):
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
+
+def async_engine_options(config):
+    options = engine_options(config)
+    if 'poolclass' in options:
+        options['poolclass'] = ASYNC_POOLS[options['poolclass']]
+    return options
+
+
+def _set_local_timeout(timeout):
+    def begin(connection):
+        connection.exec_driver_sql(f'SET LOCAL statement_timeout = {int(timeout)}')
+    return begin
+
+
+def configure_engine(engine, config):
+    timeout = config['DB_STATEMENT_TIMEOUT']
+    if config['DB_PGBOUNCER'] and timeout and engine.dialect.name == 'postgresql':
+        event.listen(engine, 'begin', _set_local_timeout(timeout))
+
+
+def init_app(app):
+    # Call after db.init_app(app), which creates the engines.
+    with app.app_context():
+        for engine in db.engines.values():
+            configure_engine(engine, app.config)
+
+
+def stats():
+    gauges = {}
+    for bind, engine in db.engines.items():
+        pool = engine.pool
+        entry = {'pool': type(pool).__name__, 'status': pool.status()}
+        if isinstance(pool, QueuePool):
+            entry.update(
+                size=pool.size(),
+                checked_in=pool.checkedin(),
+                checked_out=pool.checkedout(),
+                overflow=max(pool.overflow(), 0),
+            )
+        wait = getattr(pool, 'wait', None)
+        if wait is not None:
+            entry.update(
+                checkouts=wait.checkouts,
+                wait_avg_ms=wait.total / wait.checkouts * 1000 if wait.checkouts else None,
+                wait_max_ms=wait.max * 1000,
+                timeouts=wait.timeouts,
+            )
+        gauges[bind or 'default'] = entry
+    return gauges
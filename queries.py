@@ -0,0 +1,232 @@
+from datetime import datetime
+
+from sqlalchemy import exists, func, intersect, select
+
+from models import Genre, Venue, Venue_Genre, Artist, Artist_Genre, Show
+
+#----------------------------------------------------------------------------#
+# Queries shared by the views.
+#----------------------------------------------------------------------------#
+
+
+def show_listing():
+    # Only the columns pages/shows.html renders, in a single joined query.
+    return (
+        select(
+            Show.id,
+            Show.start_time,
+            Show.venue_id,
+            Venue.name.label('venue_name'),
+            Show.artist_id,
+            Artist.name.label('artist_name'),
+            Artist.image_link.label('artist_image_link'),
+        )
+        .join(Venue, Venue.id == Show.venue_id)
+        .join(Artist, Artist.id == Show.artist_id)
+    )
+
+
+SHOW_LISTING_ORDER = (Show.start_time, Show.id)
+
+
+SHOW_FILTERS = ('from', 'to', 'venue_id', 'artist_id', 'city', 'genre')
+
+
+def parse_show_filters(values):
+    # from/to (ISO dates or datetimes, "to" exclusive), venue_id, artist_id,
+    # city (the venue's) and genre (the artist's), from a query string or
+    # similar mapping. Raises ValueError naming the bad parameter.
+    filters = {}
+    for name, key in (('from', 'start'), ('to', 'end')):
+        if values.get(name):
+            try:
+                filters[key] = datetime.fromisoformat(values[name])
+            except ValueError:
+                raise ValueError(f'{name} must be an ISO date or datetime')
+    for name in ('venue_id', 'artist_id'):
+        if values.get(name):
+            try:
+                filters[name] = int(values[name])
+            except ValueError:
+                raise ValueError(f'{name} must be an integer')
+    for name in ('city', 'genre'):
+        if values.get(name):
+            filters[name] = values[name]
+    return filters
+
+
+def show_conditions(filters):
+    # The time window is a range on ix_shows_start_time_id, the index the
+    # listing is already walked in, so a narrow window with LIMIT only reads
+    # the rows around it however many shows there are in total.
+    conditions = []
+    if filters.get('start') is not None:
+        conditions.append(Show.start_time >= filters['start'])
+    if filters.get('end') is not None:
+        conditions.append(Show.start_time < filters['end'])
+    if filters.get('venue_id') is not None:
+        conditions.append(Show.venue_id == filters['venue_id'])
+    if filters.get('artist_id') is not None:
+        conditions.append(Show.artist_id == filters['artist_id'])
+    if filters.get('genre'):
+        conditions.append(exists().where(Artist_Genre.artist_id == Show.artist_id,
+                                         Artist_Genre.genre_id == genre_id(filters['genre'])))
+    return conditions
+
+
+def filter_shows(stmt, filters):
+    # For statements with the show's venue joined, like show_listing().
+    stmt = stmt.where(*show_conditions(filters))
+    if filters.get('city'):
+        stmt = stmt.where(Venue.city == filters['city'])
+    return stmt
+
+
+def genre_id(name):
+    # Resolved by the database, so an unknown name just matches nothing.
+    return select(Genre.id).where(Genre.name == name).scalar_subquery()
+
+
+def with_genres(stmt, model, genre_model, names):
+    # Owners having every genre in `names`. Each genre's owners are one
+    # range of the (genre_id, owner) index, already in id order, and the
+    # ranges are intersected before any owner row is read.
+    if not names:
+        return stmt
+    owner = getattr(genre_model, genre_model.owner_key)
+    postings = [select(owner).where(genre_model.genre_id == genre_id(name))
+                for name in dict.fromkeys(names)]
+    matching = postings[0] if len(postings) == 1 else intersect(*postings)
+    return stmt.where(model.id.in_(matching))
+
+
+def venue_listing():
+    return select(
+        Venue.id,
+        Venue.name,
+        Venue.city,
+        Venue.state,
+        Venue.upcoming_shows_count.label('num_upcoming_shows'),
+    )
+
+
+VENUE_LISTING_ORDER = (Venue.state, Venue.city, Venue.id)
+
+
+def artist_listing():
+    return select(Artist.id, Artist.name)
+
+
+ARTIST_LISTING_ORDER = (Artist.id,)
+
+
+def _genre_names(genre_model, owner_id):
+    owner = getattr(genre_model, genre_model.owner_key)
+    return (
+        select(Genre.name)
+        .join(genre_model, genre_model.genre_id == Genre.id)
+        .where(owner == owner_id)
+        .order_by(Genre.id)
+    )
+
+
+def venue_genres(venue_id):
+    return _genre_names(Venue_Genre, venue_id)
+
+
+def artist_genres(artist_id):
+    return _genre_names(Artist_Genre, artist_id)
+
+
+def owners_genres(genre_model, owner_ids):
+    # (owner id, genre name) for a batch of venues or artists.
+    owner = getattr(genre_model, genre_model.owner_key)
+    return (
+        select(owner, Genre.name)
+        .join(Genre, Genre.id == genre_model.genre_id)
+        .where(owner.in_(owner_ids))
+        .order_by(Genre.id)
+    )
+
+
+def _split(stmt, upcoming, now):
+    if upcoming:
+        return stmt.where(Show.start_time >= now).order_by(Show.start_time)
+    return stmt.where(Show.start_time < now).order_by(Show.start_time.desc())
+
+
+def _venue_shows():
+    # Shows at a venue with the performing artist joined in.
+    return (
+        select(
+            Show.start_time,
+            Show.artist_id,
+            Artist.name.label('artist_name'),
+            Artist.image_link.label('artist_image_link'),
+        )
+        .join(Artist, Artist.id == Show.artist_id)
+    )
+
+
+def _artist_shows():
+    # Shows by an artist with the hosting venue joined in.
+    return (
+        select(
+            Show.start_time,
+            Show.venue_id,
+            Venue.name.label('venue_name'),
+            Venue.image_link.label('venue_image_link'),
+        )
+        .join(Venue, Venue.id == Show.venue_id)
+    )
+
+
+def venue_shows(venue_id, upcoming, now):
+    return _split(_venue_shows().where(Show.venue_id == venue_id), upcoming, now)
+
+
+def artist_shows(artist_id, upcoming, now):
+    return _split(_artist_shows().where(Show.artist_id == artist_id), upcoming, now)
+
+
+def venues_shows(venue_ids, upcoming, now):
+    # venue_shows() for a batch of venues, tagged with the venue id.
+    stmt = _venue_shows().add_columns(Show.venue_id).where(Show.venue_id.in_(venue_ids))
+    return _split(stmt, upcoming, now)
+
+
+def artists_shows(artist_ids, upcoming, now):
+    stmt = _artist_shows().add_columns(Show.artist_id).where(Show.artist_id.in_(artist_ids))
+    return _split(stmt, upcoming, now)
+
+
+#  Page validators (see conditional.py)
+#  ----------------------------------------------------------------
+
+def show_listing_version():
+    # For keyset_query() with the listing's order and filters.
+    return show_listing().with_only_columns(
+        Show.start_time,
+        Show.id,
+        Show.updated_at,
+        Venue.updated_at.label('venue_updated_at'),
+        Artist.updated_at.label('artist_updated_at'),
+    )
+
+
+def venue_listing_version():
+    return select(Venue.state, Venue.city, Venue.id, Venue.updated_at)
+
+
+def artist_listing_version():
+    return select(Artist.id, Artist.updated_at)
+
+
+def venue_version(venue_id):
+    # One primary key lookup: the writes that change a venue's page all move
+    # its updated_at (see models.touch_partners).
+    return select(Venue.updated_at).where(Venue.id == venue_id)
+
+
+def artist_version(artist_id):
+    return select(Artist.updated_at).where(Artist.id == artist_id)
@@ -0,0 +1,62 @@
+import random
+
+from flask import g, has_app_context, request
+from flask_sqlalchemy.session import Session
+
+#----------------------------------------------------------------------------#
+# Read replica routing.
+#
+# DATABASE_REPLICA_URLS become the binds "replica_0", "replica_1", ... . A
+# GET or HEAD request, or a view marked @read_only, picks one replica at
+# random and the session sends its queries there. Everything else (form
+# posts, deletes, CLI commands) and anything the session flushes or that
+# is an INSERT/UPDATE/DELETE stays on the primary.
+#
+# Read-your-writes: a request that may have written sets a short-lived
+# cookie, and requests carrying it read from the primary until it expires,
+# so the page a form redirects to is never older than the form's write.
+#----------------------------------------------------------------------------#
+
+REPLICA_PREFIX = 'replica_'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+COOKIE = 'fyyur_primary'
+
+
+def reading_replica():
+    # The replica bind this request reads from, or None for the primary.
+    return g.get('read_replica') if has_app_context() else None
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not getattr(clause, 'is_dml', False):
+            key = reading_replica()
+            if key is not None:
+                return self._db.engines[key]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_only(view):
+    # For views that take POST but only read, like the search forms.
+    view.read_only = True
+    return view
+
+
+def init_app(app):
+    keys = [key for key in app.config.get('SQLALCHEMY_BINDS') or {}
+            if key.startswith(REPLICA_PREFIX)]
+    window = app.config['REPLICA_LAG_WINDOW']
+
+    @app.before_request
+    def choose_bind():
+        if not keys or request.cookies.get(COOKIE):
+            return
+        view = app.view_functions.get(request.endpoint)
+        if request.method in SAFE_METHODS or getattr(view, 'read_only', False):
+            g.read_replica = random.choice(keys)
+
+    @app.after_request
+    def remember_write(response):
+        if keys and g.get('read_replica') is None and request.method not in SAFE_METHODS:
+            response.set_cookie(COOKIE, '1', max_age=window, httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,266 @@
+import re
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import Double, Float, cast, column, func, literal, literal_column, or_, select, table, text
+
+from models import db, Venue, Venue_Genre, Artist, Artist_Genre
+
+#----------------------------------------------------------------------------#
+# Venue and artist search.
+#
+# Postgres keeps a weighted tsvector per row (name > city/state > genres) in
+# a GIN index, with a pg_trgm index on name for partial and misspelt names.
+# SQLite keeps the same four fields in an FTS5 table using the trigram
+# tokenizer. Both backends return a subquery of (id, name, score) where a
+# lower score is a better match, so the views can keyset-paginate on
+# (score, id) without caring which database is behind them.
+#----------------------------------------------------------------------------#
+
+
+class SearchEntity:
+    def __init__(self, model, genre_model, foreign_key):
+        self.model = model
+        self.genre_model = genre_model
+        self.foreign_key = foreign_key
+        self.table = model.__tablename__
+        self.genre_table = genre_model.__tablename__
+        self.fts_table = self.table + '_fts'
+
+
+VENUES = SearchEntity(Venue, Venue_Genre, 'venue_id')
+ARTISTS = SearchEntity(Artist, Artist_Genre, 'artist_id')
+
+
+def _tokens(search_term):
+    return re.findall(r'\w+', search_term.lower())
+
+
+def _like_pattern(search_term):
+    escaped = search_term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return '%' + escaped + '%'
+
+
+def _all_rows(entity):
+    model = entity.model
+    return select(model.id, model.name, literal(0.0, Float).label('score'))
+
+
+class PostgresSearch:
+    def query(self, entity, search_term):
+        model = entity.model
+        tokens = _tokens(search_term)
+        if not tokens:
+            return _all_rows(entity).subquery('search')
+
+        ts_query = func.to_tsquery('simple', ' & '.join(t + ':*' for t in tokens))
+        rank = (func.ts_rank(model.search_vector, ts_query, type_=Float)
+                + func.similarity(model.name, search_term, type_=Float))
+        # Both functions return real. The score goes into the cursor as a
+        # float8, which would not compare equal to the real it came from on
+        # the next page, so it is widened before it is compared or encoded.
+        score = cast(-rank, Double)
+        return (
+            select(model.id, model.name, score.label('score'))
+            .where(or_(
+                model.search_vector.op('@@')(ts_query),
+                model.name.ilike(_like_pattern(search_term), escape='\\'),
+                model.name.op('%')(search_term),
+            ))
+            .subquery('search')
+        )
+
+    def _update(self, entity, where, params):
+        db.session.execute(text(f"""
+            UPDATE {entity.table} SET search_vector =
+                setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+                setweight(to_tsvector('simple', coalesce(city, '') || ' ' || coalesce(state, '')), 'B') ||
+                setweight(to_tsvector('simple', coalesce((
+                    SELECT string_agg(genres.name, ' ') FROM {entity.genre_table}
+                    JOIN genres ON genres.id = {entity.genre_table}.genre_id
+                    WHERE {entity.foreign_key} = {entity.table}.id), '')), 'C')
+            WHERE {where}
+        """), params)
+
+    def index(self, entity, entity_id):
+        self._update(entity, 'id = :id', {'id': entity_id})
+
+    def remove(self, entity, entity_id):
+        # The vector lives on the row itself and goes away with it.
+        pass
+
+    def backfill(self, entity, batch_size):
+        max_id = db.session.execute(select(func.max(entity.model.id))).scalar() or 0
+        for low in range(0, max_id, batch_size):
+            self._update(entity, 'id > :low AND id <= :high',
+                         {'low': low, 'high': low + batch_size})
+            db.session.commit()
+            yield min(low + batch_size, max_id)
+
+
+class SqliteSearch:
+    def __init__(self):
+        self._ready = set()
+
+    def _create_schema(self, executor, entity):
+        exists = executor.execute(
+            text("SELECT 1 FROM sqlite_master WHERE name = :name"),
+            {'name': entity.fts_table}).first()
+        if not exists:
+            executor.execute(text(
+                f"CREATE VIRTUAL TABLE {entity.fts_table} "
+                f"USING fts5(name, city, state, genres, tokenize='trigram')"))
+            self._insert(executor, entity, '1 = 1', {})
+
+    def _ensure_schema(self, entity, executor=None):
+        # Reads create the table on their own connection so the DDL commits
+        # even if the request's session is rolled back. Writes already hold
+        # the database lock, so they create it inside their own transaction
+        # and leave marking it ready to the next read. A freshly created
+        # index is filled from the existing rows straight away.
+        key = (db.engine.url, entity.fts_table)
+        if key in self._ready:
+            return
+        if executor is not None:
+            self._create_schema(executor, entity)
+            return
+        with db.engine.begin() as connection:
+            self._create_schema(connection, entity)
+        self._ready.add(key)
+
+    def query(self, entity, search_term):
+        self._ensure_schema(entity)
+        model = entity.model
+        fts = table(entity.fts_table, column('rowid'), column('name'))
+
+        # The trigram tokenizer cannot match terms under three characters, so
+        # those are dropped from the MATCH, or fall back to a LIKE on name
+        # when nothing longer is left.
+        tokens = [t for t in _tokens(search_term) if len(t) >= 3]
+        if tokens:
+            fts_ref = literal_column(entity.fts_table)
+            condition = fts_ref.op('MATCH')(' AND '.join('"%s"' % t for t in tokens))
+            score = func.bm25(fts_ref, 10.0, 2.0, 2.0, 1.0, type_=Float)
+        elif search_term:
+            condition = fts.c.name.like(_like_pattern(search_term), escape='\\')
+            score = literal(0.0, Float)
+        else:
+            return _all_rows(entity).subquery('search')
+
+        return (
+            select(model.id, model.name, score.label('score'))
+            .join(fts, fts.c.rowid == model.id)
+            .where(condition)
+            .subquery('search')
+        )
+
+    def _insert(self, executor, entity, where, params):
+        executor.execute(text(f"""
+            INSERT INTO {entity.fts_table} (rowid, name, city, state, genres)
+            SELECT id, name, city, state, (
+                SELECT group_concat(genres.name, ' ') FROM {entity.genre_table}
+                JOIN genres ON genres.id = {entity.genre_table}.genre_id
+                WHERE {entity.foreign_key} = {entity.table}.id)
+            FROM {entity.table} WHERE {where}
+        """), params)
+
+    def index(self, entity, entity_id):
+        self.remove(entity, entity_id)
+        self._insert(db.session, entity, 'id = :id', {'id': entity_id})
+
+    def remove(self, entity, entity_id):
+        self._ensure_schema(entity, db.session)
+        db.session.execute(
+            text(f"DELETE FROM {entity.fts_table} WHERE rowid = :id"), {'id': entity_id})
+
+    def backfill(self, entity, batch_size):
+        self._ensure_schema(entity, db.session)
+        db.session.execute(text(f"DELETE FROM {entity.fts_table}"))
+        max_id = db.session.execute(select(func.max(entity.model.id))).scalar() or 0
+        for low in range(0, max_id, batch_size):
+            self._insert(db.session, entity, 'id > :low AND id <= :high',
+                         {'low': low, 'high': low + batch_size})
+            db.session.commit()
+            yield min(low + batch_size, max_id)
+        db.session.commit()
+
+
+class LikeSearch:
+    # Unindexed fallback for databases without a dedicated backend.
+    def query(self, entity, search_term):
+        model = entity.model
+        return (
+            _all_rows(entity)
+            .where(model.name.ilike(_like_pattern(search_term), escape='\\'))
+            .subquery('search')
+        )
+
+    def index(self, entity, entity_id):
+        pass
+
+    def remove(self, entity, entity_id):
+        pass
+
+    def backfill(self, entity, batch_size):
+        return iter(())
+
+
+_BACKENDS = {
+    'postgresql': PostgresSearch(),
+    'sqlite': SqliteSearch(),
+}
+_FALLBACK = LikeSearch()
+
+
+def backend():
+    return _BACKENDS.get(db.engine.dialect.name, _FALLBACK)
+
+
+def venues(search_term):
+    return backend().query(VENUES, search_term)
+
+
+def artists(search_term):
+    return backend().query(ARTISTS, search_term)
+
+
+def order(results):
+    return (results.c.score, results.c.id)
+
+
+def index_venue(venue_id):
+    # The index is rebuilt from the tables with plain SQL, which does not
+    # autoflush, so pending ORM changes are written out first.
+    db.session.flush()
+    backend().index(VENUES, venue_id)
+
+
+def index_artist(artist_id):
+    db.session.flush()
+    backend().index(ARTISTS, artist_id)
+
+
+def remove_venue(venue_id):
+    backend().remove(VENUES, venue_id)
+
+
+def remove_artist(artist_id):
+    backend().remove(ARTISTS, artist_id)
+
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+search_cli = AppGroup('search', help='Maintain the venue and artist search index.')
+
+
+@search_cli.command('backfill')
+@click.option('--batch-size', default=5000, show_default=True,
+              help='Rows indexed per transaction.')
+def backfill_command(batch_size):
+    """Rebuild the search index for every venue and artist."""
+    for name, entity in (('venues', VENUES), ('artists', ARTISTS)):
+        for done in backend().backfill(entity, batch_size):
+            click.echo(f'{name}: indexed up to id {done}')
+    click.echo('Search index is up to date.')
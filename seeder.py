@@ -0,0 +1,245 @@
+import csv
+import gzip
+import itertools
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import delete, func, select, text
+
+from forms import VenueForm, ArtistForm
+from importer import VENUE_FIELDS, ARTIST_FIELDS, SHOW_FIELDS, sync_sequence, write_rows
+from models import db, Venue, Venue_Genre, Artist, Artist_Genre, Show, genre_ids
+import counters
+import search
+
+#----------------------------------------------------------------------------#
+# Synthetic data.
+#
+#   flask seed --scale 100 [--seed 1] [--start 2026-01-01]
+#   flask seed --scale 100 --out data/      (files for `flask import`)
+#
+# One unit of scale is 1,000 venues, 1,000 artists and 10,000 shows, so
+# --scale 1000 is a million venues and artists and 10M shows. The same
+# seed, scale and start date always produce the same rows, and the start
+# date is fixed unless given, so runs on different days match. Each table is
+# drawn from its own generator, so the shows do not change when, say, only
+# the venue columns are touched.
+#
+# Popularity is skewed: venues and artists are ranked in a random order and
+# picked for shows with Zipf weights (1/rank), and genres and cities are
+# weighted the same way. Shows start on the hour, from two years before the
+# start date to one year after it.
+#
+# Rows are generated and written in chunks, with COPY on Postgres, so memory
+# use does not depend on the scale. Within a chunk each column is drawn in
+# one batch from the table's generator.
+#----------------------------------------------------------------------------#
+
+UNIT_VENUES = 1000
+UNIT_ARTISTS = 1000
+UNIT_SHOWS = 10000
+CHUNK_SIZE = 50000
+# Fixed rather than today, so a seed gives the same rows on any day.
+DEFAULT_START = datetime(2026, 1, 1)
+
+CITIES = [
+    ('New York', 'NY'), ('Los Angeles', 'CA'), ('Chicago', 'IL'), ('Austin', 'TX'),
+    ('San Francisco', 'CA'), ('Nashville', 'TN'), ('Seattle', 'WA'), ('Boston', 'MA'),
+    ('Atlanta', 'GA'), ('Denver', 'CO'), ('Portland', 'OR'), ('New Orleans', 'LA'),
+    ('Philadelphia', 'PA'), ('Minneapolis', 'MN'), ('Detroit', 'MI'), ('Miami', 'FL'),
+    ('Phoenix', 'AZ'), ('Salt Lake City', 'UT'), ('Kansas City', 'MO'), ('Honolulu', 'HI'),
+]
+WORDS = [
+    'Blue', 'Red', 'Golden', 'Velvet', 'Electric', 'Silver', 'Midnight', 'Lucky', 'Wild',
+    'Echo', 'Moon', 'Star', 'River', 'Harbor', 'Garden', 'Iron', 'Crystal', 'Neon',
+    'Owl', 'Fox', 'Crow', 'Tiger', 'Rose', 'Lantern', 'Anchor', 'Canyon', 'Signal',
+]
+VENUE_NOUNS = ['Hall', 'Room', 'Club', 'Lounge', 'Theater', 'Ballroom', 'Tavern', 'Loft', 'Stage']
+ARTIST_NOUNS = ['Band', 'Trio', 'Collective', 'Orchestra', 'Project', 'Quartet', 'Crew', 'Ensemble']
+STREETS = ['Main St', 'Market St', 'Broadway', 'Oak Ave', 'Elm St', 'Mission St', 'Park Ave']
+
+
+def _choices(field):
+    return [value for value, _ in field.kwargs['choices']]
+
+
+def _zipf(count):
+    # Cumulative 1/rank weights, for random.choices(cum_weights=...).
+    return list(itertools.accumulate(1 / rank for rank in range(1, count + 1)))
+
+
+def _chunks(count, size=CHUNK_SIZE):
+    for start in range(0, count, size):
+        yield start, min(size, count - start)
+
+
+class Dataset:
+    def __init__(self, scale, seed=1, start=None):
+        self.seed = seed
+        self.venue_count = int(scale * UNIT_VENUES)
+        self.artist_count = int(scale * UNIT_ARTISTS)
+        self.show_count = int(scale * UNIT_SHOWS)
+        self.start = start or DEFAULT_START
+
+    def _rng(self, name):
+        return random.Random(f'{self.seed}:{name}')
+
+    def _owners(self, name, count, nouns, genres, extra):
+        # Rows in importer column order, followed by a list of genres. Each
+        # column of a chunk is drawn with one batched call; only the string
+        # formatting is done row by row.
+        rng = self._rng(name)
+        city_weights = _zipf(len(CITIES))
+        genre_weights = _zipf(len(genres))
+        for first, size in _chunks(count):
+            cities = rng.choices(CITIES, cum_weights=city_weights, k=size)
+            names = rng.choices(WORDS, k=size), rng.choices(WORDS, k=size), rng.choices(nouns, k=size)
+            seeking = rng.choices((True, False), weights=(1, 4), k=size)
+            area_codes = rng.choices(range(200, 1000), k=size)
+            lines = rng.choices(range(10000), k=size)
+            genre_counts = rng.choices((1, 2, 3), k=size)
+            picked = iter(rng.choices(genres, cum_weights=genre_weights, k=sum(genre_counts)))
+            columns = zip(range(first + 1, first + size + 1), zip(*names), cities, extra(rng, size),
+                          seeking, area_codes, lines, genre_counts)
+            chunk = []
+            for row_id, words, (city, state), extras, wants, area_code, line, genre_count in columns:
+                name = ' '.join(words)
+                slug = name.lower().replace(' ', '')
+                chunk.append([
+                    row_id, name, *extras, city, state,
+                    f'{area_code}-555-{line:04d}',
+                    f'https://{slug}.example.com', f'https://www.facebook.com/{slug}{row_id}',
+                    wants, 'Looking for new bookings.' if wants else None,
+                    f'https://images.example.com/{slug}/{row_id}.jpg',
+                    list(dict.fromkeys(itertools.islice(picked, genre_count))),
+                ])
+            yield chunk
+
+    def venues(self):
+        def address(rng, size):
+            return [[f'{number} {street}'] for number, street in zip(
+                rng.choices(range(1, 10000), k=size), rng.choices(STREETS, k=size))]
+        return self._owners('venues', self.venue_count, VENUE_NOUNS, _choices(VenueForm.genres),
+                            address)
+
+    def artists(self):
+        return self._owners('artists', self.artist_count, ARTIST_NOUNS, _choices(ArtistForm.genres),
+                            lambda rng, size: [[]] * size)
+
+    def shows(self):
+        rng = self._rng('shows')
+        # Popularity rank -> id, shuffled so the busiest rows are spread out.
+        venue_ids = list(range(1, self.venue_count + 1))
+        artist_ids = list(range(1, self.artist_count + 1))
+        rng.shuffle(venue_ids)
+        rng.shuffle(artist_ids)
+        venue_weights = _zipf(len(venue_ids))
+        artist_weights = _zipf(len(artist_ids))
+        first_hour = self.start - timedelta(days=730)
+        hours = [first_hour + timedelta(hours=h) for h in range(24 * 1095)]
+
+        for first, size in _chunks(self.show_count):
+            yield [
+                [first + offset + 1, start_time, venue_id, artist_id]
+                for offset, (start_time, venue_id, artist_id) in enumerate(zip(
+                    rng.choices(hours, k=size),
+                    rng.choices(venue_ids, cum_weights=venue_weights, k=size),
+                    rng.choices(artist_ids, cum_weights=artist_weights, k=size)))
+            ]
+
+
+# (table name, model, genre model, columns)
+TABLES = [
+    ('venues', Venue, Venue_Genre, ['id'] + list(VENUE_FIELDS)),
+    ('artists', Artist, Artist_Genre, ['id'] + list(ARTIST_FIELDS)),
+    ('shows', Show, None, ['id'] + list(SHOW_FIELDS)),
+]
+
+
+def _is_empty():
+    return all(db.session.execute(select(func.count()).select_from(model)).scalar() == 0
+               for _, model, _, _ in TABLES)
+
+
+def reset_tables():
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text('TRUNCATE shows, venue_genres, artist_genres, venues, artists '
+                                'RESTART IDENTITY CASCADE'))
+    else:
+        for model in (Show, Venue_Genre, Artist_Genre, Venue, Artist):
+            db.session.execute(delete(model))
+    db.session.commit()
+
+
+def load(dataset, echo=click.echo):
+    for name, model, genre_model, columns in TABLES:
+        started = time.perf_counter()
+        loaded = 0
+        for chunk in getattr(dataset, name)():
+            width = len(columns)
+            write_rows(model.__table__, columns, [row[:width] for row in chunk])
+            if genre_model is not None:
+                ids = genre_ids(genre for row in chunk for genre in row[width])
+                write_rows(genre_model.__table__, ['genre_id', genre_model.owner_key],
+                           [[ids[genre], row[0]] for row in chunk for genre in row[width]])
+            db.session.commit()
+            loaded += len(chunk)
+            elapsed = time.perf_counter() - started
+            echo(f'{name}: {loaded:,} rows, {loaded / elapsed:,.0f} rows/s')
+        sync_sequence(model.__table__)
+    counters.rebuild()
+
+
+def emit(dataset, directory, echo=click.echo):
+    # gzipped CSV in the importer's format, venues and artists first.
+    os.makedirs(directory, exist_ok=True)
+    for name, model, genre_model, columns in TABLES:
+        path = os.path.join(directory, f'{name}.csv.gz')
+        with gzip.open(path, 'wt', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(columns + (['genres'] if genre_model is not None else []))
+            width = len(columns)
+            for chunk in getattr(dataset, name)():
+                if genre_model is not None:
+                    chunk = [row[:width] + [';'.join(row[width])] for row in chunk]
+                writer.writerows(chunk)
+        echo(f'wrote {path}')
+
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+@click.command('seed')
+@click.option('--scale', type=float, default=1, show_default=True,
+              help='Units of 1,000 venues, 1,000 artists and 10,000 shows.')
+@click.option('--seed', 'seed_value', type=int, default=1, show_default=True)
+@click.option('--start', type=click.DateTime(), help='Date the shows are spread around; default 2026-01-01.')
+@click.option('--out', type=click.Path(file_okay=False),
+              help='Write gzipped CSV files here instead of loading the database.')
+@click.option('--reset', is_flag=True, help='Delete existing venues, artists and shows first.')
+@click.option('--index/--no-index', default=True, show_default=True,
+              help='Rebuild the search index after loading.')
+@with_appcontext
+def seed_command(scale, seed_value, start, out, reset, index):
+    """Generate a deterministic synthetic dataset."""
+    dataset = Dataset(scale, seed_value, start)
+    if out:
+        emit(dataset, out)
+        return
+
+    if reset:
+        reset_tables()
+    elif not _is_empty():
+        raise click.ClickException('Venues, artists or shows already exist; pass --reset.')
+    load(dataset)
+
+    if index:
+        for entity in (search.VENUES, search.ARTISTS):
+            for _ in search.backend().backfill(entity, 5000):
+                pass
+        click.echo('Search index rebuilt.')
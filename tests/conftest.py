@@ -0,0 +1,38 @@
+import os
+import tempfile
+
+import pytest
+from sqlalchemy import text
+
+# The app reads its configuration when it is imported, so the test database
+# has to be chosen first.
+DIRECTORY = tempfile.mkdtemp(prefix='fyyur-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(DIRECTORY, 'fyyur.db')
+os.environ['DATABASE_REPLICA_URLS'] = ''
+os.environ['CACHE_BACKEND'] = 'lru'
+os.environ['THUMBNAIL_DIR'] = os.path.join(DIRECTORY, 'thumbnails')
+
+from app import app as fyyur  # noqa: E402
+from models import db  # noqa: E402
+import search  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    fyyur.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with fyyur.app_context():
+        db.create_all()
+    yield fyyur
+    with fyyur.app_context():
+        db.session.remove()
+        db.drop_all()
+        # The FTS5 tables are not in the metadata.
+        with db.engine.begin() as connection:
+            for entity in (search.VENUES, search.ARTISTS):
+                connection.execute(text(f'DROP TABLE IF EXISTS {entity.fts_table}'))
+        search.backend()._ready.clear()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,49 @@
+import asyncio
+
+import asgi
+from tests.test_search import artist_form, venue_form
+
+
+async def call(path):
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'raw_path': path.encode(),
+             'query_string': b'', 'headers': [], 'http_version': '1.1', 'scheme': 'http',
+             'server': ('localhost', 80), 'client': ('127.0.0.1', 1234), 'root_path': ''}
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await asgi.application(scope, receive, send)
+    return messages[0]['status'], b''.join(m.get('body', b'') for m in messages[1:])
+
+
+def get(*paths):
+    async def main():
+        try:
+            return [await call(path) for path in paths]
+        finally:
+            # The engine's connections belong to this event loop.
+            await asgi.database.dispose()
+    return asyncio.run(main())
+
+
+def test_async_pages_match_the_sync_ones(client):
+    client.post('/venues/create', data=venue_form())
+    client.post('/artists/create', data=artist_form())
+    client.post('/shows/create', data={'venue_id': 1, 'artist_id': 1,
+                                       'start_time': '2030-01-01 20:00:00'})
+    client.get('/')
+
+    for (status, body), path in zip(get('/venues/1', '/artists/1'), ['/venues/1', '/artists/1']):
+        assert status == 200
+        assert b'error occurred' not in body
+        assert body == client.get(path).get_data()
+
+
+def test_missing_pages_are_not_found(client):
+    assert [status for status, _ in get('/venues/404', '/artists/404')] == [404, 404]
+    assert client.get('/venues/404').status_code == 404
+    assert client.get('/artists/404').status_code == 404
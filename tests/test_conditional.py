@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, text
+
+from models import db, Venue, Artist, utcnow
+import counters
+import queries
+
+from tests.test_search import artist_form, venue_form
+
+
+def test_updated_at_is_utc_from_every_writer(app):
+    with app.app_context():
+        before = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+        db.session.add(Venue(name='From the app'))
+        db.session.execute(text("INSERT INTO venues (name) VALUES ('From the database')"))
+        db.session.commit()
+        stamps = db.session.execute(select(Venue.updated_at)).scalars().all()
+    assert len(stamps) == 2
+    for stamp in stamps:
+        assert before - timedelta(seconds=1) <= stamp <= utcnow()
+
+
+def test_last_modified_is_the_utc_updated_at(app, client):
+    with app.app_context():
+        venue = Venue(name='The Musical Hop')
+        db.session.add(venue)
+        db.session.commit()
+        updated_at = venue.updated_at
+
+    response = client.get('/venues/1')
+    assert response.last_modified == updated_at.replace(microsecond=0, tzinfo=timezone.utc)
+    response = client.get('/venues/1', headers={'If-Modified-Since': response.headers['Last-Modified']})
+    assert response.status_code == 304
+
+
+def etag(client, path):
+    # The first view shows any flashed messages and so carries no ETag.
+    client.get(path)
+    response = client.get(path)
+    assert response.status_code == 200
+    return response.headers['ETag']
+
+
+def test_detail_versions_are_one_row(app):
+    with app.app_context():
+        for stmt in (queries.venue_version(1), queries.artist_version(1)):
+            assert 'JOIN' not in str(stmt) and 'GROUP BY' not in str(stmt)
+
+
+def test_writes_move_the_pages_that_show_them(app, client):
+    client.post('/venues/create', data=venue_form())
+    client.post('/artists/create', data=artist_form())
+    venue, artist = etag(client, '/venues/1'), etag(client, '/artists/1')
+
+    client.post('/shows/create', data={'venue_id': 1, 'artist_id': 1,
+                                       'start_time': '2030-01-01 20:00:00'})
+    assert etag(client, '/venues/1') != venue
+    assert etag(client, '/artists/1') != artist
+    venue, artist = etag(client, '/venues/1'), etag(client, '/artists/1')
+
+    # Each page lists the other side's name.
+    client.post('/artists/1/edit', data=artist_form(name='Petals'))
+    assert etag(client, '/venues/1') != venue
+    assert 'Petals' in client.get('/venues/1').get_data(as_text=True)
+    venue = etag(client, '/venues/1')
+    client.post('/venues/1/edit', data=venue_form(name='The Hop'))
+    assert etag(client, '/artists/1') != artist
+    assert 'The Hop' in client.get('/artists/1').get_data(as_text=True)
+    artist = etag(client, '/artists/1')
+
+    with app.app_context():
+        counters.rebuild()
+    assert etag(client, '/venues/1') != venue
+    artist = etag(client, '/artists/1')
+
+    client.delete('/venues/1')
+    assert etag(client, '/artists/1') != artist
@@ -0,0 +1,50 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from models import db, Venue, Artist, Show
+import counters
+import dates
+
+
+@pytest.fixture
+def host_zone(monkeypatch):
+    # A host clock well away from UTC; start times stay in SHOW_TIMEZONE.
+    monkeypatch.setenv('TZ', 'America/Los_Angeles')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def utc():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def test_now_is_in_show_timezone(app, host_zone, monkeypatch):
+    with app.app_context():
+        assert abs(dates.now() - utc()) < timedelta(minutes=1)
+        monkeypatch.setitem(app.config, 'SHOW_TIMEZONE', 'Pacific/Kiritimati')
+        assert abs(dates.now() - (utc() + timedelta(hours=14))) < timedelta(minutes=1)
+
+
+def test_counters_split_shows_at_show_timezone_now(app, host_zone, client):
+    with app.app_context():
+        venue = Venue(name='The Musical Hop', city='San Francisco', state='CA')
+        artist = Artist(name='Guns N Petals', city='San Francisco', state='CA')
+        db.session.add_all([venue, artist])
+        db.session.flush()
+        # An hour ago in UTC, which the host's own clock puts hours ahead.
+        db.session.add(Show(venue_id=venue.id, artist_id=artist.id,
+                            start_time=utc() - timedelta(hours=1)))
+        db.session.add(Show(venue_id=venue.id, artist_id=artist.id))
+        db.session.commit()
+
+        as_of = counters.rebuild()
+        assert abs(as_of - utc()) < timedelta(minutes=1)
+        venue = db.session.get(Venue, venue.id)
+        assert (venue.upcoming_shows_count, venue.past_shows_count) == (0, 2)
+        db.session.close()
+
+    assert client.get('/shows/create').status_code == 200
@@ -0,0 +1,93 @@
+import pytest
+
+import app as fyyur
+from models import db, Venue, Artist
+
+from tests.test_search import artist_form, venue_form
+
+
+def create(client):
+    client.post('/venues/create', data=venue_form())
+    client.post('/artists/create', data=artist_form())
+    with fyyur.app.app_context():
+        return (db.session.execute(db.select(Venue.id)).scalar_one(),
+                db.session.execute(db.select(Artist.id)).scalar_one())
+
+
+def stored_name(model, id):
+    with fyyur.app.app_context():
+        return db.session.get(model, id).name
+
+
+def test_edits_are_saved(client):
+    venue_id, artist_id = create(client)
+
+    response = client.post(f'/venues/{venue_id}/edit', data=venue_form(name='The Hop'))
+    assert response.status_code == 302
+    response = client.post(f'/artists/{artist_id}/edit', data=artist_form(name='Petals'))
+    assert response.status_code == 302
+
+    assert stored_name(Venue, venue_id) == 'The Hop'
+    assert stored_name(Artist, artist_id) == 'Petals'
+
+
+def test_invalid_edits_return_the_form(client):
+    venue_id, artist_id = create(client)
+
+    response = client.post(f'/venues/{venue_id}/edit', data=venue_form(name='', phone='nope'))
+    assert response.status_code == 200
+    assert f'action="/venues/{venue_id}/edit"' in response.get_data(as_text=True)
+    response = client.post(f'/artists/{artist_id}/edit', data=artist_form(genres=['Polka']))
+    assert response.status_code == 200
+    assert f'action="/artists/{artist_id}/edit"' in response.get_data(as_text=True)
+
+    assert stored_name(Venue, venue_id) == 'The Musical Hop'
+    assert stored_name(Artist, artist_id) == 'Guns N Petals'
+
+
+def test_failed_edits_roll_back(client, monkeypatch):
+    venue_id, artist_id = create(client)
+
+    def unknown_genres(*args):
+        raise ValueError('Unknown genres: Polka')
+
+    monkeypatch.setattr(fyyur, 'update_genres', unknown_genres)
+    response = client.post(f'/venues/{venue_id}/edit', data=venue_form(name='The Hop'))
+    assert response.status_code == 302
+    response = client.post(f'/artists/{artist_id}/edit', data=artist_form(name='Petals'))
+    assert response.status_code == 302
+
+    assert stored_name(Venue, venue_id) == 'The Musical Hop'
+    assert stored_name(Artist, artist_id) == 'Guns N Petals'
+
+
+def test_missing_records_are_not_found(client):
+    assert client.post('/venues/999/edit', data=venue_form()).status_code == 404
+    assert client.post('/artists/999/edit', data=artist_form()).status_code == 404
+
+
+def test_failed_creates_roll_back(client, monkeypatch):
+    def unknown_genres(*args):
+        raise ValueError('Unknown genres: Polka')
+
+    monkeypatch.setattr(fyyur, 'add_genres', unknown_genres)
+    assert 'could not be listed' in client.post(
+        '/venues/create', data=venue_form()).get_data(as_text=True)
+    assert 'could not be listed' in client.post(
+        '/artists/create', data=artist_form()).get_data(as_text=True)
+
+    with fyyur.app.app_context():
+        assert db.session.execute(db.select(Venue.id)).first() is None
+        assert db.session.execute(db.select(Artist.id)).first() is None
+
+
+def test_create_bugs_are_not_flashed(client, monkeypatch):
+    def broken(*args):
+        raise TypeError('a programming error')
+
+    # TESTING propagates what would otherwise be a 500.
+    monkeypatch.setattr(fyyur, 'add_genres', broken)
+    with pytest.raises(TypeError):
+        client.post('/venues/create', data=venue_form())
+    with pytest.raises(TypeError):
+        client.post('/artists/create', data=artist_form())
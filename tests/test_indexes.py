@@ -0,0 +1,35 @@
+from sqlalchemy import select, text
+
+from models import db, Artist
+import indexes
+
+
+def check(app):
+    return app.test_cli_runner().invoke(args=['indexes', 'check'])
+
+
+def test_view_queries_are_index_backed(app):
+    result = check(app)
+    assert result.exit_code == 0, result.output
+    for name in ['artists: first page', 'venues: version', 'show_venue: version',
+                 'api shows: first page', 'api artists: detail']:
+        assert f'ok    {name}\n' in result.output
+
+
+def test_a_missing_index_fails(app):
+    with app.app_context():
+        db.session.execute(text('DROP INDEX ix_venues_state_city_id'))
+        db.session.commit()
+
+    result = check(app)
+    assert result.exit_code != 0
+    assert 'FAIL  venues: first page: sequential scan on venues' in result.output
+    assert 'FAIL  api venues: first page: sequential scan on venues' in result.output
+
+
+def test_only_a_limited_walk_passes_as_a_first_page(app):
+    with app.app_context():
+        assert indexes.sequential_scans(select(Artist.id).order_by(Artist.id).limit(10)) == set()
+        assert indexes.sequential_scans(select(Artist.id).order_by(Artist.id)) == {'artists'}
+        assert indexes.sequential_scans(
+            select(Artist.id).order_by(Artist.facebook_link).limit(10)) == {'artists'}
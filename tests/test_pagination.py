@@ -0,0 +1,48 @@
+import base64
+import json
+
+import pytest
+
+
+def cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+@pytest.mark.parametrize('path', ['/shows', '/api/v1/shows'])
+@pytest.mark.parametrize('token', [
+    cursor([1, 2]),
+    cursor([['2026-01-01'], 2]),
+    cursor(['not a date', 2]),
+    cursor([1]),
+    'not base64 json',
+])
+def test_malformed_cursors_are_rejected(client, path, token):
+    assert client.get(path, query_string={'after': token}).status_code == 400
+    assert client.get(path, query_string={'before': token}).status_code == 400
+
+
+@pytest.mark.parametrize('path, token', [
+    ('/api/v1/artists', 'W3t9XQ'),
+    ('/api/v1/artists', cursor(['1'])),
+    ('/api/v1/artists', cursor([True])),
+    ('/api/v1/artists', cursor([1.5])),
+    ('/artists', cursor([[1]])),
+    ('/api/v1/venues', cursor([{}, 1, 2])),
+    ('/api/v1/venues', cursor(['CA', 'San Francisco', '2'])),
+    ('/api/v1/venues', cursor(['CA', 7, 2])),
+    ('/venues', cursor(['CA', 'San Francisco', False])),
+    ('/api/v1/shows', cursor(['2026-01-01T20:00:00', '2'])),
+    ('/api/v1/shows', cursor(['2026-01-01T20:00:00', {}])),
+])
+def test_mistyped_cursor_slots_are_rejected(client, path, token):
+    assert client.get(path, query_string={'after': token}).status_code == 400
+    assert client.get(path, query_string={'before': token}).status_code == 400
+
+
+def test_valid_cursor(client):
+    token = cursor(['2026-01-01T20:00:00', 2])
+    assert client.get('/shows', query_string={'after': token}).status_code == 200
+    assert client.get('/api/v1/shows', query_string={'after': token}).status_code == 200
+    token = cursor(['CA', 'San Francisco', 2])
+    assert client.get('/api/v1/venues', query_string={'after': token}).status_code == 200
+    assert client.get('/api/v1/artists', query_string={'after': cursor([2])}).status_code == 200
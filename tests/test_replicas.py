@@ -0,0 +1,66 @@
+from flask import Flask, jsonify, request
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import select
+
+from models import Venue
+import replicas
+
+
+def replica_app(tmp_path):
+    # The app under test has no replica configured, so routing is checked on
+    # a small app of its own, with the same session class and hooks.
+    db = SQLAlchemy(session_options={'class_': replicas.RoutingSession})
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path}/primary.db',
+        SQLALCHEMY_BINDS={'replica_0': f'sqlite:///{tmp_path}/replica.db'},
+        REPLICA_LAG_WINDOW=5,
+    )
+    db.init_app(app)
+    replicas.init_app(app)
+
+    @app.route('/venues', methods=['GET', 'POST'])
+    def venues():
+        if request.method == 'POST':
+            db.session.add(Venue(name=request.form['name']))
+            db.session.commit()
+        names = db.session.execute(select(Venue.name).order_by(Venue.id)).scalars().all()
+        return jsonify(names)
+
+    @app.route('/venues/search', methods=['POST'])
+    @replicas.read_only
+    def search_venues():
+        return jsonify(db.session.execute(select(Venue.name)).scalars().all())
+
+    with app.app_context():
+        for key in (None, 'replica_0'):
+            db.metadata.create_all(db.engines[key], tables=[Venue.__table__])
+        # Tell the databases apart by what they hold.
+        with db.engines[None].begin() as connection:
+            connection.execute(Venue.__table__.insert(), {'name': 'On the primary'})
+        with db.engines['replica_0'].begin() as connection:
+            connection.execute(Venue.__table__.insert(), {'name': 'On the replica'})
+    return app
+
+
+def test_reads_go_to_the_replica(tmp_path):
+    client = replica_app(tmp_path).test_client()
+
+    assert client.get('/venues').get_json() == ['On the replica']
+    assert client.post('/venues/search').get_json() == ['On the replica']
+    assert client.get_cookie(replicas.COOKIE) is None
+
+
+def test_write_pins_the_next_reads_to_the_primary(tmp_path):
+    client = replica_app(tmp_path).test_client()
+
+    response = client.post('/venues', data={'name': 'Just added'})
+    # The write and the read after it in the same request use the primary.
+    assert response.get_json() == ['On the primary', 'Just added']
+    cookie = client.get_cookie(replicas.COOKIE)
+    assert cookie is not None and cookie.max_age == 5
+
+    assert client.get('/venues').get_json() == ['On the primary', 'Just added']
+
+    client.delete_cookie(replicas.COOKIE)
+    assert client.get('/venues').get_json() == ['On the replica']
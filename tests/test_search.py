@@ -0,0 +1,140 @@
+import re
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+
+from models import db, Venue, Artist, Venue_Genre, add_genres
+import search
+
+
+def venue_form(**fields):
+    form = {
+        'name': 'The Musical Hop',
+        'city': 'San Francisco',
+        'state': 'CA',
+        'address': '1015 Folsom Street',
+        'phone': '123-123-1234',
+        'image_link': 'https://example.com/hop.jpg',
+        'genres': ['Jazz'],
+        'facebook_link': 'https://www.facebook.com/TheMusicalHop',
+        'website_link': 'https://www.themusicalhop.com',
+    }
+    form.update(fields)
+    return form
+
+
+def artist_form(**fields):
+    form = venue_form(name='Guns N Petals', genres=['Rock n Roll'])
+    del form['address']
+    form.update(fields)
+    return form
+
+
+def names(response):
+    assert response.status_code == 200
+    return re.findall(r'<h5>(.*?)</h5>', response.get_data(as_text=True))
+
+
+def search_venues(client, term):
+    return names(client.post('/venues/search', data={'search_term': term}))
+
+
+def search_artists(client, term):
+    return names(client.post('/artists/search', data={'search_term': term}))
+
+
+def create_venues(client, *forms):
+    for form in forms:
+        client.post('/venues/create', data=form)
+
+
+def test_substring_and_trigram_matches(client):
+    create_venues(
+        client,
+        venue_form(),
+        venue_form(name='Park Square Live Music and Coffee', city='New York', state='NY',
+                   genres=['Folk']),
+        venue_form(name='The Dueling Pianos Bar', city='New York', state='NY',
+                   genres=['Classical']),
+    )
+
+    assert sorted(search_venues(client, 'music')) == [
+        'Park Square Live Music and Coffee', 'The Musical Hop']
+    # Trigrams match inside words, and every field is searched.
+    assert search_venues(client, 'ueli') == ['The Dueling Pianos Bar']
+    assert search_venues(client, 'francisco') == ['The Musical Hop']
+    assert search_venues(client, 'classical') == ['The Dueling Pianos Bar']
+    assert search_venues(client, 'music york') == ['Park Square Live Music and Coffee']
+    # Too short for a trigram: falls back to LIKE on the name.
+    assert search_venues(client, 'Ho') == ['The Musical Hop']
+    assert search_venues(client, 'nothing like it') == []
+
+
+def test_name_matches_rank_first(client):
+    create_venues(
+        client,
+        venue_form(name='The Blue Room', genres=['Jazz']),
+        venue_form(name='Jazz Corner', genres=['Blues']),
+    )
+
+    assert search_venues(client, 'jazz') == ['Jazz Corner', 'The Blue Room']
+
+
+def test_artist_search(client):
+    client.post('/artists/create', data=artist_form())
+    client.post('/artists/create', data=artist_form(name='Matt Quevedo', genres=['Jazz']))
+
+    assert search_artists(client, 'petal') == ['Guns N Petals']
+    assert search_artists(client, 'jazz') == ['Matt Quevedo']
+
+
+def test_index_follows_writes(client):
+    create_venues(client, venue_form())
+    assert search_venues(client, 'musical') == ['The Musical Hop']
+
+    client.post('/venues/1/edit', data=venue_form(name='The Sonic Hall'))
+    assert search_venues(client, 'musical') == []
+    assert search_venues(client, 'sonic') == ['The Sonic Hall']
+
+    client.delete('/venues/1')
+    assert search_venues(client, 'sonic') == []
+
+
+def test_backfill_rebuilds_the_index(app, client):
+    create_venues(client, venue_form())
+    assert search_venues(client, 'musical') == ['The Musical Hop']
+
+    # Writes that bypass the views leave the index behind.
+    with app.app_context():
+        db.session.add(Venue(name='The Sonic Hall', city='Austin', state='TX'))
+        db.session.add(Artist(name='The Wild Sax Band', city='Austin', state='TX'))
+        db.session.flush()
+        add_genres(Venue_Genre, 2, ['Soul'])
+        db.session.get(Venue, 1).name = 'The Quiet Hop'
+        db.session.commit()
+    assert search_venues(client, 'sonic') == []
+    assert search_venues(client, 'quiet') == []
+    # Matched on the old name, listed under the new one.
+    assert search_venues(client, 'musical') == ['The Quiet Hop']
+
+    result = app.test_cli_runner().invoke(args=['search', 'backfill', '--batch-size', '1'])
+    assert result.exit_code == 0, result.output
+
+    assert search_venues(client, 'sonic') == ['The Sonic Hall']
+    assert search_venues(client, 'soul') == ['The Sonic Hall']
+    assert search_venues(client, 'quiet') == ['The Quiet Hop']
+    assert search_venues(client, 'musical') == []
+    assert search_artists(client, 'sax') == ['The Wild Sax Band']
+
+    with app.app_context():
+        db.session.delete(db.session.get(Venue, 2))
+        db.session.commit()
+    app.test_cli_runner().invoke(args=['search', 'backfill'])
+    assert search_venues(client, 'sonic') == []
+
+
+def test_postgres_scores_survive_the_cursor():
+    # Compiled only: the score has to reach the cursor as float8, not real.
+    results = search.PostgresSearch().query(search.VENUES, 'music hop')
+    sql = str(select(results).compile(dialect=postgresql.dialect()))
+    assert 'AS DOUBLE PRECISION) AS score' in sql
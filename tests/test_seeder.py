@@ -0,0 +1,34 @@
+from sqlalchemy import func, select
+
+from models import db, Venue, Artist, Show, Venue_Genre
+import seeder
+
+
+def rows(dataset):
+    return [list(getattr(dataset, name)()) for name in ('venues', 'artists', 'shows')]
+
+
+def test_same_seed_same_rows():
+    assert rows(seeder.Dataset(0.05, seed=3)) == rows(seeder.Dataset(0.05, seed=3))
+    assert rows(seeder.Dataset(0.05, seed=3)) != rows(seeder.Dataset(0.05, seed=4))
+    assert seeder.Dataset(0.05).start == seeder.DEFAULT_START
+
+
+def test_rows_match_the_importer_columns():
+    dataset = seeder.Dataset(0.01)
+    venue, = next(dataset.venues())[:1]
+    assert len(venue) == len(seeder.TABLES[0][3]) + 1
+    assert venue[0] == 1 and 1 <= len(venue[-1]) <= 3
+    artist, = next(dataset.artists())[:1]
+    assert len(artist) == len(seeder.TABLES[1][3]) + 1
+    show, = next(dataset.shows())[:1]
+    assert len(show) == len(seeder.TABLES[2][3])
+
+
+def test_seed_command_loads_the_dataset(app):
+    result = app.test_cli_runner().invoke(args=['seed', '--scale', '0.01', '--no-index'])
+    assert result.exit_code == 0, result.output
+    with app.app_context():
+        count = lambda model: db.session.execute(select(func.count()).select_from(model)).scalar()
+        assert (count(Venue), count(Artist), count(Show)) == (10, 10, 100)
+        assert count(Venue_Genre) >= 10
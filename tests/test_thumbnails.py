@@ -0,0 +1,198 @@
+import io
+import os
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from PIL import Image
+
+from models import db, Venue
+import thumbnails
+
+
+def png(width=1200, height=800):
+    output = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 40, 40)).save(output, 'PNG')
+    return output.getvalue()
+
+
+class StandIn(BaseHTTPRequestHandler):
+    # Serves /image.png, fails the first `failures` requests for
+    # /flaky.png, and redirects /moved?to=<url>.
+    image = png()
+    failures = 0
+    requests = []
+
+    def do_GET(self):
+        type(self).requests.append(self.path)
+        if self.path.startswith('/moved'):
+            self.send_response(302)
+            self.send_header('Location', self.path.split('to=', 1)[1])
+            self.end_headers()
+        elif self.path == '/flaky.png' and type(self).failures:
+            type(self).failures -= 1
+            self.send_error(500)
+        elif self.path in ('/image.png', '/flaky.png'):
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', str(len(self.image)))
+            self.end_headers()
+            self.wfile.write(self.image)
+        else:
+            self.send_error(404)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stand_in(monkeypatch):
+    StandIn.requests = []
+    StandIn.failures = 0
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # *.test names resolve to the stand-in; the lookups are counted.
+    lookups = []
+    real_getaddrinfo = socket.getaddrinfo
+
+    def getaddrinfo(host, port, *args, **kwargs):
+        if host.endswith('.test'):
+            lookups.append(host)
+            host = '127.0.0.1'
+        return real_getaddrinfo(host, port, *args, **kwargs)
+
+    monkeypatch.setattr(socket, 'getaddrinfo', getaddrinfo)
+    server.lookups = lookups
+    server.url = f'http://images.test:{server.server_port}'
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def config(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'THUMBNAIL_ALLOW_PRIVATE', True)
+    return app.config
+
+
+def test_fetch_connects_to_the_checked_address(stand_in, config):
+    assert thumbnails.fetch(stand_in.url + '/image.png', config) == StandIn.image
+    # One lookup, checked and connected to; nothing resolves the name again.
+    assert stand_in.lookups == ['images.test']
+
+
+def test_fetch_refuses_private_addresses(stand_in, config, monkeypatch):
+    monkeypatch.setitem(config, 'THUMBNAIL_ALLOW_PRIVATE', False)
+    with pytest.raises(ValueError, match='non-public address 127.0.0.1'):
+        thumbnails.fetch(stand_in.url + '/image.png', config)
+    assert StandIn.requests == []
+    with pytest.raises(ValueError, match='not an http'):
+        thumbnails.fetch('file:///etc/passwd', config)
+
+
+def test_fetch_checks_redirects(stand_in, config, monkeypatch):
+    # Let the stand-in count as public and private.test as private.
+    def check_address(host, address, allow_private):
+        if host == 'private.test':
+            raise ValueError(f'{host} resolves to non-public address {address}')
+
+    monkeypatch.setattr(thumbnails, '_check_address', check_address)
+    private = f'http://private.test:{stand_in.server_port}/image.png'
+    with pytest.raises(ValueError, match='private.test'):
+        thumbnails.fetch(f'{stand_in.url}/moved?to={private}', config)
+    with pytest.raises(ValueError, match='not an http'):
+        thumbnails.fetch(f'{stand_in.url}/moved?to=ftp://images.test/image.png', config)
+    assert StandIn.requests == ['/moved?to=' + private, '/moved?to=ftp://images.test/image.png']
+
+    public = f'{stand_in.url}/image.png'
+    assert thumbnails.fetch(f'{stand_in.url}/moved?to={public}', config) == StandIn.image
+
+
+def test_fetch_enforces_the_size_limit(stand_in, config, monkeypatch):
+    monkeypatch.setitem(config, 'THUMBNAIL_MAX_SOURCE_BYTES', 100)
+    with pytest.raises(ValueError, match='larger than 100 bytes'):
+        thumbnails.fetch(stand_in.url + '/image.png', config)
+
+
+def test_render_makes_every_size_and_format():
+    rendered = thumbnails.render(png(2000, 1000))
+    assert set(rendered) == {(size, format) for size in thumbnails.SIZES
+                             for format in thumbnails.FORMATS}
+    for (size, format), data in rendered.items():
+        with Image.open(io.BytesIO(data)) as image:
+            assert image.format == format.upper()
+            assert max(image.size) == thumbnails.SIZES[size]
+
+
+def wait_for(store, key):
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        with thumbnails._pending_lock:
+            pending = key in thumbnails._pending
+        if not pending and store.lookup(key) is not None:
+            return store.lookup(key)
+        time.sleep(0.02)
+    raise AssertionError('thumbnail was not built')
+
+
+def create_venue(app, image_link):
+    with app.app_context():
+        venue = Venue(name='The Musical Hop', city='San Francisco', state='CA',
+                      image_link=image_link)
+        db.session.add(venue)
+        db.session.commit()
+        return venue.id
+
+
+def test_thumbnails_are_fetched_stored_and_served(app, client, stand_in, config):
+    src = stand_in.url + '/image.png'
+    venue_id = create_venue(app, src)
+    key = thumbnails.source_key(src)
+    url = f'/images/venues/{venue_id}/tile/{key}'
+    store = app.extensions['thumbnails']
+
+    # The first request is sent to the source while the fetch runs.
+    response = client.get(url)
+    assert response.status_code == 302
+    assert response.headers['Location'] == src
+    digest = wait_for(store, key)
+    assert digest != thumbnails.FAILED
+    assert os.path.exists(store.open(digest, 'cover', 'webp'))
+
+    response = client.get(url, headers={'Accept': 'image/webp,*/*'})
+    assert response.status_code == 200
+    assert response.mimetype == 'image/webp'
+    response = client.get(url, headers={'Accept': '*/*'})
+    assert response.mimetype == 'image/jpeg'
+    assert 'public' in response.headers['Cache-Control']
+    assert StandIn.requests == ['/image.png']
+
+    # Only the owner's current link is fetched.
+    assert client.get(f'/images/venues/{venue_id}/tile/{"0" * 32}').status_code == 404
+
+
+def test_failed_fetches_are_retried(app, client, stand_in, config):
+    src = stand_in.url + '/flaky.png'
+    StandIn.failures = 1
+    venue_id = create_venue(app, src)
+    key = thumbnails.source_key(src)
+    url = f'/images/venues/{venue_id}/tile/{key}'
+    store = app.extensions['thumbnails']
+
+    client.get(url)
+    assert wait_for(store, key) == thumbnails.FAILED
+    # Within THUMBNAIL_RETRY_SECONDS the failure stands.
+    assert client.get(url).status_code == 302
+    time.sleep(0.1)
+    assert StandIn.requests == ['/flaky.png']
+
+    ref = store._ref_path(key)
+    stale = time.time() - store.retry_seconds - 1
+    os.utime(ref, (stale, stale))
+    assert client.get(url).status_code == 302
+    assert wait_for(store, key) != thumbnails.FAILED
+    assert StandIn.requests == ['/flaky.png', '/flaky.png']
+    assert client.get(url).status_code == 200
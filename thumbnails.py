@@ -0,0 +1,383 @@
+import hashlib
+import http.client
+import io
+import ipaddress
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import urlsplit
+from urllib.request import (HTTPHandler, HTTPRedirectHandler, HTTPSHandler, ProxyHandler,
+                            build_opener)
+
+from flask import Blueprint, abort, current_app, redirect, request, send_file, url_for
+from sqlalchemy import select
+
+from models import db, Venue, Artist
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+#----------------------------------------------------------------------------#
+# Image thumbnails.
+#
+# Templates ask for thumbnail_url('artists', id, image_link, 'tile') instead
+# of hotlinking image_link. The URL names the owner and a hash of its
+# image_link, e.g. /images/artists/12/tile/9f86d081884c7d659a2feaa0c55ad015,
+# so it changes when the link does and can be cached for THUMBNAIL_MAX_AGE.
+#
+# The first request for a source redirects to it and queues a fetch on a
+# background thread pool; the fetch downloads the image once (at most
+# THUMBNAIL_MAX_SOURCE_BYTES) and writes every size as WebP and JPEG. Later
+# requests are served from disk, WebP to clients that accept it. Only links
+# stored on a venue or artist are fetched, and by default only from public
+# addresses: the host is resolved once per connection, redirects included,
+# and the fetch connects to the address that was checked. A failed fetch is
+# retried after THUMBNAIL_RETRY_SECONDS.
+#
+# On disk, under THUMBNAIL_DIR:
+#
+#   refs/9f/9f86d0...           the hash of the source image's bytes
+#   objects/2c/2cf24d....tile.webp
+#
+# Objects are named by the source content, so the same image under several
+# links is stored once. Serving an object refreshes its mtime; once the
+# objects pass THUMBNAIL_CACHE_MAX_BYTES the least recently served are
+# deleted, down to 90% of it. Each process tracks what it has written since
+# its last scan, so the limit is approximate with several workers.
+#
+# Without Pillow installed, or with THUMBNAILS=0, templates hotlink the
+# source as before.
+#----------------------------------------------------------------------------#
+
+# Longest side, in pixels.
+SIZES = {'tile': 480, 'cover': 960}
+FORMATS = {'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+OWNERS = {'venues': Venue, 'artists': Artist}
+FAILED = 'failed'
+# Serving an object touches its mtime at most this often.
+TOUCH_SECONDS = 3600
+
+images = Blueprint('images', __name__)
+
+
+def source_key(url):
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]
+
+
+def thumbnail_url(kind, owner_id, src, size):
+    if not src or not current_app.extensions.get('thumbnails'):
+        return src
+    if urlsplit(src).scheme not in ('http', 'https'):
+        return src
+    return url_for('images.thumbnail', kind=kind, owner_id=owner_id, size=size,
+                   key=source_key(src))
+
+
+#  Store
+#  ----------------------------------------------------------------
+
+class ThumbnailStore:
+    def __init__(self, root, max_bytes, retry_seconds):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.retry_seconds = retry_seconds
+        self._lock = threading.Lock()
+        # Bytes under objects/ at the last scan plus those written since;
+        # None until the first write scans.
+        self._size = None
+
+    def _ref_path(self, key):
+        return os.path.join(self.root, 'refs', key[:2], key)
+
+    def _object_path(self, digest, size, format):
+        return os.path.join(self.root, 'objects', digest[:2], f'{digest}.{size}.{format}')
+
+    def _write(self, path, data):
+        # Atomically, so readers in other processes never see a partial file.
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def lookup(self, key):
+        # The source digest, FAILED while a failed fetch is too recent to
+        # retry, or None.
+        path = self._ref_path(key)
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+            if value == FAILED and time.time() - os.path.getmtime(path) > self.retry_seconds:
+                return None
+        except FileNotFoundError:
+            return None
+        return value
+
+    def open(self, digest, size, format):
+        path = self._object_path(digest, size, format)
+        try:
+            if time.time() - os.path.getmtime(path) > TOUCH_SECONDS:
+                os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, digest, thumbnails):
+        # `thumbnails` maps (size, format) to the encoded bytes.
+        written = 0
+        for (size, format), data in thumbnails.items():
+            self._write(self._object_path(digest, size, format), data)
+            written += len(data)
+        self._write(self._ref_path(key), digest.encode())
+        with self._lock:
+            if self._size is None:
+                self._size = self.usage()
+            else:
+                self._size += written
+            over = self._size > self.max_bytes
+        if over:
+            self.evict()
+
+    def fail(self, key):
+        self._write(self._ref_path(key), FAILED.encode())
+
+    def _objects(self):
+        for root, _, files in os.walk(os.path.join(self.root, 'objects')):
+            for name in files:
+                if not name.startswith('.'):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    yield path, stat.st_size, stat.st_mtime
+
+    def usage(self):
+        return sum(size for _, size, _ in self._objects())
+
+    def evict(self):
+        with self._lock:
+            objects = sorted(self._objects(), key=lambda item: item[2])
+            total = sum(size for _, size, _ in objects)
+            target = self.max_bytes * 0.9
+            for path, size, _ in objects:
+                if total <= target:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+            self._size = total
+        return total
+
+
+#  Fetching
+#  ----------------------------------------------------------------
+
+_executor = None
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def _check_url(url):
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ValueError(f'not an http(s) URL: {url}')
+
+
+def _check_address(host, address, allow_private):
+    if not allow_private and not address.is_global:
+        raise ValueError(f'{host} resolves to non-public address {address}')
+
+
+def _connect(host, port, timeout, source_address, allow_private):
+    # Resolves `host` once, checks every address and connects to one of
+    # those same addresses, so a DNS answer that changes between the check
+    # and the connection cannot point the fetch somewhere else.
+    addresses = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    for info in addresses:
+        _check_address(host, ipaddress.ip_address(info[4][0]), allow_private)
+    error = None
+    for family, type, proto, _, sockaddr in addresses:
+        sock = socket.socket(family, type, proto)
+        try:
+            if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                sock.settimeout(timeout)
+            if source_address:
+                sock.bind(source_address)
+            sock.connect(sockaddr)
+            return sock
+        except OSError as e:
+            sock.close()
+            error = e
+    raise error or OSError(f'{host} did not resolve')
+
+
+class _PinnedHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, host, allow_private, **kwargs):
+        super().__init__(host, **kwargs)
+        self.allow_private = allow_private
+
+    def connect(self):
+        self.sock = _connect(self.host, self.port, self.timeout, self.source_address,
+                             self.allow_private)
+
+
+class _PinnedHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, host, allow_private, **kwargs):
+        super().__init__(host, **kwargs)
+        self.allow_private = allow_private
+
+    def connect(self):
+        sock = _connect(self.host, self.port, self.timeout, self.source_address,
+                        self.allow_private)
+        # The certificate is still checked against the name, not the address.
+        self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+
+
+class _PinnedHTTPHandler(HTTPHandler):
+    def __init__(self, allow_private):
+        super().__init__()
+        self.allow_private = allow_private
+
+    def http_open(self, req):
+        return self.do_open(partial(_PinnedHTTPConnection, allow_private=self.allow_private), req)
+
+
+class _PinnedHTTPSHandler(HTTPSHandler):
+    def __init__(self, allow_private):
+        super().__init__()
+        self.allow_private = allow_private
+
+    def https_open(self, req):
+        return self.do_open(partial(_PinnedHTTPSConnection, allow_private=self.allow_private),
+                            req, context=self._context)
+
+
+class _CheckedRedirects(HTTPRedirectHandler):
+    # urllib would follow a redirect to ftp: too. The new host's addresses
+    # are checked when it is connected to, like the first one's.
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        _check_url(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+def fetch(url, config):
+    _check_url(url)
+    allow_private = config['THUMBNAIL_ALLOW_PRIVATE']
+    limit = config['THUMBNAIL_MAX_SOURCE_BYTES']
+    # No proxies: the addresses checked must be the ones connected to.
+    opener = build_opener(ProxyHandler({}), _PinnedHTTPHandler(allow_private),
+                          _PinnedHTTPSHandler(allow_private), _CheckedRedirects())
+    with opener.open(url, timeout=config['THUMBNAIL_FETCH_TIMEOUT']) as response:
+        data = response.read(limit + 1)
+    if len(data) > limit:
+        raise ValueError(f'{url} is larger than {limit} bytes')
+    return data
+
+
+def render(data):
+    # Every size in every format from one decoded image. Raises on anything
+    # Pillow cannot decode, including images over its pixel limit.
+    with Image.open(io.BytesIO(data)) as source:
+        source.load()
+        image = ImageOps.exif_transpose(source)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+    thumbnails = {}
+    for size, side in SIZES.items():
+        resized = image.copy()
+        resized.thumbnail((side, side), Image.LANCZOS)
+        output = io.BytesIO()
+        resized.save(output, 'WEBP', quality=80, method=4)
+        thumbnails[size, 'webp'] = output.getvalue()
+        output = io.BytesIO()
+        resized.convert('RGB').save(output, 'JPEG', quality=82, optimize=True, progressive=True)
+        thumbnails[size, 'jpeg'] = output.getvalue()
+    return thumbnails
+
+
+def _build(store, key, url, config):
+    try:
+        data = fetch(url, config)
+        store.put(key, hashlib.sha256(data).hexdigest(), render(data))
+    except Exception:
+        logger.warning('Thumbnail fetch failed for %s', url, exc_info=True)
+        store.fail(key)
+    finally:
+        with _pending_lock:
+            _pending.discard(key)
+
+
+def schedule(store, key, url, config):
+    # Queues a fetch unless this process already has one queued for `key`.
+    global _executor
+    with _pending_lock:
+        if key in _pending:
+            return
+        _pending.add(key)
+        # Started on first use, so each forked worker gets its own threads.
+        if _executor is None:
+            _executor = ThreadPoolExecutor(config['THUMBNAIL_FETCH_WORKERS'],
+                                           thread_name_prefix='thumbnails')
+    _executor.submit(_build, store, key, url, config)
+
+
+#  Serving
+#  ----------------------------------------------------------------
+
+def _format():
+    # Only clients that name WebP get it; */* does not count.
+    return 'webp' if 'image/webp' in request.accept_mimetypes.values() else 'jpeg'
+
+
+@images.route('/images/<any(venues, artists):kind>/<int:owner_id>/<any(tile, cover):size>/<key>')
+def thumbnail(kind, owner_id, size, key):
+    store = current_app.extensions.get('thumbnails')
+    if store is None:
+        abort(404)
+    format = _format()
+    digest = store.lookup(key)
+    if digest is not None and digest != FAILED:
+        path = store.open(digest, size, format)
+        if path is not None:
+            response = send_file(path, mimetype=FORMATS[format],
+                                 max_age=current_app.config['THUMBNAIL_MAX_AGE'])
+            response.cache_control.public = True
+            response.vary.add('Accept')
+            return response
+
+    model = OWNERS[kind]
+    src = db.session.execute(select(model.image_link).where(model.id == owner_id)).scalar()
+    if not src or source_key(src) != key:
+        abort(404)
+    if digest != FAILED:
+        schedule(store, key, src, current_app.config)
+    # The browser loads the original this once.
+    response = redirect(src)
+    response.cache_control.no_store = True
+    return response
+
+
+def init_app(app):
+    app.register_blueprint(images)
+    if app.config['THUMBNAILS'] and Image is not None:
+        app.extensions['thumbnails'] = ThumbnailStore(
+            app.config['THUMBNAIL_DIR'], app.config['THUMBNAIL_CACHE_MAX_BYTES'],
+            app.config['THUMBNAIL_RETRY_SECONDS'])
+    app.jinja_env.globals['thumbnail_url'] = thumbnail_url